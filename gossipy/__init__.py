@@ -1,6 +1,11 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Tuple
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import inspect
 import logging
+import os
+import tempfile
+import weakref
 from rich.logging import RichHandler
 import numpy as np
 import torch
@@ -31,6 +36,8 @@ __all__ = ["LOG",
            "Sizeable",
            #"EqualityMixin",
            "Cache",
+           "DeviceResidency",
+           "RESIDENCY",
            "GlobalSettings"]
 
 
@@ -132,6 +139,8 @@ def set_seed(seed=0) -> None:
 
 
 class Sizeable(ABC):
+    __slots__ = ()
+
     def __init__(self):
         """The interface for objects that can be sized.
         
@@ -157,10 +166,20 @@ class Sizeable(ABC):
 
 
 class CacheKey(Sizeable):
-    def __init__(self, *args):
-        """The key for a cache item."""
+    def __init__(self, *args, size: Optional[int] = None):
+        """The key for a cache item.
+
+        Parameters
+        ----------
+        *args
+            The components of the key.
+        size : int, default=None
+            The size of the cached item. If provided, the size of the key (i.e., of the item) is
+            computed without accessing the cache.
+        """
 
         self.key: Tuple[Any, ...] = tuple(args)
+        self.size: Optional[int] = size
     
     def get(self):
         """Returns the value of the cache item.
@@ -175,6 +194,8 @@ class CacheKey(Sizeable):
     
     # docstr-coverage:inherited
     def get_size(self) -> int:
+        if getattr(self, "size", None) is not None:
+            return self.size
         val = CACHE[self]
         if isinstance(val, (float, int, bool)): return 1
         elif isinstance(val, Sizeable): return val.get_size()
@@ -197,14 +218,46 @@ class CacheKey(Sizeable):
         return not (self == other)
 
 
+def _nbytes(obj: Any, seen: Optional[set] = None, depth: int = 0) -> int:
+    # Estimated number of bytes of the tensors/arrays referenced by obj. The optimizers are not
+    # considered since they refer to the parameters of the models.
+    seen = set() if seen is None else seen
+    if id(obj) in seen or depth > 6:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, torch.Tensor):
+        return obj.nelement() * obj.element_size()
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, torch.nn.Module):
+        return sum(_nbytes(t, seen, depth + 1) for t in obj.state_dict(keep_vars=True).values())
+    if isinstance(obj, (list, tuple, set)):
+        return sum(_nbytes(v, seen, depth + 1) for v in obj)
+    if isinstance(obj, dict):
+        return sum(_nbytes(v, seen, depth + 1) for v in obj.values())
+    if isinstance(obj, torch.optim.Optimizer) or isinstance(obj, type):
+        return 0
+    if hasattr(obj, "__dict__"):
+        return _nbytes(vars(obj), seen, depth + 1)
+    return 0
+
+
+# torch.load supports memory-mapped loading from torch 2.1
+_MMAP_LOAD = "mmap" in inspect.signature(torch.load).parameters
+
+
 class CacheItem(Sizeable):
     _value: Any
     _refs: int
+    _nbytes: int
+    _path: Optional[str]
 
     def __init__(self, value: Any):
         """The class of an item in the cache.
 
         The constructor initializes the cache item with the specified value and with a single reference.
+        The value of the item can be spilled to a (memory-mapped) file and it is transparently
+        reloaded when needed.
 
         Parameters
         ----------
@@ -214,6 +267,81 @@ class CacheItem(Sizeable):
 
         self._value = value
         self._refs = 1
+        self._nbytes = _nbytes(value)
+        self._path = None
+        self._pid = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Pickling a spilled item does not rely on the spill file
+        state = self.__dict__.copy()
+        if self._path is not None:
+            state.update(_value=self._load(), _path=None, _pid=None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.__dict__.setdefault("_path", None)
+        self.__dict__.setdefault("_pid", None)
+        if "_nbytes" not in self.__dict__:
+            self._nbytes = _nbytes(self._value)
+
+    def nbytes(self) -> int:
+        """Returns the (estimated) number of bytes of the value of the item.
+
+        Returns
+        -------
+        int
+            The number of bytes of the tensors and arrays in the value.
+        """
+
+        return self._nbytes
+
+    def is_spilled(self) -> bool:
+        """Returns True if the value of the item is stored on disk, False otherwise.
+
+        Returns
+        -------
+        bool
+            Whether the value has been spilled to a file.
+        """
+
+        return self._path is not None
+
+    def spill(self, path: str) -> None:
+        """Moves the value of the item to the specified file.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file.
+        """
+
+        torch.save(self._value, path)
+        self._value = None
+        self._path = path
+        self._pid = os.getpid()
+
+    def _load(self) -> Any:
+        # The tensors are memory-mapped (when supported, i.e., torch >= 2.1), i.e., they are
+        # actually read only when accessed
+        if _MMAP_LOAD:
+            return torch.load(self._path, mmap=True, weights_only=False)
+        return torch.load(self._path)
+
+    def reload(self) -> None:
+        """Reloads the value of a spilled item in memory.
+
+        The spill file is removed, unless it has been created by another process (e.g., the
+        parent of a forked worker).
+        """
+
+        if self._path is None:
+            return
+        self._value = self._load()
+        if self._pid == os.getpid():
+            os.remove(self._path)
+        self._path = None
+        self._pid = None
     
     def add_ref(self) -> None:
         """Adds a reference to the item."""
@@ -230,7 +358,7 @@ class CacheItem(Sizeable):
         """
 
         self._refs -= 1
-        return self._value
+        return self.get()
     
     def is_referenced(self) -> bool:
         """Returns True if the item is referenced, False otherwise.
@@ -245,39 +373,47 @@ class CacheItem(Sizeable):
     
     # docstr-coverage:inherited
     def get_size(self) -> int:
-        if isinstance(self._value, (tuple, list)):
+        value = self.get()
+        if isinstance(value, (tuple, list)):
             sz: int = 0
-            for t in self._value:
+            for t in value:
                 if t is None: continue
                 if isinstance(t, (float, int, bool)): sz += 1
                 elif isinstance(t, Sizeable): sz += t.get_size()
                 else: 
                     LOG.warning("Impossible to compute the size of %s. Set to 0." %t)
             return max(sz, 1)
-        elif isinstance(self._value, Sizeable):
-            return self._value.get_size()
-        elif isinstance(self._value, (float, int, bool)):
+        elif isinstance(value, Sizeable):
+            return value.get_size()
+        elif isinstance(value, (float, int, bool)):
             return 1
         else:
-            LOG.warning("Impossible to compute the size of %s. Set to 0." %self._value)
+            LOG.warning("Impossible to compute the size of %s. Set to 0." %value)
             return 0
     
     def get(self) -> Any:
         """Returns the value.
 
+        The value of a spilled item is read from its file, but the item stays spilled: only the
+        :class:`Cache` moves the items in memory, so that the budget is accounted for.
+
         Returns
         -------
         Any
             The value of the item.
         """
 
+        if self._path is not None:
+            return self._load()
         return self._value
 
     def __repr__(self):
+        if self._path is not None:
+            return "<spilled to %s>" % self._path
         return self._value.__repr__()
     
     def __str__(self) -> str:
-        return f"CacheItem({str(self._value)})"
+        return f"CacheItem({self.__repr__() if self._path is not None else str(self._value)})"
 
 
 class Cache():
@@ -290,9 +426,101 @@ class Cache():
         A cached item (wrapped in :class:`CacheItem`) is kept in the cache until it is not 
         referenced anymore. In such a case, it is automatically deleted from the cache.
         To each item is associated a unique key of type :class:`CacheKey`.
+
+        By default the cache is unbounded. A memory budget can be set with :meth:`set_budget`:
+        when the (estimated) bytes of the items in memory exceed the budget, the least recently
+        used items are spilled to memory-mapped files, and they are transparently reloaded when
+        accessed. The cache keeps track of hits, misses, spills, reloads and of the peak of bytes
+        in memory (see :meth:`get_stats`).
         """
 
-        pass
+        self._max_bytes = None
+        self._spill_dir = None
+        self._tmp_dir = None
+        self._n_files = 0
+        self._resident = OrderedDict()
+        self._bytes = 0
+        self.reset_stats()
+
+    def set_budget(self, max_bytes: Optional[int], spill_dir: Optional[str] = None) -> None:
+        """Sets the memory budget of the cache.
+
+        Parameters
+        ----------
+        max_bytes : int or None
+            The maximum number of bytes of the items kept in memory. If `None`, the cache is
+            unbounded.
+        spill_dir : str, default=None
+            The directory where the items exceeding the budget are spilled. If `None`, a temporary
+            directory is created when needed.
+        """
+
+        assert max_bytes is None or max_bytes >= 0, "max_bytes must be non negative."
+        self._max_bytes = max_bytes
+        self._spill_dir = spill_dir
+        self._enforce_budget()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Returns the counters of the cache.
+
+        Returns
+        -------
+        dict[str, int]
+            The number of ``hits`` (accesses to a cached item), ``misses`` (accesses to a missing
+            item), ``spills`` and ``reloads``, the ``bytes`` currently in memory, their ``peak``
+            and the number of items currently ``spilled``.
+        """
+
+        return dict(self._stats,
+                    bytes=self._bytes,
+                    spilled=len(self._cache) - len(self._resident))
+
+    def reset_stats(self) -> None:
+        """Resets the counters of the cache."""
+
+        self._stats = {"hits": 0, "misses": 0, "spills": 0, "reloads": 0, "peak": self._bytes}
+
+    def _touch(self, key: CacheKey) -> CacheItem:
+        # Access to an item: it is reloaded (if needed) and it becomes the most recently used
+        item = self._cache[key]
+        self._stats["hits"] += 1
+        if item.is_spilled():
+            item.reload()
+            self._stats["reloads"] += 1
+            self._resident[key] = None
+            self._bytes += item.nbytes()
+            self._enforce_budget(key)
+        else:
+            self._resident.move_to_end(key)
+        return item
+
+    def _enforce_budget(self, keep: Optional[CacheKey] = None) -> None:
+        if self._max_bytes is not None:
+            for key in list(self._resident):
+                if self._bytes <= self._max_bytes:
+                    break
+                if key != keep:
+                    self._spill(key)
+        self._stats["peak"] = max(self._stats["peak"], self._bytes)
+
+    def _spill(self, key: CacheKey) -> None:
+        if self._spill_dir is None:
+            self._spill_dir = self._tmp_dir = tempfile.mkdtemp(prefix="gossipy-cache-")
+        os.makedirs(self._spill_dir, exist_ok=True)
+        self._n_files += 1
+        item = self._cache[key]
+        item.spill(os.path.join(self._spill_dir, "%d_%d.pt" %(os.getpid(), self._n_files)))
+        del self._resident[key]
+        self._bytes -= item.nbytes()
+        self._stats["spills"] += 1
+
+    def _remove(self, key: CacheKey) -> None:
+        item = self._cache.pop(key)
+        if key in self._resident:
+            del self._resident[key]
+            self._bytes -= item.nbytes()
+        elif item._pid == os.getpid():
+            os.remove(item._path)
 
     def push(self, key: CacheKey, value: Any):
         """Pushes an item into the cache.
@@ -306,7 +534,11 @@ class Cache():
             being stored in the cache.
         """
         if key not in self._cache:
-            self._cache[key] = CacheItem(value)
+            item = CacheItem(value)
+            self._cache[key] = item
+            self._resident[key] = None
+            self._bytes += item.nbytes()
+            self._enforce_budget(key)
         else:
             self._cache[key].add_ref()
     
@@ -329,21 +561,51 @@ class Cache():
         """
 
         if key not in self._cache:
+            self._stats["misses"] += 1
             return None
-        obj = self._cache[key].del_ref()
+        obj = self._touch(key).del_ref()
         if not self._cache[key].is_referenced():
-            del self._cache[key]
+            self._remove(key)
         return obj
     
+    def release(self, key: CacheKey) -> None:
+        """Deletes a reference to an item without retrieving it.
+
+        This is useful to discard the item referenced by a message that will never be received.
+        As in :meth:`pop`, if the item is not referenced anymore it is deleted from the cache. 
+        Spilled items are not reloaded.
+
+        Parameters
+        ----------
+        key : CacheKey
+            The key associated to the item.
+        """
+
+        if key in self._cache:
+            item = self._cache[key]
+            item._refs -= 1
+            if not item.is_referenced():
+                self._remove(key)
+
     def clear(self):
         """Clears the cache."""
 
+        for key in list(self._cache):
+            self._remove(key)
         self._cache.clear()
+        self._resident.clear()
+        self._bytes = 0
+        if self._tmp_dir is not None and not os.listdir(self._tmp_dir):
+            os.rmdir(self._tmp_dir)
+            if self._spill_dir == self._tmp_dir:
+                self._spill_dir = None
+            self._tmp_dir = None
     
     def __getitem__(self, key: CacheKey):
         if key not in self._cache:
+            self._stats["misses"] += 1
             return None
-        return self._cache[key].get()
+        return self._touch(key).get()
 
     def load(self, cache_dict: Dict[CacheKey, Any]):
         """Loads the cache from a dictionary.
@@ -355,6 +617,10 @@ class Cache():
         """
 
         self._cache = cache_dict
+        self._resident = OrderedDict((k, None) for k, item in cache_dict.items()
+                                     if not item.is_spilled())
+        self._bytes = sum(cache_dict[k].nbytes() for k in self._resident)
+        self._enforce_budget()
     
     def get_cache(self) -> Dict[CacheKey, Any]:
         """Returns the cache.
@@ -385,3 +651,175 @@ If a model is needed by another node, it is retrieved from the cache and only on
 If a model is not referenced anymore, it is automatically removed from the cache.
 The models contained in the cache are a deep copy of the models stored in the nodes.
 """
+
+
+def _move_optimizer(optimizer: torch.optim.Optimizer, device: torch.device) -> None:
+    # Moves the state of the optimizer (e.g., the momentum buffers) to the device. The scalar
+    # tensors (e.g., the step counters) are left where they are.
+    for state in optimizer.state.values():
+        for k, v in state.items():
+            if isinstance(v, torch.Tensor) and v.dim() > 0 and v.device != device:
+                state[k] = v.to(device)
+
+
+class DeviceResidency():
+    def __init__(self, capacity: Optional[int] = 32):
+        """This class keeps a bounded number of models resident on the compute device.
+
+        A model is moved to the device when it is acquired (see :meth:`acquire`), and it stays
+        there until it is evicted, i.e., when more than ``capacity`` models are resident and it
+        is the least recently acquired one. The evicted models are moved back to the cpu. Models
+        are moved in place (together with the state of their optimizer), thus the optimizers
+        stay bound to the parameters. Models (to be) used on the cpu are never tracked, so
+        on cpu-only hosts acquiring a model costs O(1).
+
+        Parameters
+        ----------
+        capacity : int or None, default=32
+            The maximum number of models resident on the device. If `None`, the number is
+            unbounded.
+        """
+
+        self.set_capacity(capacity)
+        self._resident = OrderedDict()
+        self.reset_stats()
+
+    def set_capacity(self, capacity: Optional[int]) -> None:
+        """Sets the maximum number of models resident on the device.
+
+        Parameters
+        ----------
+        capacity : int or None
+            The maximum number of models. If `None`, the number is unbounded.
+        """
+
+        assert capacity is None or capacity >= 1, "capacity must be positive."
+        self._capacity = capacity
+        if hasattr(self, "_resident"):
+            self._enforce_capacity()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Returns the counters of the residency manager.
+
+        Returns
+        -------
+        dict[str, int]
+            The number of ``hits`` (acquisitions of a resident model), ``moves`` (to the device)
+            and ``evictions``, and the number of models currently ``resident``.
+        """
+
+        return dict(self._stats, resident=len(self._resident))
+
+    def reset_stats(self) -> None:
+        """Resets the counters of the residency manager."""
+
+        self._stats = {"hits": 0, "moves": 0, "evictions": 0}
+
+    def acquire(self,
+                model: torch.nn.Module,
+                device: torch.device,
+                optimizer: Optional[torch.optim.Optimizer] = None) -> torch.nn.Module:
+        """Makes the model resident on the device, and the most recently used one.
+
+        A resident model is moved again if it is on another device than the requested one, and
+        it is evicted (i.e., moved back and untracked) when the cpu is requested.
+
+        Parameters
+        ----------
+        model : torch.nn.Module
+            The model.
+        device : torch.device
+            The compute device.
+        optimizer : torch.optim.Optimizer, default=None
+            The optimizer of the model, whose state is moved together with the model.
+
+        Returns
+        -------
+        torch.nn.Module
+            The (same) model.
+        """
+
+        device = torch.device(device)
+        key = id(model)
+        param = next(model.parameters(), None)
+        entry = self._resident.get(key)
+        if entry is not None and entry[0]() is model:
+            if device.type == "cpu":
+                self._evict(key)
+                return model
+            if param is None or (param.device.type == device.type and
+                                 device.index in (None, param.device.index)):
+                self._resident.move_to_end(key)
+                self._stats["hits"] += 1
+                return model
+            # Resident on another device: moved (and tracked again) below
+            del self._resident[key]
+
+        if device.type == "cpu":
+            if param is not None and param.device.type != "cpu":
+                model.to(device)
+                if optimizer is not None:
+                    _move_optimizer(optimizer, device)
+            return model
+
+        model.to(device)
+        if optimizer is not None:
+            _move_optimizer(optimizer, device)
+        self._stats["moves"] += 1
+        self._resident[key] = (weakref.ref(model),
+                               weakref.ref(optimizer) if optimizer is not None else None)
+        self._enforce_capacity()
+        return model
+
+    def release(self, model: torch.nn.Module) -> None:
+        """Moves the model back to the cpu (if it is resident).
+
+        Parameters
+        ----------
+        model : torch.nn.Module
+            The model.
+        """
+
+        entry = self._resident.get(id(model))
+        if entry is not None and entry[0]() is model:
+            self._evict(id(model))
+
+    def clear(self) -> None:
+        """Moves all the resident models back to the cpu and releases the cached device memory."""
+
+        for key in list(self._resident):
+            self._evict(key)
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _evict(self, key: int) -> None:
+        model_ref, optimizer_ref = self._resident.pop(key)
+        model = model_ref()
+        if model is None:
+            return
+        model.to("cpu")
+        optimizer = optimizer_ref() if optimizer_ref is not None else None
+        if optimizer is not None:
+            _move_optimizer(optimizer, torch.device("cpu"))
+        self._stats["evictions"] += 1
+
+    def _enforce_capacity(self) -> None:
+        # Drops the entries of the garbage collected models, then evicts the least recently used
+        for key in [k for k, (ref, _) in self._resident.items() if ref() is None]:
+            del self._resident[key]
+        while self._capacity is not None and len(self._resident) > self._capacity:
+            self._evict(next(iter(self._resident)))
+
+    def __len__(self) -> int:
+        return len(self._resident)
+
+    def __str__(self) -> str:
+        return "DeviceResidency(capacity=%s, resident=%d)" % (self._capacity, len(self._resident))
+
+
+RESIDENCY = DeviceResidency()
+"""The residency manager of the models on the compute device.
+
+Torch model handlers acquire their model (see :meth:`DeviceResidency.acquire`) before training
+or evaluating it, thus the models are moved between the cpu and the device only on eviction.
+"""
@@ -15,6 +15,7 @@ from sklearn.metrics import accuracy_score, roc_auc_score, recall_score, f1_scor
 import os
 from gossipy.attacks.ra.mar import *
 from torchsummary import summary
+from gossipy import RESIDENCY
 
 
 def mia_for_each_nn(simulation, attackerNode):
@@ -208,7 +209,7 @@ def visualize_images(original_img, modified_img):
 
 def evaluate(model, device, data: Tuple[torch.Tensor, torch.Tensor], box=False, noise=True, log=False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     x, y = data
-    model = model.to(device)
+    model = RESIDENCY.acquire(model, device)
     x, y = x.to(device), y.to(device)
 
     losses = []
@@ -240,7 +241,6 @@ def evaluate(model, device, data: Tuple[torch.Tensor, torch.Tensor], box=False,
     losses = np.array(losses)
     preds = np.concatenate(preds) if preds else np.array([])
     labels = np.concatenate(labels) if labels else np.array([])
-    model = model.to("cpu")
     return losses, preds, labels
 
 def compute_consensus_distance(nodes) -> float:
@@ -0,0 +1,320 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple, Union
+import numpy as np
+from numpy.random import random, exponential
+
+# AUTHORSHIP
+__version__ = "0.0.1"
+__author__ = "Mirko Polato"
+__copyright__ = "Copyright 2022, gossipy"
+__license__ = "Apache License, Version 2.0"
+__maintainer__ = "Mirko Polato, PhD"
+__email__ = "mak1788@gmail.com"
+__status__ = "Development"
+#
+
+__all__ = ["ChurnModel",
+           "BernoulliChurn",
+           "SessionChurn",
+           "ExponentialChurn",
+           "AvailabilityTrace",
+           "TraceChurn"]
+
+
+class ChurnModel(ABC):
+    """Abstract class representing the availability (churn) of the nodes.
+
+    The simulator queries the model lazily, i.e., only for the nodes that receive a message in
+    the current timestep, and the queried timesteps never decrease within a simulation.
+    """
+
+    rng: Optional[np.random.Generator] = None
+
+    def reset(self, n_nodes: int) -> None:
+        """Resets the model. It is called at the start of each simulation.
+
+        Parameters
+        ----------
+        n_nodes : int
+            The number of nodes.
+        """
+
+        self.n_nodes = n_nodes
+
+    def set_rng(self, rng: Optional[np.random.Generator]) -> None:
+        """Sets the random number generator of the model. The simulator sets the stream of the
+        current timestep (see :class:`gossipy.simul.GossipSimulator`).
+
+        Parameters
+        ----------
+        rng : np.random.Generator or None
+            The random number generator. If `None`, the global random state is used.
+        """
+
+        self.rng = rng
+
+    def _random(self, size: int) -> np.ndarray:
+        # Uniform random numbers in [0, 1) drawn from the generator of the model (if any)
+        return self.rng.random(size) if self.rng is not None else random(size)
+
+    @abstractmethod
+    def is_online(self, node_ids: np.ndarray, t: int) -> np.ndarray:
+        """Returns whether the specified nodes are online at timestep ``t``.
+
+        Parameters
+        ----------
+        node_ids : np.ndarray
+            The indices of the nodes (without duplicates).
+        t : int
+            The current timestep.
+
+        Returns
+        -------
+        np.ndarray
+            The boolean online status of the nodes.
+        """
+
+        pass
+
+
+class BernoulliChurn(ChurnModel):
+    def __init__(self, online_prob: float = 1.):
+        """Memoryless availability: at each timestep every node is online with probability
+        ``online_prob``, independently of the other timesteps.
+
+        Parameters
+        ----------
+        online_prob : float, default=1.
+            The probability of a node to be online.
+        """
+
+        assert 0 <= online_prob <= 1, "online_prob must be in the range [0,1]."
+        self.online_prob = online_prob
+
+    # docstr-coverage:inherited
+    def is_online(self, node_ids: np.ndarray, t: int) -> np.ndarray:
+        if self.online_prob >= 1:
+            return np.ones(len(node_ids), dtype=bool)
+        return self._random(len(node_ids)) <= self.online_prob
+
+    def __str__(self) -> str:
+        return "BernoulliChurn(online_prob=%g)" % self.online_prob
+
+
+class SessionChurn(ChurnModel):
+    """Abstract class representing an on/off process, i.e., each node alternates online and
+    offline sessions.
+
+    The state of the process is the current status of each node and the time of its next
+    transition. The status of a node is updated only when it is queried, by applying all the
+    transitions that happened in the meantime.
+    """
+
+    # docstr-coverage:inherited
+    def reset(self, n_nodes: int) -> None:
+        super().reset(n_nodes)
+        self._online, self._next = self._initial(n_nodes)
+
+    @abstractmethod
+    def _initial(self, n_nodes: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the initial status of the nodes and the time of their first transition."""
+
+        pass
+
+    @abstractmethod
+    def _advance(self, node_ids: np.ndarray) -> np.ndarray:
+        """Returns the time of the transition following the current one of the nodes, whose
+        status has just been flipped."""
+
+        pass
+
+    # docstr-coverage:inherited
+    def is_online(self, node_ids: np.ndarray, t: int) -> np.ndarray:
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        due = node_ids[self._next[node_ids] <= t]
+        while len(due):
+            self._online[due] = ~self._online[due]
+            self._next[due] = self._advance(due)
+            due = due[self._next[due] <= t]
+        return self._online[node_ids]
+
+
+class ExponentialChurn(SessionChurn):
+    def __init__(self, mean_online: float, mean_offline: float):
+        """On/off process with exponentially distributed session lengths.
+
+        The process starts in its stationary regime, i.e., each node is initially online with
+        probability ``mean_online / (mean_online + mean_offline)``.
+
+        Parameters
+        ----------
+        mean_online : float
+            The mean length (in timesteps) of the online sessions.
+        mean_offline : float
+            The mean length (in timesteps) of the offline sessions.
+        """
+
+        assert mean_online > 0 and mean_offline > 0, "The session lengths must be positive."
+        self.mean_online = mean_online
+        self.mean_offline = mean_offline
+
+    def _initial(self, n_nodes: int) -> Tuple[np.ndarray, np.ndarray]:
+        online = self._random(n_nodes) < self.mean_online / (self.mean_online + self.mean_offline)
+        return online, self._session(online)
+
+    def _session(self, online: np.ndarray) -> np.ndarray:
+        scale = np.where(online, self.mean_online, self.mean_offline)
+        return self.rng.exponential(scale) if self.rng is not None else exponential(scale)
+
+    def _advance(self, node_ids: np.ndarray) -> np.ndarray:
+        return self._next[node_ids] + self._session(self._online[node_ids])
+
+    def __str__(self) -> str:
+        return "ExponentialChurn(mean_online=%g, mean_offline=%g)" % \
+            (self.mean_online, self.mean_offline)
+
+
+class AvailabilityTrace():
+    def __init__(self, initial: np.ndarray, indptr: np.ndarray, times: np.ndarray):
+        """Recorded availability of a set of nodes.
+
+        The trace is stored in a compressed sparse row layout: the (sorted) times at which the
+        status of node ``i`` flips are ``times[indptr[i]:indptr[i+1]]``, and ``initial[i]`` is
+        its status before the first flip.
+
+        Parameters
+        ----------
+        initial : np.ndarray
+            The initial boolean status of the nodes.
+        indptr : np.ndarray
+            The offsets of the transitions of each node (``n_nodes + 1`` entries).
+        times : np.ndarray
+            The transition times.
+        """
+
+        self.initial = np.asarray(initial, dtype=bool)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.times = np.asarray(times)
+        assert len(self.indptr) == len(self.initial) + 1 and self.indptr[-1] == len(self.times), \
+            "Inconsistent trace."
+
+    @property
+    def n_nodes(self) -> int:
+        """The number of nodes of the trace."""
+
+        return len(self.initial)
+
+    @classmethod
+    def record(cls, churn: SessionChurn, n_nodes: int, horizon: int) -> AvailabilityTrace:
+        """Records the transitions of ``churn`` up to ``horizon`` (excluded).
+
+        The model is reset before and after the recording.
+
+        Parameters
+        ----------
+        churn : SessionChurn
+            The model to record.
+        n_nodes : int
+            The number of nodes.
+        horizon : int
+            The length (in timesteps) of the trace.
+
+        Returns
+        -------
+        AvailabilityTrace
+            The recorded trace.
+        """
+
+        churn.reset(n_nodes)
+        initial = churn._online.copy()
+        nodes, times = [], []
+        due = np.flatnonzero(churn._next < horizon)
+        while len(due):
+            nodes.append(due)
+            times.append(churn._next[due].copy())
+            churn._online[due] = ~churn._online[due]
+            churn._next[due] = churn._advance(due)
+            due = due[churn._next[due] < horizon]
+        churn.reset(n_nodes)
+
+        nodes = np.concatenate(nodes) if nodes else np.zeros(0, dtype=np.int64)
+        times = np.concatenate(times) if times else np.zeros(0)
+        order = np.lexsort((times, nodes))
+        indptr = np.r_[0, np.cumsum(np.bincount(nodes, minlength=n_nodes))]
+        return cls(initial, indptr, times[order])
+
+    def save(self, path: str) -> None:
+        """Saves the trace into a compressed binary (``.npz``) file.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file.
+        """
+
+        np.savez_compressed(path,
+                            initial=np.packbits(self.initial),
+                            n_nodes=self.n_nodes,
+                            indptr=self.indptr,
+                            times=self.times)
+
+    @classmethod
+    def load(cls, path: str) -> AvailabilityTrace:
+        """Loads a trace saved with :meth:`save`.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file.
+
+        Returns
+        -------
+        AvailabilityTrace
+            The loaded trace.
+        """
+
+        with np.load(path) as data:
+            n_nodes = int(data["n_nodes"])
+            initial = np.unpackbits(data["initial"], count=n_nodes).astype(bool)
+            return cls(initial, data["indptr"], data["times"])
+
+
+class TraceChurn(SessionChurn):
+    def __init__(self, trace: Union[AvailabilityTrace, str]):
+        """Replays a recorded availability trace.
+
+        Nodes after the last transition of their trace keep their last status.
+
+        Parameters
+        ----------
+        trace : AvailabilityTrace or str
+            The trace or the path of the file containing it (see :meth:`AvailabilityTrace.save`).
+        """
+
+        self.trace = trace if isinstance(trace, AvailabilityTrace) else AvailabilityTrace.load(trace)
+
+    # docstr-coverage:inherited
+    def reset(self, n_nodes: int) -> None:
+        assert n_nodes <= self.trace.n_nodes, \
+            "The trace contains only %d nodes." % self.trace.n_nodes
+        super().reset(n_nodes)
+
+    def _initial(self, n_nodes: int) -> Tuple[np.ndarray, np.ndarray]:
+        self._pos = self.trace.indptr[:n_nodes].copy()
+        return self.trace.initial[:n_nodes].copy(), self._time_at(np.arange(n_nodes))
+
+    def _time_at(self, node_ids: np.ndarray) -> np.ndarray:
+        pos = self._pos[node_ids]
+        valid = pos < self.trace.indptr[node_ids + 1]
+        times = np.full(len(node_ids), np.inf)
+        times[valid] = self.trace.times[pos[valid]]
+        return times
+
+    def _advance(self, node_ids: np.ndarray) -> np.ndarray:
+        self._pos[node_ids] += 1
+        return self._time_at(node_ids)
+
+    def __str__(self) -> str:
+        return "TraceChurn(n_nodes=%d, transitions=%d)" % \
+            (self.trace.n_nodes, len(self.trace.times))
@@ -0,0 +1,516 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+import copy
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import torch
+
+from . import LOG, Sizeable
+from .model.handler import ModelPayload
+
+# AUTHORSHIP
+__version__ = "0.0.1"
+__author__ = "Mirko Polato"
+__copyright__ = "Copyright 2022, gossipy"
+__license__ = "Apache License, Version 2.0"
+__maintainer__ = "Mirko Polato, PhD"
+__email__ = "mak1788@gmail.com"
+__status__ = "Development"
+#
+
+__all__ = ["Encoding",
+           "DenseEncoding",
+           "QuantizedEncoding",
+           "SparseEncoding",
+           "Compressor",
+           "CastCompressor",
+           "Int8Compressor",
+           "TopKCompressor",
+           "RandomKCompressor",
+           "CompressedPayload",
+           "Compression"]
+
+
+class Encoding(Sizeable):
+    """Abstract class representing an encoded (flat) tensor.
+
+    The size of an encoding is the number of bytes needed to transmit it.
+    """
+
+    @abstractmethod
+    def decode(self) -> torch.Tensor:
+        """Decodes the tensor.
+
+        Returns
+        -------
+        torch.Tensor
+            The decoded (float32) tensor.
+        """
+
+        pass
+
+
+class DenseEncoding(Encoding):
+    def __init__(self, values: torch.Tensor):
+        """All the values of the tensor, possibly cast to a narrower floating point type.
+
+        Parameters
+        ----------
+        values : torch.Tensor
+            The values.
+        """
+
+        self.values = values
+
+    # docstr-coverage:inherited
+    def decode(self) -> torch.Tensor:
+        return self.values.float()
+
+    # docstr-coverage:inherited
+    def get_size(self) -> int:
+        return self.values.nelement() * self.values.element_size()
+
+
+class QuantizedEncoding(Encoding):
+    def __init__(self, q: torch.Tensor, scales: torch.Tensor, sections: List[int]):
+        """Symmetric int8 quantization with a (float32) scale for each section of the tensor.
+
+        Parameters
+        ----------
+        q : torch.Tensor
+            The quantized (int8) values.
+        scales : torch.Tensor
+            The scale of each section.
+        sections : list[int]
+            The number of values of each section.
+        """
+
+        self.q = q
+        self.scales = scales
+        self.sections = sections
+
+    # docstr-coverage:inherited
+    def decode(self) -> torch.Tensor:
+        scales = torch.repeat_interleave(self.scales, torch.as_tensor(self.sections))
+        return self.q.float() * scales
+
+    # docstr-coverage:inherited
+    def get_size(self) -> int:
+        return self.q.nelement() + 4 * self.scales.nelement()
+
+
+class SparseEncoding(Encoding):
+    def __init__(self,
+                 values: torch.Tensor,
+                 numel: int,
+                 indices: Optional[torch.Tensor] = None,
+                 seed: Optional[int] = None):
+        """A subset of the values of the tensor, the other values being zero.
+
+        The positions of the values are either sent explicitly (``indices``) or generated from
+        a ``seed`` shared by the sender and the receiver, in which case only the seed is sent.
+
+        Parameters
+        ----------
+        values : torch.Tensor
+            The selected values.
+        numel : int
+            The number of elements of the tensor.
+        indices : torch.Tensor, default=None
+            The (int32) positions of the values.
+        seed : int, default=None
+            The seed of the positions, used if ``indices`` is `None`.
+        """
+
+        assert indices is not None or seed is not None, "Either indices or seed must be given."
+        self.values = values
+        self.numel = numel
+        self.indices = indices
+        self.seed = seed
+
+    @staticmethod
+    def random_indices(numel: int, k: int, seed: int) -> torch.Tensor:
+        """Returns ``k`` random positions (without repetitions) out of ``numel``.
+
+        Parameters
+        ----------
+        numel : int
+            The number of elements of the tensor.
+        k : int
+            The number of positions.
+        seed : int
+            The seed of the positions.
+
+        Returns
+        -------
+        torch.Tensor
+            The positions.
+        """
+
+        return torch.randperm(numel, generator=torch.Generator().manual_seed(seed))[:k]
+
+    # docstr-coverage:inherited
+    def decode(self) -> torch.Tensor:
+        indices = self.indices if self.indices is not None else \
+            self.random_indices(self.numel, len(self.values), self.seed)
+        dense = torch.zeros(self.numel)
+        dense[indices.long()] = self.values.float()
+        return dense
+
+    # docstr-coverage:inherited
+    def get_size(self) -> int:
+        index_bytes = self.indices.nelement() * self.indices.element_size() \
+            if self.indices is not None else 8
+        return self.values.nelement() * self.values.element_size() + index_bytes
+
+
+class Compressor(ABC):
+    """Abstract class representing a lossy compressor of (flat) tensors."""
+
+    sparse: bool = False
+    """Whether the encodings are sparse, i.e., they are only meaningful as differences."""
+
+    @abstractmethod
+    def compress(self, values: torch.Tensor, sections: List[int], seed: int) -> Encoding:
+        """Encodes the tensor.
+
+        Parameters
+        ----------
+        values : torch.Tensor
+            The (flat) tensor.
+        sections : list[int]
+            The number of values of each original tensor in the flat tensor.
+        seed : int
+            A seed unique to the message, used by randomized compressors.
+
+        Returns
+        -------
+        Encoding
+            The encoded tensor.
+        """
+
+        pass
+
+
+class CastCompressor(Compressor):
+    def __init__(self, dtype: torch.dtype = torch.float16):
+        """Casts the values to a narrower floating point type, e.g., ``torch.float16`` or
+        ``torch.bfloat16``. With ``torch.float32`` the values are sent as they are, which is
+        useful to account the messages in bytes without compressing them.
+
+        Parameters
+        ----------
+        dtype : torch.dtype, default=torch.float16
+            The floating point type.
+        """
+
+        assert dtype.is_floating_point, "dtype must be a floating point type."
+        self.dtype = dtype
+
+    # docstr-coverage:inherited
+    def compress(self, values: torch.Tensor, sections: List[int], seed: int) -> Encoding:
+        return DenseEncoding(values.to(self.dtype))
+
+    def __str__(self) -> str:
+        return "CastCompressor(dtype=%s)" % self.dtype
+
+
+class Int8Compressor(Compressor):
+    """Symmetric int8 quantization with one scale for each tensor of the model."""
+
+    # docstr-coverage:inherited
+    def compress(self, values: torch.Tensor, sections: List[int], seed: int) -> Encoding:
+        values = values.float()
+        parts = values.split(sections)
+        scales = torch.stack([p.abs().max() if p.numel() else values.new_zeros(())
+                              for p in parts]) / 127
+        scales[scales == 0] = 1.
+        q = torch.round(values / torch.repeat_interleave(scales, torch.as_tensor(sections)))
+        return QuantizedEncoding(q.clamp_(-127, 127).to(torch.int8), scales, sections)
+
+    def __str__(self) -> str:
+        return "Int8Compressor()"
+
+
+class TopKCompressor(Compressor):
+    sparse: bool = True
+
+    def __init__(self, ratio: float):
+        """Sends the fraction ``ratio`` of the values with the largest magnitude.
+
+        Parameters
+        ----------
+        ratio : float
+            The fraction of values to send, in the range (0, 1].
+        """
+
+        assert 0 < ratio <= 1, "ratio must be in the range (0, 1]."
+        self.ratio = ratio
+
+    # docstr-coverage:inherited
+    def compress(self, values: torch.Tensor, sections: List[int], seed: int) -> Encoding:
+        k = max(1, int(round(self.ratio * values.numel())))
+        indices = torch.topk(values.abs(), k, sorted=False).indices
+        return SparseEncoding(values[indices], values.numel(), indices=indices.to(torch.int32))
+
+    def __str__(self) -> str:
+        return "TopKCompressor(ratio=%g)" % self.ratio
+
+
+class RandomKCompressor(Compressor):
+    sparse: bool = True
+
+    def __init__(self, ratio: float):
+        """Sends the fraction ``ratio`` of the values, chosen uniformly at random. The positions
+        are generated from a seed, thus they are not sent.
+
+        Parameters
+        ----------
+        ratio : float
+            The fraction of values to send, in the range (0, 1].
+        """
+
+        assert 0 < ratio <= 1, "ratio must be in the range (0, 1]."
+        self.ratio = ratio
+
+    # docstr-coverage:inherited
+    def compress(self, values: torch.Tensor, sections: List[int], seed: int) -> Encoding:
+        k = max(1, int(round(self.ratio * values.numel())))
+        indices = SparseEncoding.random_indices(values.numel(), k, seed)
+        return SparseEncoding(values[indices], values.numel(), seed=seed)
+
+    def __str__(self) -> str:
+        return "RandomKCompressor(ratio=%g)" % self.ratio
+
+
+class CompressedPayload(Sizeable):
+    def __init__(self,
+                 payload: ModelPayload,
+                 encoding: Encoding,
+                 owner: int,
+                 seq: int,
+                 delta: bool,
+                 keep: bool):
+        """A compressed model payload (see :class:`gossipy.model.handler.ModelPayload`).
+
+        Only the flat tensor of the payload is compressed, the remaining buffers are sent as
+        they are. The size of the compressed payload is expressed in bytes.
+
+        Parameters
+        ----------
+        payload : ModelPayload
+            The payload, whose flat tensor is replaced by the encoding.
+        encoding : Encoding
+            The encoded flat tensor, or its difference w.r.t. the reference of the receiver.
+        owner : int
+            The index of the sender.
+        seq : int
+            The sequence number of the message among those sent by ``owner`` to the receiver.
+        delta : bool
+            Whether the encoding is a difference w.r.t. the reference of the receiver, i.e., the
+            model decoded from the previous message of ``owner``.
+        keep : bool
+            Whether the receiver keeps the decoded model as reference for the next message.
+        """
+
+        self.encoding = encoding
+        self.buffers = payload.buffers
+        self.n_updates = payload.n_updates
+        self.arch = payload.arch
+        self.sections = payload.sections
+        self._size = payload.get_size()
+        self.owner = owner
+        self.seq = seq
+        self.delta = delta
+        self.keep = keep
+
+    def decompress(self,
+                   references: Dict[int, Tuple[torch.Tensor, int, Dict[int, torch.Tensor]]]
+                   ) -> Optional[ModelPayload]:
+        """Decompresses the payload.
+
+        A difference whose previous message from ``owner`` has not been decoded yet (e.g.,
+        because it is delayed, or it failed) is kept aside and applied to the reference as soon
+        as the missing message arrives, so that the reference stays in sync with the sender.
+        A full message always resynchronizes the reference.
+
+        Parameters
+        ----------
+        references : dict[int, tuple[torch.Tensor, int, dict[int, torch.Tensor]]]
+            The references of the receiver, i.e., for each sender, the last decoded flat tensor,
+            the sequence number of its message and the differences received out of order. The
+            reference of ``owner`` is updated.
+
+        Returns
+        -------
+        ModelPayload or None
+            The payload, or `None` if it is a difference w.r.t. a message that has not been
+            received (yet).
+        """
+
+        values = self.encoding.decode()
+        if not self.keep:
+            return ModelPayload(values, self.buffers, self.n_updates, self.arch, self._size,
+                                self.sections)
+
+        ref, seq, pending = references.get(self.owner, (None, -1, {}))
+        if self.seq <= seq:
+            # Older than the reference, e.g., a message overtaken by a full one
+            if self.delta:
+                LOG.warning("Compressed payload of node %d discarded: outdated.", self.owner)
+                return None
+            return ModelPayload(values, self.buffers, self.n_updates, self.arch, self._size,
+                                self.sections)
+
+        if self.delta:
+            if seq != self.seq - 1:
+                pending[self.seq] = values
+                references[self.owner] = (ref, seq, pending)
+                LOG.warning("Compressed payload of node %d discarded: missing reference.",
+                            self.owner)
+                return None
+            values = ref + values
+
+        ref, seq = values, self.seq
+        pending = {k: v for k, v in pending.items() if k > seq}
+        while seq + 1 in pending:
+            seq += 1
+            ref = ref + pending.pop(seq)
+        references[self.owner] = (ref, seq, pending)
+        return ModelPayload(values, self.buffers, self.n_updates, self.arch, self._size,
+                            self.sections)
+
+    # docstr-coverage:inherited
+    def get_size(self) -> int:
+        return self.encoding.get_size() + \
+            sum(t.nelement() * t.element_size() for _, t in self.buffers)
+
+    def __repr__(self) -> str:
+        return str(self)
+
+    def __str__(self) -> str:
+        return f"CompressedPayload(owner={self.owner}, seq={self.seq}, delta={self.delta}, " \
+               f"bytes={self.get_size()})"
+
+
+class Compression():
+    def __init__(self,
+                 compressor: Compressor,
+                 delta: Optional[bool] = None,
+                 error_feedback: bool = True,
+                 refresh: int = 0):
+        """The compression stage of a node, i.e., how the models sent by the node are compressed
+        (see :meth:`gossipy.node.GossipNode.set_compression`).
+
+        With delta encoding, the node sends to each peer the (compressed) difference between the
+        model and a reference, and the first message to each peer (or every ``refresh``
+        messages) is a full one. With error feedback the reference is the model decoded by the
+        peer, otherwise it is the last model sent to the peer, thus the compression errors are
+        lost. Without delta encoding, error feedback adds to each message the compression error
+        of the previous message sent to the same peer.
+
+        A delta message whose previous message has not been received is discarded by the peer
+        (see :meth:`CompressedPayload.decompress`). When a message fails (e.g., it is dropped,
+        or the peer is offline), the node is notified (see
+        :meth:`gossipy.node.GossipNode.discarded`) and the next message to that peer is a full
+        one (see :meth:`resync`), thus the stream recovers also with ``refresh=0``.
+
+        Parameters
+        ----------
+        compressor : Compressor
+            The compressor.
+        delta : bool, default=None
+            Whether to use delta encoding. If `None`, delta encoding is used with sparse
+            compressors, which require it.
+        error_feedback : bool, default=True
+            Whether to use error feedback.
+        refresh : int, default=0
+            With delta encoding, every ``refresh`` messages to a peer a full message is sent.
+            If 0, only the first message to each peer is a full one.
+        """
+
+        delta = compressor.sparse if delta is None else delta
+        assert delta or not compressor.sparse, "Sparse compressors require delta encoding."
+        assert refresh >= 0, "refresh must be non negative."
+        self.compressor = compressor
+        self.delta = delta
+        self.error_feedback = error_feedback
+        self.refresh = refresh
+        self.reset()
+
+    def reset(self) -> None:
+        """Resets the state of the stage, i.e., the references and the errors of each peer."""
+
+        self._seq: Dict[int, int] = {}
+        self._state: Dict[int, torch.Tensor] = {}
+
+    def resync(self, peer: int) -> None:
+        """Makes the next message to ``peer`` a full one, e.g., because a previous message to the
+        peer failed and the peer cannot decode the following differences.
+
+        Parameters
+        ----------
+        peer : int
+            The index of the receiver.
+        """
+
+        if self.delta:
+            self._state.pop(peer, None)
+
+    def compress(self, payload: ModelPayload, owner: int, peer: int) -> CompressedPayload:
+        """Compresses the payload sent by ``owner`` to ``peer``.
+
+        Parameters
+        ----------
+        payload : ModelPayload
+            The payload.
+        owner : int
+            The index of the sender.
+        peer : int
+            The index of the receiver.
+
+        Returns
+        -------
+        CompressedPayload
+            The compressed payload.
+        """
+
+        seq = self._seq.get(peer, -1) + 1
+        self._seq[peer] = seq
+        seed = int(np.random.SeedSequence((owner, peer, seq)).generate_state(1, np.uint64)[0] >>
+                   np.uint64(1))
+        x = payload.flat.float()
+        state = self._state.get(peer)
+
+        if self.delta:
+            if state is None or (self.refresh and seq % self.refresh == 0):
+                full = self.compressor if not self.compressor.sparse else CastCompressor(torch.float32)
+                encoding = full.compress(x, payload.sections, seed)
+                self._state[peer] = encoding.decode() if self.error_feedback else x
+                return CompressedPayload(payload, encoding, owner, seq, False, True)
+            encoding = self.compressor.compress(x - state, payload.sections, seed)
+            self._state[peer] = state + encoding.decode() if self.error_feedback else x
+            return CompressedPayload(payload, encoding, owner, seq, True, True)
+
+        target = x + state if self.error_feedback and state is not None else x
+        encoding = self.compressor.compress(target, payload.sections, seed)
+        if self.error_feedback:
+            self._state[peer] = target - encoding.decode()
+        return CompressedPayload(payload, encoding, owner, seq, False, False)
+
+    def copy(self) -> Compression:
+        """Returns a copy of the stage with an empty state.
+
+        Returns
+        -------
+        Compression
+            The copy.
+        """
+
+        stage = copy.copy(self)
+        stage.reset()
+        return stage
+
+    def __str__(self) -> str:
+        return "Compression(compressor=%s, delta=%s, error_feedback=%s, refresh=%d)" % \
+            (self.compressor, self.delta, self.error_feedback, self.refresh)
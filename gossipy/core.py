@@ -1,10 +1,9 @@
 from abc import ABC, abstractmethod
-from typing import Any, List, Optional, Tuple, Union, Dict
+from typing import Any, List, Optional, Sequence, Tuple, Union, Dict
 from collections import defaultdict
 from enum import Enum
 import numpy as np
-from scipy.sparse import csr_matrix
-from random import choice, sample, shuffle
+from scipy.sparse import csr_matrix, diags, identity
 import math
 
 from . import Sizeable
@@ -23,9 +22,13 @@ __all__ = ["CreateModelMode",
            "AntiEntropyProtocol",
            "MessageType",
            "Message",
+           "MessageLog",
+           "CommunicationTrace",
            "Delay",
            "UniformDelay",
            "LinearDelay",
+           "LinkDelay",
+           "ContentionDelay",
            "P2PNetwork",
            "StaticP2PNetwork",
            "UniformDynamicP2PNetwork"]
@@ -85,12 +88,15 @@ class MessageType(Enum):
 
 
 class Message(Sizeable):
+    __slots__ = ("timestamp", "sender", "receiver", "type", "value", "_size")
+
     def __init__(self,
                  timestamp: int,
                  sender: int,
                  receiver: int,
                  type: MessageType,
-                 value: Tuple[Any, ...]):
+                 value: Tuple[Any, ...],
+                 size: Optional[int] = None):
         """A class representing a message.
 
         Parameters
@@ -107,6 +113,9 @@ class Message(Sizeable):
         value : tuple[Any, ...] or None
             The message's payload. The typical payload is a single item tuple containing the model
             (handler). If the value is None, the message represents an ACK.
+        size : int, default=None
+            The size of the message. If `None`, it is computed (once) when first requested
+            (see :meth:`get_size`).
         """
 
         self.timestamp: int = timestamp
@@ -114,12 +123,14 @@ class Message(Sizeable):
         self.receiver: int = receiver
         self.type: MessageType = type
         self.value: Tuple[Any, ...] = value
+        self._size: Optional[int] = size
 
     def get_size(self) -> int:
         """Computes and returns the estimated size of the message.
 
         The size is expressed in number of "atomic" values stored in the message.
-        Atomic values are integers, floats, and booleans. 
+        Atomic values are integers, floats, and booleans. The size is computed only once, then
+        it is memoized in the message.
         
         Note
         ----
@@ -136,6 +147,11 @@ class Message(Sizeable):
             If the message's payload contains values that are not atomic.
         """
 
+        if self._size is None:
+            self._size = self._compute_size()
+        return self._size
+
+    def _compute_size(self) -> int:
         if self.value is None: return 1
         if isinstance(self.value, (tuple, list)):
             sz: int = 0
@@ -164,12 +180,285 @@ class Message(Sizeable):
         return s
 
 
+class MessageLog():
+    _COLUMNS = {"timestamp": np.int64,
+                "sender": np.int32,
+                "receiver": np.int32,
+                "type": np.int8,
+                "size": np.int64,
+                "failed": np.bool_}
+
+    def __init__(self, capacity: int = 1024):
+        """A columnar (struct-of-arrays) log of message events.
+
+        Each event is stored as a row of NumPy arrays, i.e., timestamp, sender, receiver, type
+        (the value of the :class:`MessageType`), size, and whether the message failed. No reference
+        to the :class:`Message` objects is kept, and the traffic statistics are computed with
+        vectorized operations. Events whose message is unknown have sender, receiver and type
+        equal to -1.
+
+        Parameters
+        ----------
+        capacity : int, default=1024
+            The initial number of rows. The arrays are doubled when full.
+        """
+
+        assert capacity > 0, "capacity must be positive."
+        self._n = 0
+        self._cols = {c: np.empty(capacity, dtype=dt) for c, dt in self._COLUMNS.items()}
+
+    def append(self, msg: Optional[Message], failed: bool = False) -> None:
+        """Appends a message event to the log.
+
+        Parameters
+        ----------
+        msg : Message or None
+            The message. If `None`, only the outcome of the event is logged.
+        failed : bool, default=False
+            Whether the message failed.
+        """
+
+        if self._n == len(self._cols["timestamp"]):
+            for c, col in self._cols.items():
+                self._cols[c] = np.concatenate([col, np.empty_like(col)])
+        row = (-1, -1, -1, -1, 0) if msg is None else \
+              (msg.timestamp, msg.sender, msg.receiver, msg.type.value,
+               0 if failed else msg.get_size())
+        for c, v in zip(self._COLUMNS, row + (failed,)):
+            self._cols[c][self._n] = v
+        self._n += 1
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self._cols[column][:self._n]
+
+    def clear(self) -> None:
+        """Removes all the events from the log."""
+
+        self._n = 0
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        """Returns the columns of the log.
+
+        Returns
+        -------
+        dict[str, np.ndarray]
+            The (views of the) arrays of the columns, keyed by their names.
+        """
+
+        return {c: self[c] for c in self._COLUMNS}
+
+    def traffic(self, by: str = "sender", n_nodes: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Computes the number of sent messages and their total size for each node.
+
+        Parameters
+        ----------
+        by : {"sender", "receiver"}, default="sender"
+            Whether the traffic is aggregated by sender or by receiver.
+        n_nodes : int, default=None
+            The number of nodes. If `None`, it is inferred from the log.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The number of sent messages and their total size, indexed by node.
+        """
+
+        assert by in {"sender", "receiver"}, "by must be either 'sender' or 'receiver'."
+        sent = ~self["failed"] & (self[by] >= 0)
+        nodes = self[by][sent]
+        n_nodes = n_nodes if n_nodes is not None else (nodes.max() + 1 if len(nodes) else 0)
+        return (np.bincount(nodes, minlength=n_nodes),
+                np.bincount(nodes, weights=self["size"][sent], minlength=n_nodes).astype(np.int64))
+
+    def per_timestep(self, horizon: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Computes the number of sent and failed messages for each timestep.
+
+        Parameters
+        ----------
+        horizon : int, default=None
+            The number of timesteps. If `None`, it is inferred from the log.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The number of sent and failed messages, indexed by timestep (of sending).
+        """
+
+        known = self["timestamp"] >= 0
+        ts, failed = self["timestamp"][known], self["failed"][known]
+        horizon = horizon if horizon is not None else (ts.max() + 1 if len(ts) else 0)
+        return (np.bincount(ts[~failed], minlength=horizon),
+                np.bincount(ts[failed], minlength=horizon))
+
+    def __repr__(self) -> str:
+        return str(self)
+
+    def __str__(self) -> str:
+        return "MessageLog(events=%d)" %self._n
+
+
+class CommunicationTrace():
+    _COLUMNS = {"send_t": np.int32,
+                "deliver_t": np.int32,
+                "reply_t": np.int32,
+                "sender": np.int32,
+                "receiver": np.int32,
+                "protocol": np.int8}
+
+    NOT_RECEIVED = -1
+    """Value of ``deliver_t`` and ``reply_t`` of the messages that have not been received."""
+
+    NO_REPLY = -2
+    """Value of ``reply_t`` of the messages without a reply."""
+
+    IN_FLIGHT = -3
+    """Value of ``deliver_t`` and ``reply_t`` of the messages still in flight at the end of the
+    simulation."""
+
+    def __init__(self, n_nodes: int, capacity: int = 1024):
+        """The communication trace of a simulation, i.e., the schedule of its messages.
+
+        Each sent message is stored as a row of NumPy arrays (in sending order): the timestep
+        in which it is sent (``send_t``), the timestep in which it is received (``deliver_t``),
+        the timestep in which its reply (if any) is received (``reply_t``), the sender, the
+        receiver and the protocol (the value of the :class:`AntiEntropyProtocol`). Messages that
+        are dropped or that find the receiver offline are not received.
+
+        Parameters
+        ----------
+        n_nodes : int
+            The number of nodes of the simulation.
+        capacity : int, default=1024
+            The initial number of rows. The arrays are doubled when full.
+        """
+
+        assert capacity > 0, "capacity must be positive."
+        self.n_nodes = n_nodes
+        self.horizon = 0
+        self._n = 0
+        self._cols = {c: np.empty(capacity, dtype=dt) for c, dt in self._COLUMNS.items()}
+
+    def append(self, t: int, sender: int, receiver: int, protocol: AntiEntropyProtocol) -> int:
+        """Appends a sent message to the trace. The message is not received until
+        :meth:`set_received` is called.
+
+        Parameters
+        ----------
+        t : int
+            The timestep in which the message is sent.
+        sender : int
+            The index of the sender.
+        receiver : int
+            The index of the receiver.
+        protocol : AntiEntropyProtocol
+            The protocol used to send the message.
+
+        Returns
+        -------
+        int
+            The index of the row of the message.
+        """
+
+        if self._n == len(self._cols["send_t"]):
+            for c, col in self._cols.items():
+                self._cols[c] = np.concatenate([col, np.empty_like(col)])
+        row = (t, self.NOT_RECEIVED, self.NO_REPLY, sender, receiver, protocol.value)
+        for c, v in zip(self._COLUMNS, row):
+            self._cols[c][self._n] = v
+        self.horizon = max(self.horizon, t + 1)
+        self._n += 1
+        return self._n - 1
+
+    def set_received(self, idx: int, t: int, reply: bool = False) -> None:
+        """Sets the timestep in which a message (or its reply) is received.
+
+        Parameters
+        ----------
+        idx : int
+            The index of the row of the message.
+        t : int
+            The timestep in which the message (or its reply) is received, or
+            :attr:`IN_FLIGHT` if it is still in flight at the end of the simulation.
+        reply : bool, default=False
+            Whether the reply of the message is received, rather than the message itself.
+        """
+
+        self._cols["reply_t" if reply else "deliver_t"][idx] = t
+        self.horizon = max(self.horizon, t + 1)
+
+    def set_replied(self, idx: int) -> None:
+        """Sets that the message has a reply, that is not received until :meth:`set_received`
+        is called.
+
+        Parameters
+        ----------
+        idx : int
+            The index of the row of the message.
+        """
+
+        self._cols["reply_t"][idx] = self.NOT_RECEIVED
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self._cols[column][:self._n]
+
+    def save(self, path: str) -> None:
+        """Saves the trace into a compressed binary (``.npz``) file.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file.
+        """
+
+        np.savez_compressed(path, n_nodes=self.n_nodes, horizon=self.horizon,
+                            **{c: self[c] for c in self._COLUMNS})
+
+    @classmethod
+    def load(cls, path: str) -> "CommunicationTrace":
+        """Loads a trace saved with :meth:`save`.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file.
+
+        Returns
+        -------
+        CommunicationTrace
+            The loaded trace.
+        """
+
+        with np.load(path) as data:
+            n = len(data["send_t"])
+            trace = cls(int(data["n_nodes"]), max(n, 1))
+            for c in cls._COLUMNS:
+                trace._cols[c][:n] = data[c]
+            trace._n = n
+            trace.horizon = int(data["horizon"])
+        return trace
+
+    def __repr__(self) -> str:
+        return str(self)
+
+    def __str__(self) -> str:
+        return "CommunicationTrace(n_nodes=%d, messages=%d, horizon=%d)" \
+               %(self.n_nodes, self._n, self.horizon)
+
+
 class Delay(ABC):
     """A class representing a delay.
 
     The delay is a function of a message and returns the delay in simulation time units.
     """
 
+    rng: Optional[np.random.Generator] = None
+
     @abstractmethod
     def get(self, msg: Message) -> int:
         """Returns the delay for the specified message.
@@ -187,6 +476,40 @@ class Delay(ABC):
 
         pass
 
+    def get_batch(self, msgs: List[Message]) -> np.ndarray:
+        """Returns the delays for the specified messages, e.g., all the messages sent in a timestep.
+
+        Parameters
+        ----------
+        msgs : list of Message
+            The messages for which the delays are computed.
+
+        Returns
+        -------
+        np.ndarray
+            The delays in time units.
+        """
+
+        return np.array([self.get(msg) for msg in msgs], dtype=np.int64)
+
+    def reset(self) -> None:
+        """Resets the state of the delay (if any). It is called at the start of each simulation.
+        """
+
+        pass
+
+    def set_rng(self, rng: Optional[np.random.Generator]) -> None:
+        """Sets the random number generator of the (random) delays. The simulator sets the
+        stream of the current timestep (see :class:`gossipy.simul.GossipSimulator`).
+
+        Parameters
+        ----------
+        rng : np.random.Generator or None
+            The random number generator. If `None`, the global random state is used.
+        """
+
+        self.rng = rng
+
 
 class ConstantDelay(Delay):
     _delay: int
@@ -221,6 +544,10 @@ class ConstantDelay(Delay):
 
         return self._delay
 
+    # docstr-coverage:inherited
+    def get_batch(self, msgs: List[Message]) -> np.ndarray:
+        return np.full(len(msgs), self._delay, dtype=np.int64)
+
     def __repr__(self) -> str:
         return str(self)
 
@@ -265,8 +592,16 @@ class UniformDelay(Delay):
             The delay in time units.
         """
 
+        if self.rng is not None:
+            return int(self.rng.integers(self._min_delay, self._max_delay + 1))
         return np.random.randint(self._min_delay, self._max_delay + 1)
 
+    # docstr-coverage:inherited
+    def get_batch(self, msgs: List[Message]) -> np.ndarray:
+        if self.rng is not None:
+            return self.rng.integers(self._min_delay, self._max_delay + 1, size=len(msgs))
+        return np.random.randint(self._min_delay, self._max_delay + 1, size=len(msgs))
+
     def __str__(self) -> str:
         return "UniformDelay(%d, %d)" % (self._min_delay, self._max_delay)
 
@@ -315,17 +650,314 @@ class LinearDelay(Delay):
 
         return int(self._timexunit * msg.get_size()) + self._overhead
 
+    # docstr-coverage:inherited
+    def get_batch(self, msgs: List[Message]) -> np.ndarray:
+        sizes = np.fromiter((msg.get_size() for msg in msgs), dtype=np.float64, count=len(msgs))
+        return (self._timexunit * sizes).astype(np.int64) + self._overhead
+
     def __str__(self) -> str:
         return "LinearDelay(time_x_unit=%d, overhead=%d)" % (self._timexunit, self._overhead)
 
 
+class LinkDelay(Delay):
+    _latency: np.ndarray
+    _bandwidth: np.ndarray
+
+    def __init__(self,
+                 p2p_net: "P2PNetwork",
+                 latency: Union[float, np.ndarray] = 0.,
+                 bandwidth: Union[float, np.ndarray] = np.inf,
+                 value_bytes: int = 4):
+        """A class representing a per-link delay, i.e., each (directed) link of the topology has
+        its own latency and bandwidth.
+
+        | The delay of a message is computed as follows:
+        | `delay = floor(latency[link] + value_bytes * size(msg) / bandwidth[link])`,
+        | where the second term is the transmission time of the payload. The links are those of
+        | ``p2p_net`` at construction time, in the order of :meth:`links`. Messages between
+        | nodes that are not linked (e.g., after a view shuffle in a dynamic network) get the
+        | mean latency and bandwidth.
+
+        Parameters
+        ----------
+        p2p_net : P2PNetwork
+            The network topology.
+        latency : float or np.ndarray, default=0.
+            The latency (in time units) of the links, either the same for all the links or one
+            per link.
+        bandwidth : float or np.ndarray, default=np.inf
+            The bandwidth (in bytes per time unit) of the links, either the same for all the
+            links or one per link.
+        value_bytes : int, default=4
+            The number of bytes of an "atomic" value of the messages (see :meth:`Message.get_size`).
+        """
+
+        adj = p2p_net.adjacency()
+        self._n = adj.shape[0]
+        self._senders = np.repeat(np.arange(self._n, dtype=np.int64), np.diff(adj.indptr))
+        self._receivers = adj.indices.astype(np.int64)
+        self._keys = self._senders * self._n + self._receivers
+        n_links = len(self._keys)
+        self._latency = np.broadcast_to(np.asarray(latency, dtype=np.float64), (n_links,)).copy()
+        self._bandwidth = np.broadcast_to(np.asarray(bandwidth, dtype=np.float64), (n_links,)).copy()
+        assert n_links > 0, "The topology must have at least one link."
+        assert (self._latency >= 0).all(), "The latency must be non-negative!"
+        assert (self._bandwidth > 0).all(), "The bandwidth must be positive!"
+        self._value_bytes = value_bytes
+        self._default = (self._latency.mean(), self._bandwidth.mean())
+
+    def links(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the links, i.e., the arrays of the senders and of the receivers.
+
+        The per-link latency and bandwidth arrays must be aligned with these arrays.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The senders and the receivers of the links.
+        """
+
+        return self._senders, self._receivers
+
+    def get(self, msg: Message) -> int:
+        """Returns the delay for the specified message.
+
+        Parameters
+        ----------
+        msg : Message
+            The message for which the delay is computed.
+
+        Returns
+        -------
+        int
+            The delay in time units.
+        """
+
+        return int(self.get_batch([msg])[0])
+
+    # docstr-coverage:inherited
+    def get_batch(self, msgs: List[Message]) -> np.ndarray:
+        n = len(msgs)
+        senders = np.fromiter((msg.sender for msg in msgs), dtype=np.int64, count=n)
+        receivers = np.fromiter((msg.receiver for msg in msgs), dtype=np.int64, count=n)
+        sizes = np.fromiter((msg.get_size() for msg in msgs), dtype=np.float64, count=n)
+        keys = senders * self._n + receivers
+        idx = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        found = self._keys[idx] == keys
+        latency = np.where(found, self._latency[idx], self._default[0])
+        bandwidth = np.where(found, self._bandwidth[idx], self._default[1])
+        return (latency + self._value_bytes * sizes / bandwidth).astype(np.int64)
+
+    def __str__(self) -> str:
+        return "LinkDelay(links=%d, value_bytes=%d)" % (len(self._keys), self._value_bytes)
+
+
+class ContentionDelay(Delay):
+    _DISCIPLINES = ("fifo", "fair")
+
+    def __init__(self,
+                 n_nodes: int,
+                 uplink: Union[float, np.ndarray],
+                 downlink: Union[float, np.ndarray] = np.inf,
+                 latency: Delay = ConstantDelay(0),
+                 discipline: str = "fifo",
+                 value_bytes: int = 4):
+        """A class representing the delay of a network with limited per-node capacity.
+
+        Each node has an uplink and a downlink with a given capacity (in bytes per time unit),
+        and its messages are serialized through them: a message is received once it has been
+        transmitted on the uplink of the sender, has traversed the link (``latency``) and has
+        been transmitted on the downlink of the receiver. Thus, a node sending many messages at
+        once (e.g., the server of a federated topology) pays for all of them.
+
+        Each queue is represented by the time at which it becomes idle, so computing the delay
+        costs O(1) per message. The uplinks serve the messages sent in the same timestep
+        according to the ``discipline``:
+
+        - "fifo": one at a time, in sending order;
+        - "fair": sharing the capacity equally (processor sharing), so small messages are not
+          stuck behind large ones.
+
+        Messages sent in later timesteps wait for the earlier ones in both cases. The downlinks
+        are always FIFO in order of arrival.
+
+        Parameters
+        ----------
+        n_nodes : int
+            The number of nodes.
+        uplink : float or np.ndarray
+            The uplink capacity of the nodes, either the same for all the nodes or one per node.
+        downlink : float or np.ndarray, default=np.inf
+            The downlink capacity of the nodes, either the same for all the nodes or one per node.
+        latency : Delay, default=ConstantDelay(0)
+            The propagation delay of the messages, excluding the transmission time
+            (e.g., :class:`LinkDelay` with infinite bandwidth).
+        discipline : {"fifo", "fair"}, default="fifo"
+            How the uplinks serve the messages sent in the same timestep.
+        value_bytes : int, default=4
+            The number of bytes of an "atomic" value of the messages (see :meth:`Message.get_size`).
+        """
+
+        assert discipline in self._DISCIPLINES, \
+            "Unknown discipline '%s' (available: %s)." % (discipline, self._DISCIPLINES)
+        self._uplink = np.broadcast_to(np.asarray(uplink, dtype=np.float64), (n_nodes,)).copy()
+        self._downlink = np.broadcast_to(np.asarray(downlink, dtype=np.float64), (n_nodes,)).copy()
+        assert (self._uplink > 0).all() and (self._downlink > 0).all(), \
+            "The capacities must be positive!"
+        self._n_nodes = n_nodes
+        self._latency = latency
+        self._discipline = discipline
+        self._value_bytes = value_bytes
+        self.reset()
+
+    # docstr-coverage:inherited
+    def reset(self) -> None:
+        self._up_free = np.zeros(self._n_nodes)
+        self._down_free = np.zeros(self._n_nodes)
+        self._up_busy = np.zeros(self._n_nodes)
+        self._down_busy = np.zeros(self._n_nodes)
+        self._latency.reset()
+
+    # docstr-coverage:inherited
+    def set_rng(self, rng: Optional[np.random.Generator]) -> None:
+        super().set_rng(rng)
+        self._latency.set_rng(rng)
+
+    def get_stats(self) -> Dict[str, np.ndarray]:
+        """Returns the total time (in time units) each uplink and downlink has been busy
+        since the last reset.
+
+        Dividing by the duration of the simulation gives the utilization of the links.
+
+        Returns
+        -------
+        dict[str, np.ndarray]
+            The busy time of the uplinks ("uplink") and of the downlinks ("downlink").
+        """
+
+        return {"uplink": self._up_busy.copy(), "downlink": self._down_busy.copy()}
+
+    def get(self, msg: Message) -> int:
+        """Returns the delay for the specified message, updating the queues of its endpoints.
+
+        Parameters
+        ----------
+        msg : Message
+            The message for which the delay is computed.
+
+        Returns
+        -------
+        int
+            The delay in time units.
+        """
+
+        return int(self.get_batch([msg])[0])
+
+    def _transmit(self, t: int, senders: np.ndarray, nbytes: np.ndarray) -> np.ndarray:
+        # Uplink: the messages of a sender form a contiguous group after sorting
+        key = nbytes if self._discipline == "fair" else np.arange(len(senders))
+        order = np.lexsort((key, senders))
+        s = senders[order]
+        tx = nbytes[order] / self._uplink[s]
+        first = np.flatnonzero(np.r_[True, s[1:] != s[:-1]])
+        group = np.repeat(np.arange(len(first)), np.diff(np.r_[first, len(s)]))
+        done = np.cumsum(tx)
+        done -= (done - tx)[first][group]
+        if self._discipline == "fair":
+            # With sizes sorted ascending, the i-th message completes after the i smaller ones
+            # and while sharing the link with the (k - i - 1) larger ones
+            size = np.diff(np.r_[first, len(s)])[group]
+            rank = np.arange(len(s)) - first[group]
+            done += (size - rank - 1) * tx
+        finish = np.empty(len(s))
+        finish[order] = np.maximum(t, self._up_free[s]) + done
+        last = np.r_[first[1:], len(s)] - 1
+        self._up_free[s[last]] = finish[order[last]]
+        np.add.at(self._up_busy, s, tx)
+        return finish
+
+    # docstr-coverage:inherited
+    def get_batch(self, msgs: List[Message]) -> np.ndarray:
+        n = len(msgs)
+        if not n:
+            return np.zeros(0, dtype=np.int64)
+        t = np.fromiter((msg.timestamp for msg in msgs), dtype=np.int64, count=n)
+        senders = np.fromiter((msg.sender for msg in msgs), dtype=np.int64, count=n)
+        receivers = np.fromiter((msg.receiver for msg in msgs), dtype=np.int64, count=n)
+        nbytes = self._value_bytes * np.fromiter((msg.get_size() for msg in msgs),
+                                                 dtype=np.float64, count=n)
+        arrival = np.empty(n)
+        for ts in np.unique(t):
+            sel = np.flatnonzero(t == ts)
+            arrival[sel] = self._transmit(ts, senders[sel], nbytes[sel])
+        arrival += self._latency.get_batch(msgs)
+
+        if np.isinf(self._downlink[receivers]).all():
+            return (arrival - t).astype(np.int64)
+        received = np.empty(n)
+        for i in np.lexsort((arrival, receivers)):
+            j = receivers[i]
+            rx = nbytes[i] / self._downlink[j]
+            received[i] = self._down_free[j] = max(arrival[i], self._down_free[j]) + rx
+            self._down_busy[j] += rx
+        return (received - t).astype(np.int64)
+
+    def __str__(self) -> str:
+        return "ContentionDelay(n_nodes=%d, discipline=%s, latency=%s)" % \
+            (self._n_nodes, self._discipline, self._latency)
+
+
+class _AllButOne(Sequence):
+    __slots__ = ("_n", "_node")
+
+    def __init__(self, n: int, node: int):
+        # Implicit (i.e., not materialized) sequence of the integers in [0, n) but node
+        self._n = n
+        self._node = node
+
+    def __len__(self) -> int:
+        return self._n - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return np.asarray(self)[i]
+        if i < 0:
+            i += self._n - 1
+        if not 0 <= i < self._n - 1:
+            raise IndexError("index out of range")
+        return i if i < self._node else i + 1
+
+    def __iter__(self):
+        yield from range(self._node)
+        yield from range(self._node + 1, self._n)
+
+    def __contains__(self, x: Any) -> bool:
+        return 0 <= x < self._n and x != self._node
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return np.delete(np.arange(self._n, dtype=dtype), self._node)
+
+    def __repr__(self) -> str:
+        return "AllBut(%d, n=%d)" %(self._node, self._n)
+
+
+def _uniform(rng: Optional[np.random.Generator],
+             size: Union[int, Tuple[int, ...]]) -> np.ndarray:
+    # Uniform samples in [0, 1) drawn from rng or, if None, from the global random state
+    return np.random.random(size) if rng is None else rng.random(size)
+
+
 class P2PNetwork(ABC):
-    _topology: Union[None, csr_matrix, np.ndarray]
+    _indptr: Optional[np.ndarray]
+    _indices: Optional[np.ndarray]
     _num_nodes: int
 
     def __init__(self, num_nodes: int, topology: Optional[Union[np.ndarray, csr_matrix]] = None):
         """Abstract class representing a network topology.
 
+        The topology is stored in CSR format, i.e., the peers of the node ``i`` are
+        ``indices[indptr[i]:indptr[i+1]]``, while fully connected networks are implicit.
+
         Parameters
         ----------
         num_nodes : int
@@ -338,29 +970,78 @@ class P2PNetwork(ABC):
         if topology is None:
             assert num_nodes > 0, "The number of nodes must be positive!"
         else:
-            num_nodes == topology.shape[0], \
+            assert num_nodes == topology.shape[0], \
                 "The number of nodes must match the number of rows of the topology!"
 
         self._num_nodes = num_nodes
-        self._topology = {}
+        self._indptr, self._indices = None, None
+        self._version = 0
 
         if topology is not None:
             if isinstance(topology, np.ndarray):
-                for node in range(num_nodes):
-                    self._topology[node] = list(np.where(topology[node, :] > 0)[-1])
-            elif isinstance(topology, csr_matrix):
-                for node in range(num_nodes):
-                    self._topology[node] = list(topology.getrow(node).nonzero()[-1])
-        else:
-            self._topology = {i: [j for j in range(num_nodes) if j != i] for i in range(num_nodes)}
-            # self._topology = defaultdict(lambda: range(num_nodes))
+                topology = csr_matrix(topology > 0)
+            else:
+                topology = csr_matrix(topology)
+                topology.eliminate_zeros()
+            topology.sort_indices()
+            self._indptr, self._indices = topology.indptr, topology.indices
+
+    def _peers(self, node_id: int) -> Sequence[int]:
+        # Zero-copy view of the peers of a node
+        if self._indptr is None:
+            return _AllButOne(self._num_nodes, node_id)
+        return self._indices[self._indptr[node_id]:self._indptr[node_id + 1]]
 
     # docstr-coverage:inherited
     def size(self, node: Optional[int] = None) -> int:
-        if node:
-            return len(self._topology[node]) if self._topology[node] else self._num_nodes - 1
+        if node is not None:
+            return len(self.get_peers(node))
         return self._num_nodes
 
+    def degrees(self) -> np.ndarray:
+        """Returns the number of peers of each node.
+
+        Returns
+        -------
+        np.ndarray
+            The degree of each node.
+        """
+
+        if self._indptr is None:
+            return np.full(self._num_nodes, self._num_nodes - 1, dtype=np.int64)
+        return np.diff(self._indptr).astype(np.int64)
+
+    def adjacency(self) -> csr_matrix:
+        """Returns the (current) adjacency matrix of the network.
+
+        Fully connected networks are materialized, thus this method should be used with care on
+        large fully connected networks.
+
+        Returns
+        -------
+        csr_matrix
+            The adjacency matrix in CSR format.
+        """
+
+        n = self._num_nodes
+        if self._indptr is None:
+            indices = np.concatenate([np.asarray(self._peers(i)) for i in range(n)])
+            indptr = np.arange(n + 1, dtype=np.int64) * (n - 1)
+        else:
+            indptr, indices = self._indptr, self._indices
+        return csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n, n))
+
+    def version(self) -> int:
+        """Returns the version of the topology, i.e., the number of times it has changed.
+
+        Returns
+        -------
+        int
+            The version of the topology.
+        """
+
+        return self._version
+
     @abstractmethod
     def get_peers(self, node_id: int):
         """Abstract method to get the peers of a node.
@@ -373,6 +1054,36 @@ class P2PNetwork(ABC):
 
         pass
 
+    def sample_peers(self,
+                     node_ids: np.ndarray,
+                     rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """Samples uniformly at random a peer for each of the given nodes.
+
+        Parameters
+        ----------
+        node_ids : np.ndarray
+            The node identifiers.
+        rng : np.random.Generator, default=None
+            The random number generator. If `None`, the global random state of numpy is used.
+
+        Returns
+        -------
+        np.ndarray
+            The sampled peers. Nodes without peers get -1.
+        """
+
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        if self._indptr is None:
+            peers = (_uniform(rng, len(node_ids)) * max(self._num_nodes - 1, 1)).astype(np.int64)
+            return np.where(self._num_nodes > 1, peers + (peers >= node_ids), -1)
+        if not len(self._indices):
+            return np.full(len(node_ids), -1)
+        start = self._indptr[node_ids]
+        degree = self._indptr[node_ids + 1] - start
+        offset = (_uniform(rng, len(node_ids)) * degree).astype(np.int64)
+        peers = self._indices[np.minimum(start + offset, len(self._indices) - 1)]
+        return np.where(degree > 0, peers, -1)
+
 
 class StaticP2PNetwork(P2PNetwork):
     def __init__(self, num_nodes: int, topology: Optional[Union[np.ndarray, csr_matrix]] = None):
@@ -390,26 +1101,31 @@ class StaticP2PNetwork(P2PNetwork):
         """
         super().__init__(num_nodes, topology)
 
-    def get_peers(self, node_id: int) -> List[int]:
+    def get_peers(self, node_id: int) -> Sequence[int]:
         """Returns the peers of a node according to the static network topology.
 
+        The peers are a (read-only) view on the topology, i.e., no copy is made.
+
         Parameters
         ----------
         node_id : int
             The node identifier.
         """
         assert 0 <= node_id < self._num_nodes
-        return self._topology[node_id]
+        return self._peers(node_id)
 
 
 class DynamicP2PNetwork(P2PNetwork):
+    _views: np.ndarray
+    _degree: np.ndarray
 
     def __init__(self, num_nodes: int,
                  topology: Optional[Union[np.ndarray, csr_matrix]] = None):
         """A class representing a dynamic network topology.
 
             A dynamic network topology is a network topology where the adjacency matrix is evolves over time following a
-            random peer-sampling strategy.
+            random peer-sampling strategy. The views of the nodes are stored in a
+            (``num_nodes`` x max degree) array, and each node keeps its initial degree.
 
             Parameters
             ----------
@@ -420,9 +1136,22 @@ class DynamicP2PNetwork(P2PNetwork):
                 to be a fully connected network.
             """
         super().__init__(num_nodes, topology)
+        # The views change over time, hence they are materialized
+        if self._indptr is None:
+            cols = np.arange(num_nodes - 1)
+            self._degree = np.full(num_nodes, num_nodes - 1, dtype=np.int64)
+            self._views = cols[None, :] + (cols[None, :] >= np.arange(num_nodes)[:, None])
+        else:
+            self._degree = np.diff(self._indptr).astype(np.int64)
+            self._views = np.full((num_nodes, max(self._degree.max(), 1)), -1, dtype=np.int64)
+            rows = np.repeat(np.arange(num_nodes), self._degree)
+            self._views[rows, np.arange(len(rows)) - self._indptr[rows]] = self._indices
+        self._indptr, self._indices = None, None
 
-    def get_peers(self, node_id: int) -> List[int]:
-        """Returns the peers of a node according to the static network topology.
+    def get_peers(self, node_id: int) -> np.ndarray:
+        """Returns the peers of a node according to the current view of the node.
+
+        The peers are a view on the topology, i.e., no copy is made.
 
         Parameters
         ----------
@@ -430,23 +1159,71 @@ class DynamicP2PNetwork(P2PNetwork):
             The node identifier.
         """
         assert 0 <= node_id < self._num_nodes
-        return self._topology[node_id]
+        return self._views[node_id, :self._degree[node_id]]
+
+    # docstr-coverage:inherited
+    def degrees(self) -> np.ndarray:
+        return self._degree.copy()
+
+    # docstr-coverage:inherited
+    def adjacency(self) -> csr_matrix:
+        n = self._num_nodes
+        mask = np.arange(self._views.shape[1])[None, :] < self._degree[:, None]
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(self._degree, out=indptr[1:])
+        adj = csr_matrix((np.ones(indptr[-1]), self._views[mask], indptr), shape=(n, n))
+        adj.sort_indices()
+        return adj
+
+    # docstr-coverage:inherited
+    def sample_peers(self,
+                     node_ids: np.ndarray,
+                     rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        offset = (_uniform(rng, len(node_ids)) * self._degree[node_ids]).astype(np.int64)
+        return np.where(self._degree[node_ids] > 0, self._views[node_ids, offset], -1)
 
     @abstractmethod
-    def update_view(self, node_id: int):
+    def update_view(self, node_id: int, rng: Optional[np.random.Generator] = None):
         """Abstract method to update the peers of a node.
 
                 Parameters
                 ----------
                 node_id : int
                     The node identifier.
+                rng : np.random.Generator, default=None
+                    The random number generator. If `None`, the global random state of numpy
+                    is used.
                 """
         pass
 
+    def update_views(self, node_ids: np.ndarray, rng: Optional[np.random.Generator] = None):
+        """Updates the peers of many nodes, e.g., all the nodes due at a timestep.
+
+        Parameters
+        ----------
+        node_ids : np.ndarray
+            The node identifiers.
+        rng : np.random.Generator, default=None
+            The random number generator. If `None`, the global random state of numpy is used.
+        """
+
+        for node_id in node_ids:
+            self.update_view(int(node_id), rng)
+
 
 class UniformDynamicP2PNetwork(DynamicP2PNetwork):
     """ A dynamic network with symmetric view shuffle based peer-sampling
     that converges to a uniform sample overtime in regular topologies.
+
+    A node ``i`` sends ``ceil(shuffle_ratio * degree)`` random entries of its view (where the
+    selected peer ``j`` is replaced by ``i`` itself) to ``j``, that replies with the same number
+    of random entries of its view. Each node replaces the sent entries with the received ones
+    that are not already in its view, thus the degree of the nodes does not change.
+
+    The exchanges work on the arrays of the views: :meth:`update_views` performs at once the
+    exchanges of all the given nodes that involve distinct pairs of nodes, and :meth:`update_view`
+    is the exchange of a single node.
     """
 
     def __init__(self, num_nodes: int,
@@ -456,86 +1233,146 @@ class UniformDynamicP2PNetwork(DynamicP2PNetwork):
         super().__init__(num_nodes, topology)
         self._shuffle_ratio = shuffle_ratio
 
-    def update_view(self, node_id: int):
-        degree = len(self._topology[node_id])
-        nb_nodes_to_exchange = math.ceil(self._shuffle_ratio * degree)
-        id_nodes_to_exchange = sample(population=self._topology[node_id],
-                                      k=nb_nodes_to_exchange)
-        node_jd = choice(id_nodes_to_exchange)
-
-        self._topology[node_id] = [node for node in self._topology[node_id] if
-                                   node not in id_nodes_to_exchange]
-
-        jd_nodes_to_exchange = sample(population=[node for node in self._topology[node_jd] if node != node_id],
-                                      k=nb_nodes_to_exchange)
+    # docstr-coverage:inherited
+    def update_view(self, node_id: int, rng: Optional[np.random.Generator] = None):
+        self.update_views(np.array([node_id]), rng)
 
-        self._topology[node_jd] = list(set([node for node in self._topology[node_jd] if
-                                            node not in jd_nodes_to_exchange] + id_nodes_to_exchange + [node_id]))
-        self._topology[node_jd].remove(node_jd)
+    # docstr-coverage:inherited
+    def update_views(self, node_ids: np.ndarray, rng: Optional[np.random.Generator] = None):
+        pending = np.asarray(node_ids, dtype=np.int64)
+        pending = pending[self._degree[pending] > 0]
+        # The exchanges involving distinct nodes are performed at once
+        while len(pending):
+            pending = self._exchange(pending, rng)
+
+    def _random_positions(self,
+                          nodes: np.ndarray,
+                          rng: Optional[np.random.Generator],
+                          exclude: Optional[np.ndarray] = None) -> np.ndarray:
+        # Random permutation of the positions of the views, the empty slots (and the excluded
+        # peers) are moved at the end
+        keys = _uniform(rng, (len(nodes), self._views.shape[1]))
+        mask = np.arange(self._views.shape[1])[None, :] >= self._degree[nodes][:, None]
+        if exclude is not None:
+            mask |= self._views[nodes] == exclude[:, None]
+        keys[mask] = np.inf
+        return np.argsort(keys, axis=1), (~mask).sum(axis=1)
+
+    def _exchange(self, nodes: np.ndarray, rng: Optional[np.random.Generator]) -> np.ndarray:
+        pos_i, _ = self._random_positions(nodes, rng)
+        k = np.ceil(self._shuffle_ratio * self._degree[nodes]).astype(np.int64)
+        pick = (_uniform(rng, len(nodes)) * k).astype(np.int64)
+        partners = self._views[nodes, pos_i[np.arange(len(nodes)), pick]]
+
+        take = np.zeros(len(nodes), dtype=bool)
+        used = set()
+        for b, (i, j) in enumerate(zip(nodes.tolist(), partners.tolist())):
+            if i not in used and j not in used:
+                used.update((i, j))
+                take[b] = True
+        rest = nodes[~take]
+        take &= partners != nodes
+        i, j, pos_i, k = nodes[take], partners[take], pos_i[take], k[take]
+        if not len(i):
+            return rest
+        self._version += 1
+
+        pos_j, n_j = self._random_positions(j, rng, exclude=i)
+        k_j = np.minimum(k, n_j)
+        K = max(k.max(), 1)
+        cols = np.arange(K)[None, :]
+        send_i = np.take_along_axis(self._views[i], pos_i[:, :K], axis=1)
+        send_i = np.where(send_i == j[:, None], i[:, None], send_i)
+        send_i[cols >= k[:, None]] = -1
+        send_j = np.take_along_axis(self._views[j], pos_j[:, :K], axis=1)
+        send_j[cols >= k_j[:, None]] = -1
+
+        view_i, view_j = self._views[i], self._views[j]
+        self._merge(i, view_i, pos_i[:, :K], send_j)
+        self._merge(j, view_j, pos_j[:, :K], send_i)
+        return rest
+
+    def _merge(self, nodes: np.ndarray, views: np.ndarray, pos: np.ndarray, recv: np.ndarray):
+        # The sent entries (pos) are replaced by the received ones not already in the view
+        known = np.empty(recv.shape, dtype=bool)
+        step = max(1, 2**22 // (recv.shape[1] * views.shape[1]))
+        for b in range(0, len(nodes), step):
+            known[b:b + step] = (recv[b:b + step, :, None] == views[b:b + step, None, :]).any(axis=2)
+        valid = (recv >= 0) & (recv != nodes[:, None]) & ~known
+        order = np.argsort(~valid, axis=1, kind="stable")
+        recv = np.take_along_axis(recv, order, axis=1)
+        fill = np.arange(recv.shape[1])[None, :] < valid.sum(axis=1)[:, None]
+        self._views[np.broadcast_to(nodes[:, None], fill.shape)[fill], pos[fill]] = recv[fill]
 
-        self._topology[node_id] = list(set(self._topology[node_id] + jd_nodes_to_exchange))
 
-        while len(self._topology[node_id]) < degree:
-            chosen = choice(id_nodes_to_exchange)
-            while chosen in self._topology[node_id]:
-                chosen = choice(id_nodes_to_exchange)
-            id_nodes_to_exchange.remove(chosen)
-            self._topology[node_id].append(chosen)
+class MixingMatrix:
+    def __init__(self, p2p_net: P2PNetwork) -> None:
+        """Abstract class representing a mixing matrix, i.e., the weights of the models of a node
+        and of its peers in the (weighted) merge.
 
-        while len(self._topology[node_jd]) < degree:
-            chosen = choice(jd_nodes_to_exchange)
-            while chosen in self._topology[node_jd]:
-                chosen = choice(jd_nodes_to_exchange)
-            jd_nodes_to_exchange.remove(chosen)
-            self._topology[node_jd].append(chosen)
+        The whole matrix is built once as a sparse matrix (see :meth:`matrix`), and it is rebuilt
+        only when the topology changes.
 
+        Parameters
+        ----------
+        p2p_net : P2PNetwork
+            The network topology.
+        """
 
-class MixingMatrix:
-    def __init__(self, p2p_net: P2PNetwork) -> None:
         self.p2p_net = p2p_net
+        self._W = None
+        self._W_version = None
 
     @abstractmethod
-    def get(self, node_id: int) -> np.ndarray:
-        """Returns the mixing matrix for the specified node.
+    def _build(self) -> csr_matrix:
+        """Builds the mixing matrix of the current topology.
 
-        Parameters
-        ----------
-        node_id : int
-            The node identifier.
-        
         Returns
         -------
-        np.ndarray
-            The mixing matrix.
+        csr_matrix
+            The (``num_nodes`` x ``num_nodes``) mixing matrix, with sorted indices.
         """
+
         raise NotImplementedError
 
-    def __getitem__(self, node_id: int) -> np.ndarray:
-        return self.get(node_id)
+    def matrix(self) -> csr_matrix:
+        """Returns the mixing matrix, building it if needed.
 
-    def __str__(self) -> str:
-        return "MixingMatrix(%s)" % self.p2p_net
+        Returns
+        -------
+        csr_matrix
+            The (``num_nodes`` x ``num_nodes``) mixing matrix.
+        """
 
+        if self._W is None or self._W_version != self.p2p_net.version():
+            self._W = self._build()
+            self._W.sort_indices()
+            self._W_version = self.p2p_net.version()
+        return self._W
 
-class UniformMixing(MixingMatrix):
-    def get(self, node_id: int) -> np.ndarray:
-        """Returns the mixing matrix for the specified node.
+    def invalidate(self) -> None:
+        """Invalidates the mixing matrix, that is rebuilt when needed."""
+
+        self._W = None
+
+    def row(self, node_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the (sparse) row of the mixing matrix of the specified node.
 
         Parameters
         ----------
         node_id : int
             The node identifier.
-        
+
         Returns
         -------
-        np.ndarray
-            The mixing matrix.
+        tuple[np.ndarray, np.ndarray]
+            The (sorted) indices of the nodes and the corresponding weights.
         """
-        size = self.p2p_net.size(node_id) + 1
-        return np.ones(size) / size
 
+        W = self.matrix()
+        start, end = W.indptr[node_id], W.indptr[node_id + 1]
+        return W.indices[start:end], W.data[start:end]
 
-class MetropolisHastingsMixing(MixingMatrix):
     def get(self, node_id: int) -> np.ndarray:
         """Returns the mixing matrix for the specified node.
 
@@ -547,8 +1384,38 @@ class MetropolisHastingsMixing(MixingMatrix):
         Returns
         -------
         np.ndarray
-            The mixing matrix.
+            The weight of the node followed by the weights of its peers (in the same order of
+            :meth:`P2PNetwork.get_peers`).
         """
-        size = self.p2p_net.size(node_id)
-        peers = self.p2p_net.get_peers(node_id)
-        return np.array([1. / size] + [1. / (min(self.p2p_net.size(k), size) + 1) for k in peers])
+
+        indices, weights = self.row(node_id)
+        nodes = np.concatenate([[node_id], np.asarray(self.p2p_net.get_peers(node_id), dtype=np.int64)])
+        return weights[np.searchsorted(indices, nodes)]
+
+    def __getitem__(self, node_id: int) -> np.ndarray:
+        return self.get(node_id)
+
+    def __str__(self) -> str:
+        return "MixingMatrix(%s)" % self.p2p_net
+
+
+class UniformMixing(MixingMatrix):
+    # docstr-coverage:inherited
+    def _build(self) -> csr_matrix:
+        n = self.p2p_net.size()
+        A = self.p2p_net.adjacency() + identity(n, format="csr")
+        return csr_matrix(diags(1. / (self.p2p_net.degrees() + 1)) @ A)
+
+
+class MetropolisHastingsMixing(MixingMatrix):
+    # docstr-coverage:inherited
+    def _build(self) -> csr_matrix:
+        # W[i, k] = 1 / (min(d_i, d_k) + 1) for the peers and W[i, i] = 1 / d_i
+        A = self.p2p_net.adjacency().tocoo()
+        deg = self.p2p_net.degrees()
+        n = len(deg)
+        rows = np.concatenate([A.row, np.arange(n)])
+        cols = np.concatenate([A.col, np.arange(n)])
+        data = np.concatenate([1. / (np.minimum(deg[A.row], deg[A.col]) + 1),
+                               1. / np.maximum(deg, 1)])
+        return csr_matrix((data, (rows, cols)), shape=(n, n))
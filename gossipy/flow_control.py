@@ -1,4 +1,6 @@
 from abc import ABC, abstractmethod
+from typing import Optional
+import numpy as np
 from numpy.random import binomial
 
 # AUTHORSHIP
@@ -20,6 +22,8 @@ __all__ = ["TokenAccount",
 
 
 class TokenAccount(ABC):
+    rng: Optional[np.random.Generator] = None
+
     def __init__(self):
         """Abstract class representing a generic token account.
 
@@ -50,6 +54,18 @@ class TokenAccount(ABC):
         """
 
         self.n_tokens = max(0, self.n_tokens - n)
+
+    def set_rng(self, rng: Optional[np.random.Generator]) -> None:
+        """Sets the random number generator of the account. The
+        :class:`gossipy.simul.TokenizedGossipSimulator` gives each account its own stream.
+
+        Parameters
+        ----------
+        rng : np.random.Generator or None
+            The random number generator. If `None`, the global random state is used.
+        """
+
+        self.rng = rng
     
     @abstractmethod
     def proactive(self) -> float:
@@ -232,5 +248,6 @@ class RandomizedTokenAccount(GeneralizedTokenAccount):
     def reactive(self, utility: int) -> int:
         if utility > 0:
             r = self.n_tokens / self.reactivity
-            return int(r) + binomial(1, r - int(r)) #randRound
+            rnd = self.rng.binomial if self.rng is not None else binomial
+            return int(r) + rnd(1, r - int(r)) #randRound
         return 0
@@ -37,13 +37,7 @@ class TorchModel(torch.nn.Module, Sizeable, ABC):
         pass
     
     def _get_n_params(self) -> int:
-        pp = 0
-        for p in list(self.parameters()):
-            nn = 1
-            for s in list(p.size()):
-                nn = nn * s
-            pp += nn
-        return pp
+        return sum(p.numel() for p in self.parameters())
     
     def get_size(self) -> int:
         """Returns the number of parameters of the model.
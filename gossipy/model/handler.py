@@ -2,6 +2,10 @@ from __future__ import annotations
 from abc import ABC, abstractmethod
 import os
 import copy
+import functools
+import hashlib
+import itertools
+import weakref
 import torch
 import torch.optim.lr_scheduler as lr_scheduler
 import torchvision.models as models
@@ -9,12 +13,12 @@ import numpy as np
 from torch import LongTensor
 from torch.nn import ParameterList, Parameter
 from torch.profiler import profile, record_function, ProfilerActivity
-from typing import Any, Callable, Tuple, Dict, Optional, Union, Iterable
+from typing import Any, Callable, List, Tuple, Dict, Optional, Union, Iterable
 from sklearn.metrics import accuracy_score, roc_auc_score, recall_score, f1_score, precision_score
 from sklearn.metrics.cluster import normalized_mutual_info_score as nmi
 from scipy.optimize import linear_sum_assignment as hungarian
 from typing import Set
-from .. import CACHE, LOG, CacheKey, GlobalSettings, Sizeable
+from .. import CACHE, LOG, RESIDENCY, CacheKey, GlobalSettings, Sizeable
 from ..core import CreateModelMode
 from . import TorchModel
 from .sampling import TorchModelPartition, TorchModelSampling
@@ -40,6 +44,8 @@ __all__ = [
     "PartitionedTMH",
     "MFModelHandler",
     "KMeansHandler",
+    "DryRunHandler",
+    "ModelPayload",
     "NewTorchModelHandler"
 ]
 
@@ -60,7 +66,266 @@ class ModelEqualityMixin(object):
 
 
 
+def _copy_on_write(method: Callable) -> Callable:
+    # Decorates the methods that modify the model handler: the pending snapshots of the handler
+    # (see ModelHandler.snapshot) are materialized before the modification.
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._release_snapshots()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _fresh_optimizer(optimizer: torch.optim.Optimizer,
+                     params: Iterable[torch.nn.Parameter]) -> torch.optim.Optimizer:
+    # Same optimizer (type and hyper-parameters) on the given parameters, without any state
+    fresh = type(optimizer)(params, **optimizer.defaults)
+    for group, old_group in zip(fresh.param_groups, optimizer.param_groups):
+        group.update({k: v for k, v in old_group.items() if k != "params"})
+    return fresh
+
+
+def _split_state(model: torch.nn.Module) -> Tuple[List[torch.Tensor], List[Tuple[str, torch.Tensor]]]:
+    # The tensors of the model that are kept in the flat tensor (see _flat_state) and the others
+    flat, rest = [], []
+    for name, t in itertools.chain(model.named_parameters(), model.named_buffers()):
+        if t.is_floating_point() and (not flat or (t.dtype == flat[0].dtype and
+                                                   t.device == flat[0].device)):
+            flat.append(t)
+        else:
+            rest.append((name, t))
+    return flat, rest
+
+
+def _flat_state(model: torch.nn.Module,
+                device: Optional[torch.device] = None) -> Tuple[torch.Tensor, List[Tuple[str, torch.Tensor]]]:
+    # The floating point parameters and buffers of the model (with the dtype and device of the
+    # first one) are kept in one contiguous flat tensor, of which they are views. Returns the
+    # flat tensor and the remaining (named) tensors, e.g., the "num_batches_tracked" counters.
+    # The flat tensor is (re)built when the tensors are not its views anymore, e.g., after a deep
+    # copy of the model or after moving it to another device. If device is given, the returned
+    # tensors are (copies) on that device, e.g., to merge with a model resident on the device.
+    if device is not None:
+        flat, rest = _flat_state(model)
+        return flat.to(device), [(name, t.to(device)) for name, t in rest]
+
+    flat, rest = _split_state(model)
+    if not flat:
+        return torch.zeros(0), rest
+
+    storage, start = flat[0].untyped_storage().data_ptr(), flat[0].storage_offset()
+    offset = start
+    for t in flat:
+        if t.untyped_storage().data_ptr() != storage or t.storage_offset() != offset or \
+                not t.is_contiguous():
+            break
+        offset += t.numel()
+    else:
+        return flat[0].detach().as_strided((offset - start,), (1,), start), rest
+
+    buffer = torch.cat([t.detach().reshape(-1) for t in flat])
+    offset = 0
+    for t in flat:
+        t.data = buffer[offset : offset + t.numel()].view_as(t)
+        offset += t.numel()
+    return buffer, rest
+
+
+def _on_device_of(model: torch.nn.Module, target: torch.nn.Module) -> torch.nn.Module:
+    # The model itself if it is on the same device of the target model, otherwise a copy on it
+    param, target_param = next(model.parameters(), None), next(target.parameters(), None)
+    if param is None or target_param is None or param.device == target_param.device:
+        return model
+    return copy.deepcopy(model).to(target_param.device)
+
+
+def _merge_rest(rest: List[Tuple[str, torch.Tensor]],
+                others: List[List[Tuple[str, torch.Tensor]]],
+                div: int,
+                received: bool = False) -> None:
+    # Merges (in place) the tensors that are not in the flat tensor (see _flat_state): the
+    # counters (e.g., "num_batches_tracked") are summed, the other tensors are averaged
+    with torch.no_grad():
+        for i, (name, t) in enumerate(rest):
+            if received:
+                t.zero_()
+            for other in others:
+                t.add_(other[i][1])
+            if t.is_floating_point() and "num_batches_tracked" not in name:
+                t.div_(div)
+
+
+def _arch_id(model: torch.nn.Module) -> str:
+    # Identifier of the architecture of the model: its class and the names, shapes and dtypes of
+    # its parameters and buffers
+    spec = [(name, tuple(t.shape), str(t.dtype))
+            for name, t in itertools.chain(model.named_parameters(), model.named_buffers())]
+    return "%s:%s" % (type(model).__qualname__, hashlib.md5(repr(spec).encode()).hexdigest()[:16])
+
+
+class ModelPayload(Sizeable):
+    def __init__(self,
+                 flat: torch.Tensor,
+                 buffers: List[Tuple[str, torch.Tensor]],
+                 n_updates: int,
+                 arch: str,
+                 size: int,
+                 sections: Optional[List[int]] = None):
+        """The transferable part of a torch model handler, i.e., what is sent to the other nodes.
+
+        Unlike a copy of the handler, the payload does not contain the optimizer (and its state),
+        the criterion or any other setting of the handler, but only the model's parameters as a
+        single flat tensor, the remaining buffers (e.g., ``num_batches_tracked``), the number of
+        updates and the identifier of the architecture. The receiving handlers merge directly
+        from the payload (see :meth:`TorchModelHandler._merge`), or build a handler from it when
+        they need one (see :meth:`TorchModelHandler.unpack`).
+
+        Parameters
+        ----------
+        flat : torch.Tensor
+            The flat (floating point) parameters and buffers of the model.
+        buffers : list[tuple[str, torch.Tensor]]
+            The remaining named tensors of the model.
+        n_updates : int
+            The number of updates of the model.
+        arch : str
+            The identifier of the architecture of the model.
+        size : int
+            The size (number of parameters) of the model.
+        sections : list[int], default=None
+            The number of elements of each tensor in the flat tensor. If `None`, the flat tensor
+            is a single section.
+        """
+
+        self.flat = flat
+        self.buffers = buffers
+        self.n_updates = n_updates
+        self.arch = arch
+        self._size = size
+        self.sections = sections if sections is not None else [flat.numel()]
+
+    # docstr-coverage:inherited
+    def get_size(self) -> int:
+        return self._size
+
+    def __repr__(self) -> str:
+        return str(self)
+
+    def __str__(self) -> str:
+        return f"ModelPayload(arch={self.arch}, n_updates={self.n_updates}, size={self._size})"
+
+
+def _payload_state(other: Union[ModelHandler, ModelPayload],
+                   model: torch.nn.Module,
+                   device: torch.device) -> Tuple[torch.Tensor, List[Tuple[str, torch.Tensor]]]:
+    # The flat state of a received model handler or payload, on the given device
+    if isinstance(other, ModelPayload):
+        assert other.arch == _arch_id(model), \
+            "Cannot merge a payload with architecture %s." % other.arch
+        return other.flat.to(device), [(name, t.to(device)) for name, t in other.buffers]
+    return _flat_state(other.model, device)
+
+
+def _make_payload(handler: ModelHandler) -> ModelPayload:
+    # The payload of a torch model handler: a (cpu) copy of its flat state
+    flat, rest = _flat_state(handler.model)
+    cpu = torch.device("cpu")
+    return ModelPayload(flat.detach().to(cpu, copy=True),
+                        [(name, t.detach().to(cpu, copy=True)) for name, t in rest],
+                        handler.n_updates,
+                        _arch_id(handler.model),
+                        handler.get_size(),
+                        [t.numel() for t in _split_state(handler.model)[0]])
+
+
+def _unpack_payload(handler: ModelHandler, payload: ModelPayload) -> ModelHandler:
+    # A copy of the (receiving) torch model handler with the model of the payload and a fresh
+    # optimizer
+    unpacked = copy.copy(handler)
+    unpacked.model = copy.deepcopy(handler.model)
+    RESIDENCY.acquire(unpacked.model, "cpu")
+    flat, rest = _flat_state(unpacked.model)
+    other_flat, other_rest = _payload_state(payload, unpacked.model, flat.device)
+    with torch.no_grad():
+        flat.copy_(other_flat)
+        for (_, t), (_, v) in zip(rest, other_rest):
+            t.copy_(v)
+    unpacked.n_updates = payload.n_updates
+    unpacked.optimizer = _fresh_optimizer(handler.optimizer, unpacked.model.parameters())
+    return unpacked
+
+
+def _roc_auc(y_true: torch.Tensor, scores: torch.Tensor) -> float:
+    # Area under the ROC curve of binary labels, i.e., the Mann-Whitney statistic of the scores
+    # of the positives (ties count 1/2, as in sklearn's roc_auc_score)
+    _, inverse, counts = torch.unique(scores.double(), return_inverse=True, return_counts=True)
+    counts = counts.double()
+    ranks = (torch.cumsum(counts, 0) - (counts - 1) / 2.)[inverse]
+    pos = y_true == y_true.max()
+    n_pos, n_neg = int(pos.sum()), int((~pos).sum())
+    return float((ranks[pos].sum() - n_pos * (n_pos + 1) / 2.) / (n_pos * n_neg))
+
+
+def _evaluate_classifier(model: torch.nn.Module,
+                         data: Tuple[torch.Tensor, torch.Tensor],
+                         device: torch.device,
+                         batch_size: int) -> Dict[str, float]:
+    # Streaming evaluation of a classifier: the data go through the model in mini-batches (without
+    # tracking the gradients) and only the confusion matrix (and the scores of the positive class
+    # for the AUC of binary classifiers) is kept. The metrics are the same as sklearn's ones, with
+    # the macro averages over the classes that appear either in the labels or in the predictions.
+    x, y = data
+    batch_size = batch_size or max(x.size(0), 1)
+    model.eval()
+    confusion = torch.zeros((0, 0), dtype=torch.long)
+    labels, pos_scores = [], []
+    binary = None
+    with torch.inference_mode():
+        for i in range(0, x.size(0), batch_size):
+            scores = model(x[i : i + batch_size].to(device))
+            y_batch = y[i : i + batch_size]
+            y_true = y_batch if y_batch.dim() == 1 else torch.argmax(y_batch, dim=-1)
+            y_true = y_true.flatten().long().cpu()
+            y_pred = torch.argmax(scores, dim=-1).flatten().cpu()
+            n = max(scores.shape[1], int(y_true.max()) + 1, confusion.size(0))
+            if n > confusion.size(0):
+                grown = torch.zeros((n, n), dtype=torch.long)
+                grown[:confusion.size(0), :confusion.size(0)] = confusion
+                confusion = grown
+            confusion += torch.bincount(y_true * n + y_pred, minlength=n * n).view(n, n)
+            binary = scores.shape[1] == 2
+            if binary:
+                labels.append(y_true)
+                pos_scores.append(scores[:, 1].float().cpu())
+
+    tp = confusion.diag().double()
+    support, predicted = confusion.sum(1).double(), confusion.sum(0).double()
+    present = (support + predicted) > 0
+    precision = torch.where(predicted > 0, tp / predicted.clamp(min=1), torch.zeros_like(tp))
+    recall = torch.where(support > 0, tp / support.clamp(min=1), torch.zeros_like(tp))
+    f1 = torch.where(support + predicted > 0, 2 * tp / (support + predicted).clamp(min=1),
+                     torch.zeros_like(tp))
+    res = {
+        "accuracy": float(tp.sum() / max(int(support.sum()), 1)),
+        "precision": float(precision[present].mean()) if present.any() else 0.,
+        "recall": float(recall[present].mean()) if present.any() else 0.,
+        "f1_score": float(f1[present].mean()) if present.any() else 0.
+    }
+
+    if binary:
+        y_true = torch.cat(labels)
+        if len(torch.unique(y_true)) == 2:
+            res["auc"] = _roc_auc(y_true, torch.cat(pos_scores))
+        else:
+            res["auc"] = 0.5
+            LOG.warning("# of classes != 2. AUC is set to 0.5.")
+    return res
+
+
 class ModelHandler(Sizeable, ModelEqualityMixin, ABC):
+    _MUTATORS: Tuple[str, ...] = ("__call__", "init", "_update", "_merge", "_merge_received")
+    _SNAPSHOT_EXCLUDE: Tuple[str, ...] = ()
+
     def __init__(self,
                  create_model_mode: CreateModelMode=CreateModelMode.MERGE_UPDATE,
                  *args, **kwargs):
@@ -86,6 +351,45 @@ class ModelHandler(Sizeable, ModelEqualityMixin, ABC):
         self.model = None
         self.mode = create_model_mode
         self.n_updates = 0
+        self._model_size = None
+        self._version = 0
+        self._snapshots = []
+        self._shared = False
+        self._generator = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in ModelHandler._MUTATORS:
+            if name in cls.__dict__:
+                setattr(cls, name, _copy_on_write(cls.__dict__[name]))
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Copies (and pickles) of a handler are independent from its snapshots, and copies of a
+        # snapshot do not share the model with the handler anymore
+        self._materialize()
+        state = self.__dict__.copy()
+        state["_snapshots"] = []
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.__dict__.setdefault("_version", 0)
+        self.__dict__.setdefault("_snapshots", [])
+        self.__dict__.setdefault("_shared", False)
+        self.__dict__.setdefault("_model_size", None)
+        self.__dict__.setdefault("_generator", None)
+
+    def seed(self, seed: int) -> None:
+        """Gives the model handler its own random number generator, e.g., to shuffle the data
+        during the updates. Without it, the global torch generator is used.
+
+        Parameters
+        ----------
+        seed : int
+            The seed of the generator.
+        """
+
+        self._generator = torch.Generator().manual_seed(seed)
 
     @abstractmethod
     def init(self, *args, **kwargs) -> None:
@@ -119,11 +423,14 @@ class ModelHandler(Sizeable, ModelEqualityMixin, ABC):
 
         pass
 
+    @_copy_on_write
     def __call__(self,
                  recv_model: Any,
                  data: Any,
                  *args,
                  **kwargs) -> None:
+        if self.mode not in (CreateModelMode.MERGE_UPDATE, CreateModelMode.MERGE):
+            recv_model = self.unpack(recv_model)
         if self.mode == CreateModelMode.UPDATE:
             recv_model._update(data)
             self.model = copy.deepcopy(recv_model.model)
@@ -148,24 +455,102 @@ class ModelHandler(Sizeable, ModelEqualityMixin, ABC):
 
         pass
 
+    def unpack(self, value: Any) -> Any:
+        """Returns a model handler from a received value, i.e., a model handler (returned as is),
+        a payload (see :class:`ModelPayload`) or a list of them.
+
+        Parameters
+        ----------
+        value : Any
+            The received value.
+
+        Returns
+        -------
+        Any
+            The model handler(s).
+        """
+
+        if isinstance(value, (list, tuple)):
+            return [self.unpack(v) for v in value]
+        return value
+
     def copy(self) -> Any:
         """Return a deep copy of the model handler."""
 
         return copy.deepcopy(self)
+
+    def snapshot(self) -> ModelHandler:
+        """Return a copy-on-write snapshot of the model handler.
+
+        The snapshot is a shallow copy of the model handler that shares the model with it, thus
+        taking a snapshot costs O(1). The state is actually copied (i.e., the snapshot is
+        materialized) only when either the handler or the snapshot is modified, i.e., when one of
+        the methods :meth:`__call__`, :meth:`init`, :meth:`_update`, :meth:`_merge` or
+        :meth:`_merge_received` is called. Every modification increases the version of the
+        handler, and a handler that has not been modified since its last snapshot returns the
+        same snapshot. The attributes listed in ``_SNAPSHOT_EXCLUDE`` (e.g., the optimizer) are
+        never copied into the snapshot.
+
+        Returns
+        -------
+        ModelHandler
+            The snapshot of the model handler.
+        """
+
+        if self._shared:
+            self._materialize()
+        self._snapshots = [ref for ref in self._snapshots if ref() is not None]
+        for ref in self._snapshots:
+            snap = ref()
+            if snap._shared and snap._version == self._version:
+                return snap
+        snap = copy.copy(self)
+        snap._shared = True
+        self._snapshots.append(weakref.ref(snap))
+        return snap
+
+    def _materialize(self) -> None:
+        # Gives to a (shared) snapshot its own copy of the state, but the excluded attributes
+        if not self._shared:
+            return
+        state = {k: v for k, v in self.__dict__.items()
+                 if k not in self._SNAPSHOT_EXCLUDE and k != "_snapshots"}
+        self.__dict__.update(copy.deepcopy(state))
+        self._shared = False
+
+    def _release_snapshots(self) -> None:
+        # Called before any modification of the handler (copy-on-write)
+        self._materialize()
+        for ref in self._snapshots:
+            snap = ref()
+            if snap is not None:
+                snap._materialize()
+        self._snapshots = []
+        self._version += 1
     
     def get_size(self) -> int:
         """Return the size of the model.
 
+        The size depends only on the architecture of the model, thus it is computed once and
+        stored in the handler (copies of the handler share it).
+
         Returns
         -------
         int
             The size of the model.
         """
 
-        return self.model.get_size() if self.model is not None else 0
+        if self._model_size is None:
+            if self.model is None:
+                return 0
+            self._model_size = self.model.get_size()
+        return self._model_size
     
     def caching(self, owner: int) -> CacheKey:
-        """Cache the model handler and return the cache key.
+        """Cache a snapshot of the model handler and return the cache key.
+
+        The cached value is a copy-on-write snapshot (see :meth:`snapshot`), thus caching the
+        model handler does not copy the model until the handler is modified.
 
         Parameters
         ----------
@@ -178,8 +563,8 @@ class ModelHandler(Sizeable, ModelEqualityMixin, ABC):
             The cache key corresponding to this model handler in the cache.
         """
 
-        key = CacheKey(owner, self.n_updates)
-        CACHE.push(key, self.copy())
+        key = CacheKey(owner, self.n_updates, size=self.get_size())
+        CACHE.push(key, self.snapshot())
         return key
     
     def __repr__(self) -> str:
@@ -189,6 +574,11 @@ class ModelHandler(Sizeable, ModelEqualityMixin, ABC):
         return f"{self.__class__.__name__}(model={str(self.model)}_{self.n_updates}, mode={self.mode})"
      
 class TorchModelHandler(ModelHandler):
+    eval_batch_size: int = 1024
+    _SNAPSHOT_EXCLUDE: Tuple[str, ...] = ("optimizer",)
+    _PAYLOAD_MODES: Tuple[CreateModelMode, ...] = (CreateModelMode.MERGE_UPDATE,
+                                                   CreateModelMode.MERGE)
+
     def __init__(self,
                  net: TorchModel,
                  optimizer: torch.optim.Optimizer,
@@ -197,7 +587,8 @@ class TorchModelHandler(ModelHandler):
                  local_epochs: int=1,
                  batch_size: int=32,
                  create_model_mode: CreateModelMode=CreateModelMode.MERGE_UPDATE,
-                 copy_model=True):
+                 copy_model=True,
+                 eval_batch_size: int=1024):
         """Handler for torch models.
 
         This handler is responsible for the training and evaluation of a pytorch model. Thus it
@@ -223,6 +614,8 @@ class TorchModelHandler(ModelHandler):
             The mode in which the model is created/updated
         copy_model : bool, default=True
             Whether to use a copy of the model (i.e., ``net``) or not.
+        eval_batch_size : int, default=1024
+            The batch size of the evaluation. If 0, the data are evaluated in a single batch.
         """
 
         super(TorchModelHandler, self).__init__(create_model_mode)
@@ -235,26 +628,77 @@ class TorchModelHandler(ModelHandler):
         GlobalSettings().auto_device()
         self.device = GlobalSettings().get_device()
         self.counter_local = 0
+        self.eval_batch_size = eval_batch_size
         #self.model = self.model.to(self.device)
 
     def init(self) -> None:
         self.model.init_weights()
 
+    # docstr-coverage:inherited
+    def _materialize(self) -> None:
+        if self._shared:
+            optimizer = self.optimizer
+            super()._materialize()
+            # The copy of a model resident on the device is not tracked, thus it is kept on cpu
+            RESIDENCY.acquire(self.model, "cpu")
+            self.optimizer = _fresh_optimizer(optimizer, self.model.parameters())
+
+    def payload(self) -> ModelPayload:
+        """Returns the payload of the model handler, i.e., a copy of the model's state without
+        the optimizer and the other settings of the handler (see :class:`ModelPayload`).
+
+        Returns
+        -------
+        ModelPayload
+            The payload.
+        """
+
+        return _make_payload(self)
+
+    # docstr-coverage:inherited
+    def unpack(self, value: Any) -> Any:
+        if isinstance(value, ModelPayload):
+            return _unpack_payload(self, value)
+        return super().unpack(value)
+
+    def caching(self, owner: int) -> CacheKey:
+        """Cache the transferable state of the model handler and return the cache key.
+
+        In the modes in which the receivers only merge the received models (i.e.,
+        ``MERGE_UPDATE`` and ``MERGE``) the cached value is the payload of the handler (see
+        :meth:`payload`), otherwise it is a copy-on-write snapshot of the handler (see
+        :meth:`ModelHandler.caching`).
+
+        Parameters
+        ----------
+        owner : int
+            The ID of the client that own of this particular model handler.
+
+        Returns
+        -------
+        CacheKey
+            The cache key corresponding to this model handler in the cache.
+        """
+
+        if self.mode not in self._PAYLOAD_MODES:
+            return super().caching(owner)
+        key = CacheKey(owner, self.n_updates, size=self.get_size())
+        CACHE.push(key, None if key in CACHE.get_cache() else self.payload())
+        return key
+
     def _update(self, data: Tuple[torch.Tensor, torch.Tensor]) -> None:
-        self.model = self.model.to(self.device)
+        RESIDENCY.acquire(self.model, self.device, self.optimizer)
         x, y = data
         batch_size = x.size(0) if not self.batch_size else self.batch_size
         if self.local_epochs > 0:
             for _ in range(self.local_epochs):
-                perm = torch.randperm(x.size(0))
+                perm = torch.randperm(x.size(0), generator=self._generator)
                 x, y = x[perm], y[perm]
                 for i in range(0, x.size(0), batch_size):
                     self._local_step(x[i : i + batch_size], y[i : i + batch_size])
         else:
-            perm = torch.randperm(x.size(0))
+            perm = torch.randperm(x.size(0), generator=self._generator)
             self._local_step(x[perm][:batch_size], y[perm][:batch_size])
-        self.model = self.model.to("cpu")
-        torch.cuda.empty_cache()
     
     def _local_step(self, x:torch.Tensor, y:torch.Tensor) -> None:
         self.counter_local += 1
@@ -274,56 +718,42 @@ class TorchModelHandler(ModelHandler):
         self.n_updates += 1
     
     def _merge(self, other_model_handler: Union[TorchModelHandler, Iterable[TorchModelHandler]]) -> None:
-        dict_params1 = self.model.state_dict()
+        if isinstance(other_model_handler, (TorchModelHandler, ModelPayload)):
+            other_model_handler = [other_model_handler]
+        n_up = max([omh.n_updates for omh in other_model_handler])
 
-        if isinstance(other_model_handler, TorchModelHandler):
-            dicts_params2 = [other_model_handler.model.state_dict()]
-            n_up = other_model_handler.n_updates
-        else:
-            dicts_params2 = [omh.model.state_dict() for omh in other_model_handler]
-            n_up = max([omh.n_updates for omh in other_model_handler])
-
-        # Perform the average overall models including its weights
+        # Perform the average overall models including its weights: the parameters of each model
+        # are a single flat tensor (see _flat_state), thus they are merged in place with one sum
+        # per model, without building (and loading) the state dicts
         # CHECK: whether to allow the merging of the other models before the averaging 
-        div = len(dicts_params2) + 1
-        for key in dict_params1:
-            for dict_params2 in dicts_params2:
-                dict_params1[key] += dict_params2[key]
-            #print(key)
-            if "num_batches_tracked" in key:
-                pass
-            else :
-                dict_params1[key] /= div
-
-        self.model.load_state_dict(dict_params1)
+        flat, rest = _flat_state(self.model)
+        others = [_payload_state(omh, self.model, flat.device) for omh in other_model_handler]
+        div = len(others) + 1
+        with torch.no_grad():
+            for other_flat, _ in others:
+                flat.add_(other_flat)
+            flat.div_(div)
+        _merge_rest(rest, [other_rest for _, other_rest in others], div)
+
         # Gets the maximum number of updates from the merged models
         self.n_updates = max(self.n_updates, n_up) 
 
     def _merge_received(self, other_model_handler: Union[TorchModelHandler, Iterable[TorchModelHandler]]) -> None:
-        print("Merging Sucessfull")
-        dict_params1 = self.model.state_dict()
-
-        if isinstance(other_model_handler, TorchModelHandler):
-            dicts_params2 = [other_model_handler.model.state_dict()]
-            n_up = other_model_handler.n_updates
-        else:
-            dicts_params2 = [omh.model.state_dict() for omh in other_model_handler]
-            n_up = max([omh.n_updates for omh in other_model_handler])
+        if isinstance(other_model_handler, (TorchModelHandler, ModelPayload)):
+            other_model_handler = [other_model_handler]
+        n_up = max([omh.n_updates for omh in other_model_handler])
+
+        # Perform the average overall the received models (see _merge)
+        flat, rest = _flat_state(self.model)
+        others = [_payload_state(omh, self.model, flat.device) for omh in other_model_handler]
+        div = len(others)
+        with torch.no_grad():
+            flat.copy_(others[0][0])
+            for other_flat, _ in others[1:]:
+                flat.add_(other_flat)
+            flat.div_(div)
+        _merge_rest(rest, [other_rest for _, other_rest in others], div, received=True)
 
-        # Perform the average overall models including its weights
-        # CHECK: whether to allow the merging of the other models before the averaging 
-        div = len(dicts_params2)
-        for key in dict_params1:
-            dict_params1[key] = 0
-            for dict_params2 in dicts_params2:
-                dict_params1[key] += dict_params2[key]
-            #print(key)
-            if "num_batches_tracked" in key:
-                pass
-            else :
-                dict_params1[key] /= div
-
-        self.model.load_state_dict(dict_params1)
         # Gets the maximum number of updates from the merged models
         self.n_updates = max(self.n_updates, n_up)
 
@@ -347,39 +777,14 @@ class TorchModelHandler(ModelHandler):
         Currently, only metrics for classification tasks are implemented. Specifically, 
         the evaluation metrics are: ``accuracy``, ``precision``, ``recall``, ``f1``, and,
         when possible, ``roc_auc``.
-        """
 
-        x, y = data
-        x, y = x.to(self.device), y.to(self.device)
-        self.model.eval()
-        self.model = self.model.to(self.device)
-        #self.model = self.model.to("cpu")
-        scores = self.model(x)
-
-        if y.dim() == 1:
-            y_true = y.cpu().numpy().flatten()
-        else:
-            y_true = torch.argmax(y, dim=-1).cpu().numpy().flatten()
-
-        pred = torch.argmax(scores, dim=-1)
-        y_pred = pred.cpu().numpy().flatten()
-        
-        res = {
-            "accuracy": accuracy_score(y_true, y_pred),
-            "precision": precision_score(y_true, y_pred, zero_division=0, average="macro"),
-            "recall": recall_score(y_true, y_pred, zero_division=0, average="macro"),
-            "f1_score": f1_score(y_true, y_pred, zero_division=0, average="macro")
-        }
+        The data go through the model in mini-batches of ``eval_batch_size`` examples, without
+        tracking the gradients, and the metrics are computed from the confusion matrix
+        accumulated over the batches.
+        """
 
-        if scores.shape[1] == 2:
-            auc_scores = scores[:, 1].detach().cpu().numpy().flatten()
-            if len(set(y_true)) == 2:
-                res["auc"] = roc_auc_score(y_true, auc_scores).astype(float)
-            else:
-                res["auc"] = 0.5
-                LOG.warning("# of classes != 2. AUC is set to 0.5.")
-        self.model = self.model.to("cpu")
-        return res
+        RESIDENCY.acquire(self.model, self.device, self.optimizer)
+        return _evaluate_classifier(self.model, data, self.device, self.eval_batch_size)
 
 class AdaLineHandler(ModelHandler):
     def __init__(self,
@@ -471,13 +876,17 @@ class PegasosHandler(AdaLineHandler):
 
 
 class SamplingTMH(TorchModelHandler):
+    # The receivers sample the received model, thus snapshots are sent
+    _PAYLOAD_MODES: Tuple[CreateModelMode, ...] = ()
+
     def __init__(self, sample_size: float, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.sample_size = sample_size
     
     def _merge(self, other_model_handler: SamplingTMH,
                      sample: Dict[int, Optional[Tuple[LongTensor, ...]]]) -> None:
-        TorchModelSampling.merge(sample, self.model, other_model_handler.model)
+        TorchModelSampling.merge(sample, self.model, _on_device_of(other_model_handler.model,
+                                                                   self.model))
     
     def __call__(self,
                  recv_model: Any,
@@ -543,7 +952,8 @@ class PartitionedTMH(TorchModelHandler):
     
     def _merge(self, other_model_handler: PartitionedTMH, id_part: int) -> None:
         w = (self.n_updates[id_part], other_model_handler.n_updates[id_part])
-        self.tm_partition.merge(id_part, self.model, other_model_handler.model, weights=w)
+        self.tm_partition.merge(id_part, self.model,
+                                _on_device_of(other_model_handler.model, self.model), weights=w)
         self.n_updates[id_part] = max(self.n_updates[id_part],
                                       other_model_handler.n_updates[id_part])
     
@@ -567,8 +977,8 @@ class PartitionedTMH(TorchModelHandler):
                         par.grad[t_ids[i]] /= self.n_updates[p]
 
     def caching(self, owner: int) -> CacheKey:
-        key = CacheKey(owner, str(self.n_updates))
-        CACHE.push(key, self.copy())
+        key = CacheKey(owner, str(self.n_updates), size=self.get_size())
+        CACHE.push(key, self.snapshot())
         return key
 
 
@@ -692,6 +1102,8 @@ class WeightedTMH(TorchModelHandler):
                  recv_model: Any,
                  data: Any,
                  weights: Iterable[float]) -> None:
+        if self.mode != CreateModelMode.MERGE_UPDATE:
+            recv_model = self.unpack(recv_model)
         if self.mode == CreateModelMode.UPDATE:
             recv_model._update(data)
             self.model = copy.deepcopy(recv_model.model)
@@ -714,27 +1126,182 @@ class WeightedTMH(TorchModelHandler):
                other_model_handler: Union[TorchModelHandler, Iterable[TorchModelHandler]],
                weights: Iterable[float]) -> None:
         
-        dict_params1 = self.model.state_dict()
+        if isinstance(other_model_handler, (TorchModelHandler, ModelPayload)):
+            other_model_handler = [other_model_handler]
+        n_up = max([omh.n_updates for omh in other_model_handler])
+
+        # Perform the average overall models including its weights: the flat parameters of the
+        # models (see _flat_state) are stacked and merged with a single product
+        weights = list(weights)
+        flat, rest = _flat_state(self.model)
+        states = [_payload_state(omh, self.model, flat.device) for omh in other_model_handler]
+        stacked = torch.stack([flat] + [other_flat for other_flat, _ in states])
+        with torch.no_grad():
+            torch.matmul(torch.as_tensor(weights, dtype=stacked.dtype, device=stacked.device),
+                         stacked, out=flat)
+
+            # The remaining tensors (see _merge_rest): the counters are summed, the other
+            # floating point tensors are weighted as the flat parameters
+            for i, (name, t) in enumerate(rest):
+                if t.is_floating_point() and "num_batches_tracked" not in name:
+                    t.mul_(weights[0])
+                    for w, (_, other_rest) in zip(weights[1:], states):
+                        t.add_(other_rest[i][1].to(t.device), alpha=w)
+                else:
+                    for _, other_rest in states:
+                        t.add_(other_rest[i][1].to(t.device))
 
-        if isinstance(other_model_handler, TorchModelHandler):
-            dicts_params2 = [other_model_handler.model.state_dict()]
-            n_up = other_model_handler.n_updates
+        # Gets the maximum number of updates from the merged models
+        self.n_updates = max(self.n_updates, n_up)
+
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class DryRunHandler(ModelHandler):
+    def __init__(self,
+                 idx: int,
+                 n_nodes: int,
+                 size: int = 0,
+                 create_model_mode: CreateModelMode = CreateModelMode.MERGE_UPDATE):
+        """Model handler that replaces the model with version counters, for "dry runs" of a
+        simulation, i.e., to analyse the communication of a protocol without any training.
+
+        The "model" is the set of the nodes whose (local) data contributed to it, stored as a
+        bitset of ``n_nodes`` bits, and its age is the number of updates (``n_updates``), which
+        is the maximum of the ages of the merged models, as in :class:`TorchModelHandler`.
+        Updating the model adds the owner ``idx`` to the set, and merging models computes the
+        union of their sets. The create model modes behave as in :class:`ModelHandler`.
+
+        Nodes that choose the models according to their evaluation (e.g.,
+        :class:`gossipy.node.PENSNode`) are not supported.
+
+        Parameters
+        ----------
+        idx : int
+            The index of the node owning the handler.
+        n_nodes : int
+            The number of nodes.
+        size : int, default=0
+            The size of the replaced model, used as the size of the messages.
+        create_model_mode : CreateModelMode, default=CreateModelMode.MERGE_UPDATE
+            The mode in which the model is created/updated.
+        """
+
+        super(DryRunHandler, self).__init__(create_model_mode)
+        self.idx = idx
+        self.n_nodes = n_nodes
+        self._model_size = size
+
+    @classmethod
+    def like(cls, model_handler: ModelHandler, idx: int, n_nodes: int) -> DryRunHandler:
+        """Returns the dry run handler replacing ``model_handler`` on node ``idx``.
+
+        Parameters
+        ----------
+        model_handler : ModelHandler
+            The replaced model handler.
+        idx : int
+            The index of the node owning the handler.
+        n_nodes : int
+            The number of nodes.
+
+        Returns
+        -------
+        DryRunHandler
+            The handler with the same size and create model mode of ``model_handler``.
+        """
+
+        return cls(idx, n_nodes, model_handler.get_size(), model_handler.mode)
+
+    # docstr-coverage:inherited
+    def init(self) -> None:
+        self.model = np.zeros((self.n_nodes + 63) // 64, dtype=np.uint64)
+        self.n_updates = 0
+
+    # docstr-coverage:inherited
+    def _update(self, data: Any = None) -> None:
+        self.model[self.idx >> 6] |= np.uint64(1) << np.uint64(self.idx & 63)
+        self.n_updates += 1
+
+    # docstr-coverage:inherited
+    def _merge(self, other_model_handler: Union[DryRunHandler, Iterable[DryRunHandler]]) -> None:
+        others = other_model_handler if isinstance(other_model_handler, (list, tuple)) \
+                 else [other_model_handler]
+        for other in others:
+            self.model |= other.model
+            self.n_updates = max(self.n_updates, other.n_updates)
+
+    # docstr-coverage:inherited
+    def _merge_received(self, other_model_handler: Union[DryRunHandler, Iterable[DryRunHandler]]) -> None:
+        self._merge(other_model_handler)
+
+    def __call__(self,
+                 recv_model: Union[DryRunHandler, Iterable[DryRunHandler]],
+                 data: Any,
+                 *args,
+                 **kwargs) -> None:
+        if self.mode == CreateModelMode.UPDATE:
+            # The received model is updated on the local data, i.e., by the receiver
+            self.model = recv_model.model.copy()
+            self.n_updates = recv_model.n_updates
+            self._update()
+        elif self.mode == CreateModelMode.MERGE_UPDATE:
+            self._merge(recv_model)
+            self._update()
+        elif self.mode == CreateModelMode.UPDATE_MERGE:
+            # Both models are updated on the local data before merging
+            self._merge(recv_model)
+            self._update()
+        elif self.mode == CreateModelMode.PASS:
+            self.model = recv_model.model.copy()
+        elif self.mode == CreateModelMode.MERGE:
+            self._merge_received(recv_model)
         else:
-            dicts_params2 = [omh.model.state_dict() for omh in other_model_handler]
-            n_up = max([omh.n_updates for omh in other_model_handler])
+            raise ValueError("Unknown create model mode %s" %str(self.mode))
 
-        # Perform the average overall models including its weights
-        # CHECK: whether to allow the merging of the other models before the averaging 
-        for key in dict_params1:
-            dict_params1[key] *= weights[0]
-            for i, dict_params2 in enumerate(dicts_params2):
-                dict_params1[key] += dict_params2[key] * weights[i + 1]
+    def coverage(self) -> int:
+        """Returns the number of nodes that contributed to the model.
+
+        Returns
+        -------
+        int
+            The number of nodes in the set of the model.
+        """
+
+        return int(DryRunHandler.popcount(self.model[None]).sum())
+
+    @staticmethod
+    def popcount(bitsets: np.ndarray) -> np.ndarray:
+        """Returns the number of set bits of each row of a matrix of bitsets.
+
+        Parameters
+        ----------
+        bitsets : np.ndarray
+            The (N x W) matrix of 64-bit words.
+
+        Returns
+        -------
+        np.ndarray
+            The number of set bits of each row.
+        """
+
+        return _POPCOUNT[bitsets.view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+    # docstr-coverage:inherited
+    def evaluate(self, *args, **kwargs) -> Dict[str, float]:
+        return {"age": float(self.n_updates), "coverage": self.coverage() / self.n_nodes}
+
+    def __str__(self) -> str:
+        return "DryRunHandler(idx=%d, n_updates=%d, mode=%s)" %(self.idx, self.n_updates, self.mode)
 
-        self.model.load_state_dict(dict_params1)
-        # Gets the maximum number of updates from the merged models
-        self.n_updates = max(self.n_updates, n_up)
 
 class NewTorchModelHandler(ModelHandler):
+    eval_batch_size: int = 1024
+    _SNAPSHOT_EXCLUDE: Tuple[str, ...] = ("optimizer", "scheduler")
+    _PAYLOAD_MODES: Tuple[CreateModelMode, ...] = (CreateModelMode.MERGE_UPDATE,
+                                                   CreateModelMode.MERGE)
+
     def __init__(self,
                  net: TorchModel,
                  optimizer: torch.optim.Optimizer,
@@ -745,7 +1312,8 @@ class NewTorchModelHandler(ModelHandler):
                  create_model_mode: CreateModelMode=CreateModelMode.MERGE_UPDATE,
                  copy_model=True,
                  scheduler=None,
-                 scheduler_params=None):
+                 scheduler_params=None,
+                 eval_batch_size: int=1024):
         """Handler for torch models.
 
         This handler is responsible for the training and evaluation of a pytorch model. Thus it
@@ -775,6 +1343,8 @@ class NewTorchModelHandler(ModelHandler):
             The learning rate scheduler to use.
         scheduler_params : Dict[str, Any], default=None
             The parameters of the scheduler.
+        eval_batch_size : int, default=1024
+            The batch size of the evaluation. If 0, the data are evaluated in a single batch.
         """
 
         super(NewTorchModelHandler, self).__init__(create_model_mode)
@@ -788,26 +1358,85 @@ class NewTorchModelHandler(ModelHandler):
         GlobalSettings().auto_device()
         self.device = GlobalSettings().get_device()
         self.counter_local = 0
+        self.eval_batch_size = eval_batch_size
 
     def init(self) -> None:
         self.model.init_weights()
 
+    # docstr-coverage:inherited
+    def _materialize(self) -> None:
+        if self._shared:
+            optimizer, scheduler = self.optimizer, self.scheduler
+            super()._materialize()
+            # The copy of a model resident on the device is not tracked, thus it is kept on cpu
+            RESIDENCY.acquire(self.model, "cpu")
+            self.optimizer = _fresh_optimizer(optimizer, self.model.parameters())
+            if scheduler:
+                self.scheduler = copy.copy(scheduler)
+                self.scheduler.optimizer = self.optimizer
+
+    def payload(self) -> ModelPayload:
+        """Returns the payload of the model handler, i.e., a copy of the model's state without
+        the optimizer and the other settings of the handler (see :class:`ModelPayload`).
+
+        Returns
+        -------
+        ModelPayload
+            The payload.
+        """
+
+        return _make_payload(self)
+
+    # docstr-coverage:inherited
+    def unpack(self, value: Any) -> Any:
+        if isinstance(value, ModelPayload):
+            unpacked = _unpack_payload(self, value)
+            if unpacked.scheduler:
+                unpacked.scheduler = copy.copy(unpacked.scheduler)
+                unpacked.scheduler.optimizer = unpacked.optimizer
+            return unpacked
+        return super().unpack(value)
+
+    def caching(self, owner: int) -> CacheKey:
+        """Cache the transferable state of the model handler and return the cache key.
+
+        In the modes in which the receivers only merge the received models (i.e.,
+        ``MERGE_UPDATE`` and ``MERGE``) the cached value is the payload of the handler (see
+        :meth:`payload`), otherwise it is a copy-on-write snapshot of the handler (see
+        :meth:`ModelHandler.caching`).
+
+        Parameters
+        ----------
+        owner : int
+            The ID of the client that own of this particular model handler.
+
+        Returns
+        -------
+        CacheKey
+            The cache key corresponding to this model handler in the cache.
+        """
+
+        if self.mode not in self._PAYLOAD_MODES:
+            return super().caching(owner)
+        key = CacheKey(owner, self.n_updates, size=self.get_size())
+        CACHE.push(key, None if key in CACHE.get_cache() else self.payload())
+        return key
+
     def _update(self, data: Tuple[torch.Tensor, torch.Tensor]) -> None:
-        self.model = self.model.to(self.device)
+        RESIDENCY.acquire(self.model, self.device, self.optimizer)
         x, y = data
         batch_size = x.size(0) if not self.batch_size else self.batch_size
         if self.local_epochs > 0:
             for epoch in range(self.local_epochs):
-                perm = torch.randperm(x.size(0))
+                perm = torch.randperm(x.size(0), generator=self._generator)
                 x, y = x[perm], y[perm]
                 for i in range(0, x.size(0), batch_size):
                     self._local_step(x[i : i + batch_size], y[i : i + batch_size])
                 if self.scheduler:
                     self.scheduler.step()  # Update the scheduler at the end of each epoch
         else:
-            perm = torch.randperm(x.size(0))
+            perm = torch.randperm(x.size(0), generator=self._generator)
             self._local_step(x[perm][:batch_size], y[perm][:batch_size])
-        self.model = self.model.to("cpu")
     
     def _local_step(self, x:torch.Tensor, y:torch.Tensor) -> None:
         self.counter_local += 1
@@ -823,80 +1452,40 @@ class NewTorchModelHandler(ModelHandler):
         self.n_updates += 1
     
     def _merge(self, other_model_handler: Union[NewTorchModelHandler, Iterable[NewTorchModelHandler]]) -> None:
-        dict_params1 = self.model.state_dict()
-
-        if isinstance(other_model_handler, NewTorchModelHandler):
-            dicts_params2 = [other_model_handler.model.state_dict()]
-            n_up = other_model_handler.n_updates
-        else:
-            dicts_params2 = [omh.model.state_dict() for omh in other_model_handler]
-            n_up = max([omh.n_updates for omh in other_model_handler])
-
-        div = len(dicts_params2) + 1
-        for key in dict_params1:
-            for dict_params2 in dicts_params2:
-                dict_params1[key] += dict_params2[key]
-            if "num_batches_tracked" in key:
-                pass
-            else:
-                dict_params1[key] /= div
+        if isinstance(other_model_handler, (NewTorchModelHandler, ModelPayload)):
+            other_model_handler = [other_model_handler]
+        n_up = max([omh.n_updates for omh in other_model_handler])
+
+        # Perform the average overall models including its weights (see TorchModelHandler._merge)
+        flat, rest = _flat_state(self.model)
+        others = [_payload_state(omh, self.model, flat.device) for omh in other_model_handler]
+        div = len(others) + 1
+        with torch.no_grad():
+            for other_flat, _ in others:
+                flat.add_(other_flat)
+            flat.div_(div)
+        _merge_rest(rest, [other_rest for _, other_rest in others], div)
 
-        self.model.load_state_dict(dict_params1)
         self.n_updates = max(self.n_updates, n_up) 
 
     def _merge_received(self, other_model_handler: Union[NewTorchModelHandler, Iterable[NewTorchModelHandler]]) -> None:
-        print("Merging Sucessfull")
-        dict_params1 = self.model.state_dict()
+        if isinstance(other_model_handler, (NewTorchModelHandler, ModelPayload)):
+            other_model_handler = [other_model_handler]
+        n_up = max([omh.n_updates for omh in other_model_handler])
 
-        if isinstance(other_model_handler, NewTorchModelHandler):
-            dicts_params2 = [other_model_handler.model.state_dict()]
-            n_up = other_model_handler.n_updates
-        else:
-            dicts_params2 = [omh.model.state_dict() for omh in other_model_handler]
-            n_up = max([omh.n_updates for omh in other_model_handler])
-
-        div = len(dicts_params2)
-        for key in dict_params1:
-            dict_params1[key] = 0
-            for dict_params2 in dicts_params2:
-                dict_params1[key] += dict_params2[key]
-            if "num_batches_tracked" in key:
-                pass
-            else:
-                dict_params1[key] /= div
+        flat, rest = _flat_state(self.model)
+        others = [_payload_state(omh, self.model, flat.device) for omh in other_model_handler]
+        div = len(others)
+        with torch.no_grad():
+            flat.copy_(others[0][0])
+            for other_flat, _ in others[1:]:
+                flat.add_(other_flat)
+            flat.div_(div)
+        _merge_rest(rest, [other_rest for _, other_rest in others], div, received=True)
 
-        self.model.load_state_dict(dict_params1)
         self.n_updates = max(self.n_updates, n_up)
 
     def evaluate(self,
                  data: Tuple[torch.Tensor, torch.Tensor]) -> Dict[str, int]:
-        x, y = data
-        x, y = x.to(self.device), y.to(self.device)
-        self.model.eval()
-        self.model = self.model.to(self.device)
-        scores = self.model(x)
-
-        if y.dim() == 1:
-            y_true = y.cpu().numpy().flatten()
-        else:
-            y_true = torch.argmax(y, dim=-1).cpu().numpy().flatten()
-
-        pred = torch.argmax(scores, dim=-1)
-        y_pred = pred.cpu().numpy().flatten()
-        
-        res = {
-            "accuracy": accuracy_score(y_true, y_pred),
-            "precision": precision_score(y_true, y_pred, zero_division=0, average="macro"),
-            "recall": recall_score(y_true, y_pred, zero_division=0, average="macro"),
-            "f1_score": f1_score(y_true, y_pred, zero_division=0, average="macro")
-        }
-
-        if scores.shape[1] == 2:
-            auc_scores = scores[:, 1].detach().cpu().numpy().flatten()
-            if len(set(y_true)) == 2:
-                res["auc"] = roc_auc_score(y_true, auc_scores).astype(float)
-            else:
-                res["auc"] = 0.5
-                LOG.warning("# of classes != 2. AUC is set to 0.5.")
-        self.model = self.model.to("cpu")
-        return res
\ No newline at end of file
+        RESIDENCY.acquire(self.model, self.device, self.optimizer)
+        return _evaluate_classifier(self.model, data, self.device, self.eval_batch_size)
\ No newline at end of file
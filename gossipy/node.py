@@ -5,13 +5,13 @@ import numpy as np
 from numpy.random import randint, normal, rand
 from numpy import ndarray
 from torch import Tensor
-from typing import Any, Optional, Union, Dict, Tuple, Iterable
+from typing import Any, List, Optional, Sequence, Union, Dict, Tuple, Iterable
 from gossipy.data import DataDispatcher
-from . import CACHE, LOG
-from .core import AntiEntropyProtocol, CreateModelMode, MessageType, Message, P2PNetwork
-from .utils import choice_not_n
+from . import CACHE, LOG, CacheKey
+from .core import AntiEntropyProtocol, CreateModelMode, MessageType, Message, MixingMatrix, P2PNetwork
 from .model.handler import ModelHandler, PartitionedTMH, SamplingTMH, TorchModelHandler, WeightedTMH
 from .model.sampling import TorchModelSampling
+from .compression import Compression, CompressedPayload
 from gossipy.attacks.ra.ra import *
 
 
@@ -34,6 +34,12 @@ __all__ = ["GossipNode",
 
 
 class GossipNode():
+    rng: Optional[np.random.Generator] = None
+    compression: Optional[Compression] = None
+    _references: Optional[Dict[int, Tuple[Tensor, int, Dict[int, Tensor]]]] = None
+    # Whether the receive method of the class decompresses the received models (see _unpack)
+    _decompresses: bool = True
+
     def __init__(self,
                  idx: int, #node's id
                  data: Union[Tuple[Tensor, Optional[Tensor]],
@@ -95,6 +101,88 @@ class GossipNode():
         if local_train:
             self.model_handler._update(self.data[0])
 
+    def seed(self, seed_seq: np.random.SeedSequence) -> None:
+        """Gives the node its own random number streams, i.e., a numpy generator for the choices
+        of the node and a torch generator for its model handler (see :meth:`ModelHandler.seed`).
+
+        Since the streams are independent of the global random state and of each other, the
+        outcome of the actions of a node does not depend on the order in which the nodes act.
+        Without them, the global random number generators are used.
+
+        Parameters
+        ----------
+        seed_seq : np.random.SeedSequence
+            The seed sequence of the node, e.g., spawned from the seed of the simulation.
+        """
+
+        np_seq, torch_seq = seed_seq.spawn(2)
+        self.rng = np.random.default_rng(np_seq)
+        self.model_handler.seed(int(torch_seq.generate_state(1, np.uint64)[0] >> np.uint64(1)))
+
+    def _choice(self, seq: Sequence[Any]) -> Any:
+        # Picks a random element using the stream of the node (if any)
+        if self.rng is None:
+            return random.choice(seq)
+        return seq[int(self.rng.integers(len(seq)))]
+
+    def _random(self) -> float:
+        # A random number in [0, 1) drawn from the stream of the node (if any)
+        return self.rng.random() if self.rng is not None else rand()
+
+    def set_compression(self, compression: Optional[Compression]) -> None:
+        """Sets the compression stage of the models sent by the node (see
+        :class:`gossipy.compression.Compression`). The node gets its own copy of the stage.
+
+        The compressed messages are sized in bytes (see
+        :meth:`gossipy.compression.CompressedPayload.get_size`), thus the simulation reports and
+        the size-dependent delays reflect the actual traffic. Only the models of handlers that
+        provide a payload (see :meth:`gossipy.model.handler.TorchModelHandler.payload`) are
+        compressed. Nodes whose :meth:`receive` does not decompress the received models do not
+        support compression.
+
+        Parameters
+        ----------
+        compression : Compression or None
+            The compression stage. If `None`, the models are not compressed.
+        """
+
+        owner = next(c for c in type(self).__mro__ if "receive" in vars(c))
+        assert compression is None or vars(owner).get("_decompresses", False), \
+            "%s does not support compression." % type(self).__name__
+        self.compression = compression.copy() if compression is not None else None
+
+    def _pack(self, peer: int) -> CacheKey:
+        # Caches the model to send to peer, compressed if the node has a compression stage
+        if self.compression is None or not hasattr(self.model_handler, "payload"):
+            return self.model_handler.caching(self.idx)
+        value = self.compression.compress(self.model_handler.payload(), self.idx, peer)
+        key = CacheKey(self.idx, peer, value.seq, size=value.get_size())
+        CACHE.push(key, value)
+        return key
+
+    def _unpack(self, value: Any) -> Any:
+        # Decompresses a received (compressed) model: None if it cannot be decompressed
+        if isinstance(value, CompressedPayload):
+            if self._references is None:
+                self._references = {}
+            return value.decompress(self._references)
+        return value
+
+    def discarded(self, msg: Message) -> None:
+        """Notifies the node that one of its messages will never be received (e.g., because it
+        has been dropped or its receiver is offline). If the node compresses its models, the
+        next message to the receiver is a full one (see
+        :meth:`gossipy.compression.Compression.resync`).
+
+        Parameters
+        ----------
+        msg : Message
+            The discarded message.
+        """
+
+        if self.compression is not None:
+            self.compression.resync(msg.receiver)
+
     def get_peer(self) -> int:
         """Picks a random peer from the reachable nodes.
 
@@ -105,10 +193,10 @@ class GossipNode():
         """
 
         peers = self.p2p_net.get_peers(self.idx)
-        if not peers:
+        if not len(peers):
             LOG.warning("Node %d has no peers.", self.idx)
             return None
-        return random.choice(peers) if peers else choice_not_n(0, self.p2p_net.size(), self.idx)
+        return int(self._choice(peers))
         
     def timed_out(self, t: int) -> bool:
         """Checks whether the node has timed out.
@@ -126,6 +214,30 @@ class GossipNode():
 
         return ((t % self.round_len) == self.delta) if self.sync else ((t % self.delta) == 0)
 
+    def next_timeout(self, t: int) -> int:
+        """Returns the first timestamp, not earlier than ``t``, at which the node times out.
+
+        The returned timestamp is consistent with :meth:`timed_out`, i.e., ``timed_out`` returns
+        `True` for the returned value and `False` for every timestamp between ``t`` and the
+        returned value. This allows event-driven simulators to schedule the node's wake-ups
+        without polling the node at every timestep.
+
+        Parameters
+        ----------
+        t : int
+            The timestamp from which the search starts.
+
+        Returns
+        -------
+        int
+            The timestamp of the next time out.
+        """
+
+        if self.sync:
+            nt = t - (t % self.round_len) + self.delta
+            return nt if nt >= t else nt + self.round_len
+        return -(-t // self.delta) * self.delta
+
     def send(self,
              t: int,
              peer: int,
@@ -160,12 +272,12 @@ class GossipNode():
         """
 
         if protocol == AntiEntropyProtocol.PUSH:
-            key = self.model_handler.caching(self.idx)
+            key = self._pack(peer)
             return Message(t, self.idx, peer, MessageType.PUSH, (key,))
         elif protocol == AntiEntropyProtocol.PULL:
             return Message(t, self.idx, peer, MessageType.PULL, None)
         elif protocol == AntiEntropyProtocol.PUSH_PULL:
-            key = self.model_handler.caching(self.idx)
+            key = self._pack(peer)
             return Message(t, self.idx, peer, MessageType.PUSH_PULL, (key,))
         else:
             raise ValueError("Unknown protocol %s." %protocol)
@@ -196,12 +308,13 @@ class GossipNode():
         if msg_type == MessageType.PUSH or \
            msg_type == MessageType.REPLY or \
            msg_type == MessageType.PUSH_PULL:
-            recv_model = CACHE.pop(recv_model)
-            self.model_handler(recv_model, self.data[0])
+            recv_model = self._unpack(CACHE.pop(recv_model))
+            if recv_model is not None:
+                self.model_handler(recv_model, self.data[0])
 
         if msg_type == MessageType.PULL or \
            msg_type == MessageType.PUSH_PULL:
-            key = self.model_handler.caching(self.idx)
+            key = self._pack(msg.sender)
             return Message(t, self.idx, msg.sender, MessageType.REPLY, (key,))
         return None
 
@@ -375,7 +488,7 @@ class PassThroughNode(GossipNode):
             
             (recv_model, deg) = msg.value
             recv_model = CACHE.pop(recv_model)
-            if  rand() < min(1, deg / self.n_neighs):
+            if  self._random() < min(1, deg / self.n_neighs):
                 self.model_handler(recv_model, self.data[0])
             else: #PASSTHROUGH
                 prev_mode = self.model_handler.mode
@@ -448,7 +561,7 @@ class CacheNeighNode(GossipNode):
 
         if protocol == AntiEntropyProtocol.PUSH:
             if self.local_cache:
-                k = random.choice(set(self.local_cache.keys()))
+                k = self._choice(list(self.local_cache.keys()))
                 cached_model = CACHE.pop(self.local_cache[k])
                 del self.local_cache[k]
                 self.model_handler(cached_model, self.data[0])
@@ -462,7 +575,7 @@ class CacheNeighNode(GossipNode):
             return Message(t, self.idx, peer, MessageType.PULL, None)
         elif protocol == AntiEntropyProtocol.PUSH_PULL:
             if self.local_cache:
-                k = random.choice(set(self.local_cache.keys()))
+                k = self._choice(list(self.local_cache.keys()))
                 cached_model = CACHE.pop(self.local_cache[k])
                 del self.local_cache[k]
                 self.model_handler(cached_model, self.data[0])
@@ -616,7 +729,7 @@ class PartitioningBasedNode(GossipNode):
              protocol: AntiEntropyProtocol) -> Union[Message, None]:
 
         if protocol == AntiEntropyProtocol.PUSH:
-            pid = np.random.randint(0, self.model_handler.tm_partition.n_parts)
+            pid = self._choice(range(self.model_handler.tm_partition.n_parts))
             key = self.model_handler.caching(self.idx)
             return Message(t,
                            self.idx,
@@ -626,7 +739,7 @@ class PartitioningBasedNode(GossipNode):
         elif protocol == AntiEntropyProtocol.PULL:
             return Message(t, self.idx, peer, MessageType.PULL, None)
         elif protocol == AntiEntropyProtocol.PUSH_PULL:
-            pid = np.random.randint(0, self.model_handler.tm_partition.n_parts)
+            pid = self._choice(range(self.model_handler.tm_partition.n_parts))
             key = self.model_handler.caching(self.idx)
             return Message(t,
                            self.idx,
@@ -651,7 +764,7 @@ class PartitioningBasedNode(GossipNode):
 
         if msg_type == MessageType.PULL or \
            msg_type == MessageType.PUSH_PULL:
-            pid = np.random.randint(0, self.model_handler.tm_partition.n_parts)
+            pid = self._choice(range(self.model_handler.tm_partition.n_parts))
             key = self.model_handler.caching(self.idx)
             return Message(t,
                            self.idx,
@@ -717,7 +830,7 @@ class PENSNode(GossipNode):
         self.n_sampled = n_sampled
         self.m_top = m_top
         known_nodes = p2p_net.get_peers(self.idx)
-        if not known_nodes:
+        if not len(known_nodes):
             known_nodes = list(range(0, self.idx)) + list(range(self.idx + 1, self.p2p_net.size()))
         self.neigh_counter = {i: 0 for i in known_nodes}
         self.selected = {i: 0 for i in known_nodes}
@@ -748,7 +861,7 @@ class PENSNode(GossipNode):
                 self.selected[peer] += 1
             return peer
 
-        return random.choice(self.best_nodes)
+        return self._choice(self.best_nodes)
 
     # docstr-coverage:inherited
     def send(self,
@@ -771,7 +884,7 @@ class PENSNode(GossipNode):
             LOG.warning("PENSNode only supports PUSH protocol.")
 
         if self.step == 1:
-            evaluation = CACHE[recv_model].evaluate(self.data[0])
+            evaluation = self.model_handler.unpack(CACHE[recv_model]).evaluate(self.data[0])
             # TODO: move performance metric as a parameter of the node
             self.cache[sender] = (recv_model, -evaluation["accuracy"]) # keep the last model for the peer 'sender'
 
@@ -789,6 +902,8 @@ class PENSNode(GossipNode):
 
 # Koloskova et al. 2020
 class All2AllGossipNode(GossipNode):
+    _decompresses: bool = True
+
     def __init__(self,
                  idx: int, #node's id
                  data: Union[Tuple[Tensor, Optional[Tensor]],
@@ -831,19 +946,55 @@ class All2AllGossipNode(GossipNode):
                                         sync)
         self.local_cache = {}
     
-    # docstr-coverage:inherited
-    def timed_out(self, t: int, weights: Iterable[float]) -> int:
+    def timed_out(self, t: int, W_matrix: MixingMatrix) -> int:
+        """Checks whether the node has timed out and, in such a case, merges the received models.
+
+        The weights of the merge are those of the row of the node in the mixing matrix, aligned
+        with the senders of the received models.
+
+        Parameters
+        ----------
+        t : int
+            The current timestamp.
+        W_matrix : MixingMatrix
+            The mixing matrix.
+
+        Returns
+        -------
+        bool
+            Whether the node has timed out.
+        """
+
         tout = super().timed_out(t)
         if tout and self.local_cache:
-            # if not self.use_mh:
-            #     weights = [1.0 /(1 + len(self.local_cache))] * (len(self.local_cache) + 1)
-            # else:
-            #     n = self.p2p_net.size(self.idx)
-            #     weights = [1./n] + [1. / (min(self.p2p_net.size(k), n) + 1) for k in self.local_cache]
-            self.model_handler([CACHE.pop(k) for k in self.local_cache.values()], self.data[0], weights)
+            # The models that cannot be decompressed are merged with no weight
+            senders, models = [self.idx], []
+            for sender, key in self.local_cache.items():
+                model = self._unpack(CACHE.pop(key))
+                if model is not None:
+                    senders.append(sender)
+                    models.append(model)
             self.local_cache = {}
+            if models:
+                weights = self._merge_weights(W_matrix, senders)
+                self.model_handler(models, self.data[0], weights)
         return tout 
 
+    def _merge_weights(self, W_matrix: MixingMatrix, senders: List[int]) -> np.ndarray:
+        # The weights of the senders in the row of the node, normalized to sum up to 1: the
+        # senders that are not in the row (e.g., after a change of the topology) get no weight
+        indices, values = W_matrix.row(self.idx)
+        weights = np.zeros(len(senders))
+        if len(indices):
+            pos = np.minimum(np.searchsorted(indices, senders), len(indices) - 1)
+            found = indices[pos] == senders
+            weights[found] = values[pos[found]]
+        total = weights.sum()
+        if total <= 0:
+            LOG.warning("Node %d has no mixing weights for the received models.", self.idx)
+            return np.full(len(senders), 1. / len(senders))
+        return weights / total
+
     def get_peers(self) -> int:
         return self.p2p_net.get_peers(self.idx)
 
@@ -866,7 +1017,8 @@ class All2AllGossipNode(GossipNode):
         if msg_type == MessageType.PUSH:
             # this should never happen
             if sender in self.local_cache:
-                CACHE.pop(self.local_cache[sender])
+                # Decompressed anyway, to keep the reference of the sender in sync
+                self._unpack(CACHE.pop(self.local_cache[sender]))
             self.local_cache[sender] = recv_model
 
         return None
@@ -948,10 +1100,10 @@ class FederatedGossipNode(GossipNode):
         """
 
         peers = self.p2p_net.get_peers(self.idx)
-        if not peers:
+        if not len(peers):
             LOG.warning("Node %d has no peers.", self.idx)
             return None
-        return random.choice(peers) if peers else choice_not_n(0, self.p2p_net.size(), self.idx)
+        return int(self._choice(peers))
 
     def timed_out(self, t: int) -> bool:
         """Checks whether the node has timed out.
@@ -1225,10 +1377,10 @@ class AttackGossipNode(GossipNode):
         """
 
         peers = self.p2p_net.get_peers(self.idx)
-        if not peers:
+        if not len(peers):
             LOG.warning("Node %d has no peers.", self.idx)
             return None
-        return random.choice(peers) if peers else choice_not_n(0, self.p2p_net.size(), self.idx)
+        return int(self._choice(peers))
         
     def timed_out(self, t: int) -> bool:
         """Checks whether the node has timed out.
@@ -1331,6 +1483,7 @@ class AttackGossipNode(GossipNode):
                             self.received_models.pop(i)
                             break
                         
+                    recv_model = self.model_handler.unpack(recv_model)
                     self.received_models.append((msg.sender,  recv_model.model.state_dict()))
                     expected_peers = set(self.p2p_net.get_peers(self.idx))
                     received_peers = set(pair[0] for pair in self.received_models)
@@ -1525,10 +1678,10 @@ class FederatedAttackGossipNode(GossipNode):
         """
 
         peers = self.p2p_net.get_peers(self.idx)
-        if not peers:
+        if not len(peers):
             LOG.warning("Node %d has no peers.", self.idx)
             return None
-        return random.choice(peers) if peers else choice_not_n(0, self.p2p_net.size(), self.idx)
+        return int(self._choice(peers))
 
     def timed_out(self, t: int) -> bool:
         """Checks whether the node has timed out.
@@ -0,0 +1,494 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+import copy
+import io
+import multiprocessing
+import pickle
+import random
+import numpy as np
+import torch
+import torch.multiprocessing as tmp
+import dill
+from torch.func import functional_call, grad, vmap
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from . import CACHE, LOG, GlobalSettings
+from .core import CreateModelMode, Message, MessageType
+from .node import GossipNode
+from .model.handler import ModelHandler, ModelPayload, TorchModelHandler
+
+if TYPE_CHECKING:
+    from .simul import GossipSimulator
+
+# AUTHORSHIP
+__version__ = "0.0.1"
+__author__ = "Mirko Polato"
+__copyright__ = "Copyright 2022, gossipy"
+__license__ = "Apache License, Version 2.0"
+__maintainer__ = "Mirko Polato, PhD"
+__email__ = "mak1788@gmail.com"
+__status__ = "Development"
+#
+
+__all__ = ["ReceiveExecutor",
+           "ProcessPoolExecutor",
+           "BatchedTorchExecutor"]
+
+
+class ReceiveExecutor(ABC):
+    _seeds: Dict[int, int]
+
+    def __init__(self):
+        """Abstract class for the executors of the message deliveries of a simulation.
+
+        When an executor is attached to a :class:`gossipy.simul.GossipSimulator`, the messages
+        delivered in the same timestep are grouped into *waves*, i.e., sets of messages directed
+        to distinct (online) receivers such that no earlier message to the same receiver is still
+        pending. The receivers of a wave are independent of each other and thus their
+        :meth:`gossipy.node.GossipNode.receive` can be executed in any order (or concurrently).
+        The results are then committed in the delivery order.
+
+        The nodes draw from their own random number streams (see
+        :meth:`gossipy.node.GossipNode.seed`), hence the outcome of a seeded simulation does not
+        depend on how (or where) the receives are actually executed, and it is the same of the
+        sequential execution. Moreover, each receive of a wave is executed with the global random
+        number generators seeded by the message (without consuming the global random state), so
+        that also the code that draws from them (e.g., dropout) does not depend on the
+        execution order.
+        """
+
+        self._seeds = {}
+
+    def plan(self, simulator: GossipSimulator, t: int, msgs: List[Message]) -> None:
+        """Forms the next wave starting from the first message of ``msgs`` and executes it.
+
+        Parameters
+        ----------
+        simulator : GossipSimulator
+            The simulator delivering the messages.
+        t : int
+            The current timestamp.
+        msgs : list of Message
+            The messages to be delivered (in delivery order).
+        """
+
+        # A message joins the wave only if no earlier (pending) message is directed to the same
+        # receiver, so that the receives of the wave are independent of the uncommitted ones.
+        wave, receivers = [], set()
+        for msg in msgs:
+            if msg.receiver in receivers:
+                continue
+            receivers.add(msg.receiver)
+            if msg in self or not simulator._is_online(msg.receiver):
+                continue
+            wave.append(msg)
+
+        for msg in wave:
+            self._seeds[id(msg)] = _message_seed(t, msg)
+        self._execute(simulator, t, wave)
+
+    def __contains__(self, msg: Message) -> bool:
+        return id(msg) in self._seeds
+
+    @abstractmethod
+    def _execute(self, simulator: GossipSimulator, t: int, wave: List[Message]) -> None:
+        """Executes (or prepares the execution of) the receives of a wave.
+
+        Parameters
+        ----------
+        simulator : GossipSimulator
+            The simulator delivering the messages.
+        t : int
+            The current timestamp.
+        wave : list of Message
+            The messages of the wave.
+        """
+
+        pass
+
+    def receive(self, simulator: GossipSimulator, t: int, msg: Message) -> Optional[Message]:
+        """Delivers the message to its receiver and returns the (optional) reply.
+
+        If the message belongs to a wave, the receive is executed with the seed of the message
+        (without altering the global random state) unless its result is already available.
+
+        Parameters
+        ----------
+        simulator : GossipSimulator
+            The simulator delivering the message.
+        t : int
+            The current timestamp.
+        msg : Message
+            The message to deliver.
+
+        Returns
+        -------
+        Message or None
+            The reply to the message, if any.
+        """
+
+        seed = self._seeds.pop(id(msg), None)
+        node = simulator.nodes[msg.receiver]
+        if seed is None:
+            return node.receive(t, msg)
+
+        states = (random.getstate(), np.random.get_state(), torch.get_rng_state())
+        try:
+            _seed_all(seed)
+            return node.receive(t, msg)
+        finally:
+            random.setstate(states[0])
+            np.random.set_state(states[1])
+            torch.set_rng_state(states[2])
+
+
+def _message_seed(t: int, msg: Message) -> int:
+    seq = np.random.SeedSequence([t, msg.sender, msg.receiver, msg.type.value])
+    return int(seq.generate_state(1)[0] >> 1)
+
+
+def _seed_all(seed: int) -> None:
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+class _TensorPickler(pickle.Pickler):
+    def __init__(self, file: io.BytesIO, tensors: List[torch.Tensor]):
+        super().__init__(file)
+        self._tensors = tensors
+
+    def persistent_id(self, obj: Any) -> Optional[int]:
+        if isinstance(obj, torch.Tensor):
+            self._tensors.append(obj)
+            return len(self._tensors) - 1
+        return None
+
+
+class _DillTensorPickler(dill.Pickler):
+    persistent_id = _TensorPickler.persistent_id
+
+    def __init__(self, file: io.BytesIO, tensors: List[torch.Tensor]):
+        super().__init__(file)
+        self._tensors = tensors
+
+
+class _TensorUnpickler(pickle.Unpickler):
+    def __init__(self, file: io.BytesIO, tensors: List[torch.Tensor]):
+        super().__init__(file)
+        self._tensors = tensors
+
+    def persistent_load(self, pid: int) -> torch.Tensor:
+        return self._tensors[pid]
+
+
+def _dumps(obj: Any) -> Tuple[bytes, List[torch.Tensor]]:
+    # The tensors are pickled out-of-band by the pool (i.e., moved to shared memory) while the
+    # rest of the object is pickled in-band. dill is used only for the objects that cannot be
+    # pickled otherwise, e.g., lambda criterions.
+    for pickler in (_TensorPickler, _DillTensorPickler):
+        tensors = []
+        buf = io.BytesIO()
+        try:
+            pickler(buf, tensors).dump(obj)
+            return buf.getvalue(), tensors
+        except (pickle.PicklingError, AttributeError, TypeError):
+            if pickler is _DillTensorPickler:
+                raise
+
+
+def _loads(data: bytes, tensors: List[torch.Tensor]) -> Any:
+    return _TensorUnpickler(io.BytesIO(data), tensors).load()
+
+
+# The context of the current wave. It is set by the parent process right before forking the
+# workers, so the workers inherit (copy-on-write) the whole state of the simulation.
+_WAVE_CONTEXT: Optional[Tuple[GossipSimulator, int, List[Message], List[int], int]] = None
+
+
+def _worker_receive(i: int) -> Tuple[bytes, List[torch.Tensor]]:
+    simulator, t, wave, seeds, n_threads = _WAVE_CONTEXT
+    torch.set_num_threads(n_threads)
+    msg = wave[i]
+    node = simulator.nodes[msg.receiver]
+    refs = {k: item._refs for k, item in CACHE.get_cache().items()}
+
+    _seed_all(seeds[i])
+    reply = node.receive(t, msg)
+
+    popped, pushed = [], []
+    cache = CACHE.get_cache()
+    for k, n in refs.items():
+        diff = n - (cache[k]._refs if k in cache else 0)
+        if diff > 0:
+            popped.append((k, diff))
+    for k, item in cache.items():
+        diff = item._refs - refs.get(k, 0)
+        if diff > 0:
+            pushed.append((k, item.get(), diff))
+
+    state = {k: v for k, v in node.__dict__.items() if k not in ProcessPoolExecutor.SKIP_ATTRS}
+    return _dumps((state, reply, popped, pushed))
+
+
+class ProcessPoolExecutor(ReceiveExecutor):
+    SKIP_ATTRS: Tuple[str, ...] = ("data", "p2p_net")
+    """Attributes of the nodes that are never modified by a receive and hence not sent back."""
+
+    def __init__(self, n_workers: int = 2, threads_per_worker: int = 1):
+        """Executes the receives of a wave concurrently in a pool of processes.
+
+        The worker processes are forked right before the execution of each wave, hence they share
+        (copy-on-write) the state of the simulation, including the models' cache and the models'
+        weights, which are not copied. The updated state of each receiver (its attributes except
+        the ones in :attr:`SKIP_ATTRS`), the reply and the changes to the models' cache are sent
+        back to the main process through shared memory (the tensors are not serialized) and
+        committed in the delivery order.
+
+        The parallel execution is worth only when the update of the models is expensive (e.g.,
+        deep networks trained for several local epochs), since forking the workers has a cost.
+        Waves with a single message are executed in the main process. Since each receive has its
+        own seed, the results of a seeded simulation do not depend on the number of workers.
+
+        Parameters
+        ----------
+        n_workers : int, default=2
+            The maximum number of worker processes.
+        threads_per_worker : int, default=1
+            The number of threads used by torch in each receive (see :func:`torch.set_num_threads`).
+
+        Notes
+        -----
+        The executor requires the ``fork`` start method and the models to be trained on CPU.
+        Otherwise, the receives are executed sequentially in the main process.
+        """
+
+        super(ProcessPoolExecutor, self).__init__()
+        assert n_workers > 0, "n_workers must be positive."
+        assert threads_per_worker > 0, "threads_per_worker must be positive."
+        self.n_workers = n_workers
+        self.threads_per_worker = threads_per_worker
+        self._results = {}
+        self._enabled = "fork" in multiprocessing.get_all_start_methods()
+        if not self._enabled:
+            LOG.warning("The 'fork' start method is not available: receives are executed sequentially.")
+
+    # docstr-coverage:inherited
+    def _execute(self, simulator: GossipSimulator, t: int, wave: List[Message]) -> None:
+        if len(wave) < 2 or self.n_workers < 2 or not self._enabled:
+            return
+        if torch.device(GlobalSettings().get_device()).type != "cpu":
+            LOG.warning("ProcessPoolExecutor only supports CPU training: receives are executed sequentially.")
+            self._enabled = False
+            return
+
+        # The weights committed by previous waves live in shared memory, hence they are modified
+        # in-place by the workers: the pending snapshots of the receivers are materialized first.
+        for msg in wave:
+            simulator.nodes[msg.receiver].model_handler._release_snapshots()
+
+        global _WAVE_CONTEXT
+        _WAVE_CONTEXT = (simulator, t, wave, [self._seeds[id(msg)] for msg in wave],
+                         self.threads_per_worker)
+        try:
+            ctx = tmp.get_context("fork")
+            with ctx.Pool(min(self.n_workers, len(wave))) as pool:
+                results = pool.map(_worker_receive, range(len(wave)), chunksize=1)
+        finally:
+            _WAVE_CONTEXT = None
+
+        for msg, res in zip(wave, results):
+            self._results[id(msg)] = res
+
+    # docstr-coverage:inherited
+    def receive(self, simulator: GossipSimulator, t: int, msg: Message) -> Optional[Message]:
+        res = self._results.pop(id(msg), None)
+        if res is None:
+            n_threads = torch.get_num_threads()
+            torch.set_num_threads(self.threads_per_worker)
+            try:
+                return super().receive(simulator, t, msg)
+            finally:
+                torch.set_num_threads(n_threads)
+
+        self._seeds.pop(id(msg), None)
+        state, reply, popped, pushed = _loads(*res)
+        simulator.nodes[msg.receiver].__dict__.update(state)
+        for key, n in popped:
+            for _ in range(n):
+                CACHE.pop(key)
+        for key, value, n in pushed:
+            for _ in range(n):
+                CACHE.push(key, value)
+        return reply
+
+
+class BatchedTorchExecutor(ReceiveExecutor):
+    def __init__(self, min_batch_size: int = 2):
+        """Trains the models of the receivers of a wave together as a single batched model.
+
+        The receivers of a wave whose models share the same architecture and training setup are
+        grouped, their (merged) parameters are stacked along a new leading dimension, and the
+        local epochs of all of them are run at once with a single vectorized forward/backward pass
+        per step (:func:`torch.func.vmap` of :func:`torch.func.functional_call`). The trained
+        parameters are then scattered back into each node's handler when the messages are
+        committed in the delivery order.
+
+        Only the receives that would otherwise go through the standard
+        :meth:`gossipy.node.GossipNode.receive` of a PUSH, PUSH_PULL or REPLY message to a
+        :class:`gossipy.model.handler.TorchModelHandler` in ``MERGE_UPDATE`` mode are batched.
+        Moreover, the model must not have buffers (e.g., batch normalization), it must be
+        trained with plain SGD (no momentum) and it must not be on a CUDA device, where the
+        sequential update runs under mixed precision (see
+        :meth:`gossipy.model.handler.TorchModelHandler._local_step`) while the batched one would
+        run in full precision. All the other receives are executed one by one.
+        Since the data are shuffled with the random number generator of each handler (or with
+        the seed of each receive), the results match the ones of the sequential execution up to
+        floating point errors.
+
+        Parameters
+        ----------
+        min_batch_size : int, default=2
+            The minimum number of models trained together. Smaller groups are trained one by one.
+        """
+
+        super(BatchedTorchExecutor, self).__init__()
+        assert min_batch_size > 0, "min_batch_size must be positive."
+        self.min_batch_size = min_batch_size
+        self._results = {}
+
+    def _batchable(self, simulator: GossipSimulator, msg: Message) -> bool:
+        node = simulator.nodes[msg.receiver]
+        handler = node.model_handler
+        if type(node).receive is not GossipNode.receive or node.compression is not None or \
+           msg.type not in (MessageType.PUSH, MessageType.PUSH_PULL, MessageType.REPLY):
+            return False
+        if not isinstance(handler, TorchModelHandler) or \
+           handler.mode != CreateModelMode.MERGE_UPDATE or \
+           type(handler).__call__ is not ModelHandler.__call__ or \
+           type(handler)._update is not TorchModelHandler._update or \
+           type(handler)._local_step is not TorchModelHandler._local_step:
+            return False
+        if torch.device(handler.device).type == "cuda":
+            return False
+        opt = handler.optimizer
+        if type(opt) is not torch.optim.SGD or len(opt.param_groups) != 1:
+            return False
+        group = opt.param_groups[0]
+        if group["momentum"] != 0 or group["nesterov"] or group.get("maximize", False):
+            return False
+        if next(handler.model.buffers(), None) is not None or \
+           not all(p.requires_grad for p in handler.model.parameters()):
+            return False
+        return isinstance(CACHE[msg.value[0]], (TorchModelHandler, ModelPayload))
+
+    def _group_key(self, simulator: GossipSimulator, msg: Message) -> Tuple:
+        node = simulator.nodes[msg.receiver]
+        handler = node.model_handler
+        x, y = node.data[0]
+        group = handler.optimizer.param_groups[0]
+        return (type(handler.model),
+                tuple((n, tuple(p.shape)) for n, p in handler.model.named_parameters()),
+                handler.criterion, handler.batch_size, handler.local_epochs,
+                group["lr"], group["weight_decay"], str(handler.device),
+                tuple(x.shape), x.dtype, tuple(y.shape), y.dtype)
+
+    # docstr-coverage:inherited
+    def _execute(self, simulator: GossipSimulator, t: int, wave: List[Message]) -> None:
+        groups = {}
+        for msg in wave:
+            if self._batchable(simulator, msg):
+                groups.setdefault(self._group_key(simulator, msg), []).append(msg)
+
+        for msgs in groups.values():
+            if len(msgs) < self.min_batch_size:
+                continue
+            merged = []
+            for msg in msgs:
+                handler = simulator.nodes[msg.receiver].model_handler
+                tmp_handler = copy.copy(handler)
+                tmp_handler.model = copy.deepcopy(handler.model)
+                tmp_handler._merge(CACHE[msg.value[0]])
+                merged.append(tmp_handler)
+            # The handlers share the generators of the receivers, which advance as in a receive
+            gens = [h._generator if h._generator is not None else
+                    torch.Generator().manual_seed(self._seeds[id(msg)])
+                    for msg, h in zip(msgs, merged)]
+            self._batched_update(merged,
+                                 [simulator.nodes[msg.receiver].data[0] for msg in msgs],
+                                 gens)
+            for msg, handler in zip(msgs, merged):
+                self._results[id(msg)] = handler
+
+    def _batched_update(self,
+                        handlers: List[TorchModelHandler],
+                        data: List[Tuple[torch.Tensor, torch.Tensor]],
+                        gens: List[torch.Generator]) -> None:
+        # Replicates TorchModelHandler._update on the stacked parameters of the handlers
+        proto = handlers[0]
+        device = proto.device
+        model = proto.model.to(device)
+        model.train()
+        names = [n for n, _ in model.named_parameters()]
+        params = {n: torch.stack([dict(h.model.named_parameters())[n].detach() for h in handlers]).to(device)
+                  for n in names}
+        group = proto.optimizer.param_groups[0]
+        lr, weight_decay = group["lr"], group["weight_decay"]
+
+        def loss(p, x, y):
+            return proto.criterion(functional_call(model, p, (x,)), y)
+
+        grad_fn = vmap(grad(loss), randomness="different")
+
+        def sgd_step(x, y):
+            grads = grad_fn(params, x.to(device), y.to(device))
+            for n in names:
+                d_p = grads[n] + weight_decay * params[n] if weight_decay else grads[n]
+                params[n] = params[n] - lr * d_p
+
+        rows = torch.arange(len(handlers)).unsqueeze(1)
+        x = torch.stack([d[0] for d in data])
+        y = torch.stack([d[1] for d in data])
+        n_samples = x.size(1)
+        batch_size = n_samples if not proto.batch_size else proto.batch_size
+        n_steps = 0
+        if proto.local_epochs > 0:
+            for _ in range(proto.local_epochs):
+                perm = torch.stack([torch.randperm(n_samples, generator=g) for g in gens])
+                x, y = x[rows, perm], y[rows, perm]
+                for i in range(0, n_samples, batch_size):
+                    sgd_step(x[:, i : i + batch_size], y[:, i : i + batch_size])
+                    n_steps += 1
+        else:
+            perm = torch.stack([torch.randperm(n_samples, generator=g) for g in gens])
+            sgd_step(x[rows, perm][:, :batch_size], y[rows, perm][:, :batch_size])
+            n_steps = 1
+
+        for k, h in enumerate(handlers):
+            with torch.no_grad():
+                for n, p in h.model.named_parameters():
+                    p.copy_(params[n][k])
+            h.n_updates += n_steps
+            h.counter_local += n_steps
+
+    # docstr-coverage:inherited
+    def receive(self, simulator: GossipSimulator, t: int, msg: Message) -> Optional[Message]:
+        trained = self._results.pop(id(msg), None)
+        if trained is None:
+            return super().receive(simulator, t, msg)
+
+        self._seeds.pop(id(msg), None)
+        node = simulator.nodes[msg.receiver]
+        handler = node.model_handler
+        CACHE.pop(msg.value[0])
+        handler._release_snapshots()
+        with torch.no_grad():
+            for p, q in zip(handler.model.parameters(), trained.model.parameters()):
+                p.copy_(q)
+        handler.n_updates = trained.n_updates
+        handler.counter_local = trained.counter_local
+
+        if msg.type == MessageType.PUSH_PULL:
+            key = handler.caching(node.idx)
+            return Message(t, node.idx, msg.sender, MessageType.REPLY, (key,))
+        return None
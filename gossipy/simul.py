@@ -1,9 +1,11 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
 from copy import deepcopy
+import heapq
+import time
 import numpy as np
-from numpy.random import shuffle, random, choice
-from typing import Callable, DefaultDict, Optional, Dict, List, Tuple, Union, Iterable
+from numpy.random import shuffle, random
+from typing import Any, Callable, DefaultDict, Optional, Dict, List, Sequence, Tuple, Union, Iterable
 from rich.progress import track
 import dill
 import json
@@ -11,11 +13,13 @@ import json
 from gossipy.model.utils import *
 
 from . import CACHE, LOG, CacheKey
-from .core import AntiEntropyProtocol, Message, ConstantDelay, Delay, MixingMatrix, UniformDynamicP2PNetwork, UniformMixing, DynamicP2PNetwork
+from .churn import BernoulliChurn, ChurnModel
+from .core import AntiEntropyProtocol, CommunicationTrace, Message, MessageLog, MessageType, ConstantDelay, Delay, MixingMatrix, UniformDynamicP2PNetwork, UniformMixing, DynamicP2PNetwork
 from .data import DataDispatcher
 from .node import FederatedAttackGossipNode, GossipNode, AttackGossipNode, All2AllGossipNode
 from .flow_control import TokenAccount
-from .model.handler import ModelHandler
+from .model.handler import DryRunHandler, ModelHandler
+from .parallel import ReceiveExecutor
 from .utils import StringEncoder
 from .attacks.mia.mia import mia_for_each_nn
 from .attacks.ra.ra import *
@@ -36,7 +40,9 @@ __all__ = ["SimulationEventReceiver",
            "SimulationEventSender",
            "SimulationReport",
            "GossipSimulator",
-           "TokenizedGossipSimulator"]
+           "EventDrivenGossipSimulator",
+           "TokenizedGossipSimulator",
+           "ReplaySimulator"]
 
 
 class SimulationEventReceiver(ABC):
@@ -51,11 +57,30 @@ class SimulationEventReceiver(ABC):
         falied : bool
             Whether the message was sent (False) or not (True).
         msg_size : Message or None, default=None
-            The message.
+            The message. Failed messages may be notified without it.
         """
 
         pass
 
+    def update_message_batch(self, n_sent: int, n_failed: int, total_size: int) -> None:
+        """Receives an aggregated update about a batch of sent and failed messages.
+
+        Simulators that do not materialize the messages (e.g.,
+        :class:`gossipy.vectorized.VectorizedGossipSimulator`) notify the message events in bulk.
+
+        Parameters
+        ----------
+        n_sent : int
+            The number of sent messages.
+        n_failed : int
+            The number of failed messages.
+        total_size : int
+            The total size of the sent messages.
+        """
+
+        raise NotImplementedError("%s does not support aggregated message updates."
+                                  %self.__class__.__name__)
+
     def update_evaluation(self,
                           round: int,
                           on_user: bool,
@@ -141,6 +166,22 @@ class SimulationEventSender(ABC):
         for er in self._receivers:
             er.update_message(falied, msg)
 
+    def notify_message_batch(self, n_sent: int, n_failed: int, total_size: int) -> None:
+        """Notifies all receivers about a batch of sent and failed messages.
+
+        Parameters
+        ----------
+        n_sent : int
+            The number of sent messages.
+        n_failed : int
+            The number of failed messages.
+        total_size : int
+            The total size of the sent messages.
+        """
+
+        for er in self._receivers:
+            er.update_message_batch(n_sent, n_failed, total_size)
+
     def notify_evaluation(self,
                           round: int,
                           on_user: bool,
@@ -184,12 +225,15 @@ class SimulationReport(SimulationEventReceiver):
     _failed_messages: int
     _global_evaluations: List[Tuple[int, Dict[str, float]]]
     _local_evaluations: List[Tuple[int, Dict[str, float]]]
+    _message_log: Optional[MessageLog]
 
-    def __init__(self):
+    def __init__(self, message_log: bool = False):
         """Class that implements a basic simulation report.
 
         The report traces the number of sent messages, the number of failed messages,
         the total size of the sent messages, and the evaluation metrics (both global and local).
+        Optionally, every message event is also recorded in a columnar :class:`MessageLog`
+        that can be used to compute traffic statistics after the simulation.
 
         The report is updated according to the design pattern Observer (actually Event Receiver).
         Thus, the report must be created and attached to the simulation before starting it.
@@ -206,11 +250,17 @@ class SimulationReport(SimulationEventReceiver):
         The ``report`` object is now attached to the simulation and it will be notified about the
         events.
 
+        Parameters
+        ----------
+        message_log : bool, default=False
+            Whether to record the message events in a :class:`gossipy.core.MessageLog`.
+
         See Also
         --------
         gossipy.Sizeable
         """
 
+        self._message_log = MessageLog() if message_log else None
         self.clear()
 
     # docstr-coverage:inherited
@@ -222,6 +272,8 @@ class SimulationReport(SimulationEventReceiver):
         self._failed_messages = 0
         self._global_evaluations = []
         self._local_evaluations = []
+        if self._message_log is not None:
+            self._message_log.clear()
 
     # docstr-coverage:inherited
     def update_message(self, failed: bool, msg: Optional[Message] = None) -> None:
@@ -231,6 +283,25 @@ class SimulationReport(SimulationEventReceiver):
             assert msg is not None, "msg is not set"
             self._sent_messages += 1
             self._total_size += msg.get_size()
+        if self._message_log is not None:
+            self._message_log.append(msg, failed)
+
+    def get_message_log(self) -> Optional[MessageLog]:
+        """Returns the log of the message events, if enabled.
+
+        Returns
+        -------
+        MessageLog or None
+            The log of the message events, or `None` if the report does not record them.
+        """
+
+        return self._message_log
+
+    # docstr-coverage:inherited
+    def update_message_batch(self, n_sent: int, n_failed: int, total_size: int) -> None:
+        self._sent_messages += n_sent
+        self._failed_messages += n_failed
+        self._total_size += total_size
 
     # docstr-coverage:inherited
     def update_evaluation(self,
@@ -335,6 +406,12 @@ class AttackSimulationReport(SimulationEventReceiver):
             self._sent_messages += 1
             self._total_size += msg.get_size()
 
+    # docstr-coverage:inherited
+    def update_message_batch(self, n_sent: int, n_failed: int, total_size: int) -> None:
+        self._sent_messages += n_sent
+        self._failed_messages += n_failed
+        self._total_size += total_size
+
     # docstr-coverage:inherited
     def update_evaluation(self, round: int, on_user: bool, evaluation: List[Dict[str, float]]) -> None:
         ev = self._collect_results(evaluation)
@@ -411,16 +488,39 @@ class AttackSimulationReport(SimulationEventReceiver):
     def update_timestep(self, t: int):
         pass
 
+def _collect_keys(obj: Any, keys: set, depth: int = 0) -> None:
+    # Collects the cache keys (shallowly) held in the containers of a node
+    if isinstance(obj, CacheKey):
+        keys.add(obj)
+    elif depth < 3:
+        if isinstance(obj, dict):
+            obj = obj.values()
+        if isinstance(obj, (list, tuple, set, type({}.values()))):
+            for v in obj:
+                _collect_keys(v, keys, depth + 1)
+
+
 class GossipSimulator(SimulationEventSender):
+    _WAKEUP: int = 0
+    _MESSAGE: int = 1
+    _REPLY: int = 2
+    _PROFILED_HOOKS: Tuple[str, ...] = ("_wake_up", "_deliver", "_deliver_reply",
+                                        "_probe_attacks", "_evaluate")
+    _kernel_seq: Optional[np.random.SeedSequence] = None
+    _rng: Optional[np.random.Generator] = None
+
     def __init__(self,
                  nodes: Dict[int, GossipNode],
                  data_dispatcher: DataDispatcher,
                  delta: int,
                  protocol: AntiEntropyProtocol,
                  drop_prob: float = 0.,  # [0,1] - probability of a message being dropped
-                 online_prob: float = 1.,  # [0,1] - probability of a node to be online
+                 online_prob: Union[float, ChurnModel] = 1.,  # [0,1] - probability of a node to be online
                  delay: Delay = ConstantDelay(0),
                  sampling_eval: float = 0.,  # [0, 1] - percentage of nodes to evaluate
+                 event_driven: bool = False,
+                 profile: bool = False,
+                 executor: Optional[ReceiveExecutor] = None
                  ):
         """Class that implements a *vanilla* gossip learning simulation.
 
@@ -429,10 +529,42 @@ class GossipSimulator(SimulationEventSender):
         that timed out act according to the gossip protocol, e.g., in the case of the PUSH protocol,
         the nodes send a message (i.e., its model) to a random neighbor. The message arrives at the
         destination node with a ``delay`` (see :class:`gossipy.simul.Delay`). Messages can also drop
-        according to a probability defined by the ``drop_prob`` parameter. Similarly, nodes can 
-        drop according to a probability equals to ``1 - online_prob``. Nodes are considered in a 
+        according to a probability defined by the ``drop_prob`` parameter. Similarly, nodes can
+        drop according to a probability equals to ``1 - online_prob``. Nodes are considered in a
         random order even if they time out in the same timestep.
 
+        The random decisions of the kernel, i.e., the order of the nodes, the drops, the delays
+        (see :meth:`gossipy.core.Delay.set_rng`), the churn (see
+        :meth:`gossipy.churn.ChurnModel.set_rng`), the sampled nodes to evaluate and, in the
+        derived simulators, the view shuffles, the selected peers and the token accounts, are
+        drawn from streams derived from the seed of :meth:`init_nodes` and keyed on the timestep
+        (the order of the nodes on the round), rather than from the global random state. Thus,
+        the time-stepped and the event-driven schedulers make the same decisions, and they run
+        the same simulation.
+
+        This class is also the simulation kernel shared by all the other simulators. The kernel
+        owns the scheduling of the simulation (time-stepped or event-driven), the message queues,
+        the lifecycle of the messages, the online status of the nodes and the (optional) profiling,
+        while the protocol-specific
+        behaviour is defined by overriding the following hooks:
+
+        - :meth:`_timed_out`: whether a node wakes up at a given timestep;
+        - :meth:`_start_timestep`: actions performed at the beginning of a timestep, e.g.,
+          shuffling at once the views of the nodes that time out (see
+          :class:`DynamicGossipSimulator`);
+        - :meth:`_pre_send`: actions performed by a node that woke up before sending. If it
+          returns `False` the node does not send anything;
+        - :meth:`_select_peers`: the peers (and the protocol) a woken up node sends to;
+        - :meth:`_deliver` and :meth:`_deliver_reply`: the delivery of a message/reply;
+        - :meth:`_probe_attacks`: the attacks performed at the end of each round;
+        - :meth:`_evaluate`: the evaluation performed at the end of each round.
+
+        The messages that are never received, i.e., dropped, sent to an offline node or still
+        in flight at the end of the simulation, release the references to the models' cache they
+        carry (see :meth:`_discard`). At the end of the simulation, a report of the released
+        messages and of the cache entries not referenced by any node (i.e., leaked) is logged and
+        stored in the attribute ``cache_report``.
+
         The simulator implements the design pattern Observer (actually Event Receiver) extending
         the :class:`gossipy.simul.SimulationEventSender` class. The events are:
 
@@ -455,16 +587,29 @@ class GossipSimulator(SimulationEventSender):
             The protocol of the gossip simulation.
         drop_prob : float, default=0.
             The probability of a message being dropped.
-        online_prob : float, default=1.
-            The probability of a node to be online.
+        online_prob : float or ChurnModel, default=1.
+            The probability of a node to be online at each timestep, or the churn model of the
+            nodes (see :mod:`gossipy.churn`).
         delay : Delay, default=ConstantDelay(0)
             The (potential) function delay of the messages.
         sampling_eval : float, default=0.
             The percentage of nodes to use during evaluate. If 0 or 1, all nodes are considered.
+        event_driven : bool, default=False
+            Whether the simulation is driven by a priority queue of events instead of polling
+            every node at every timestep (see :class:`EventDrivenGossipSimulator`).
+        profile : bool, default=False
+            Whether to measure the time spent in the hooks of the kernel. The cumulative timings
+            (in seconds) are stored in the attribute ``profile_stats`` and logged at the end of
+            the simulation.
+        executor : ReceiveExecutor, default=None
+            The executor of the receives of the messages delivered in the same timestep, e.g., a
+            :class:`gossipy.parallel.ProcessPoolExecutor` to update the receivers in parallel.
+            If `None`, the messages are received sequentially.
         """
 
         assert 0 <= drop_prob <= 1, "drop_prob must be in the range [0,1]."
-        assert 0 <= online_prob <= 1, "online_prob must be in the range [0,1]."
+        assert isinstance(online_prob, ChurnModel) or 0 <= online_prob <= 1, \
+            "online_prob must be in the range [0,1]."
         assert 0 <= sampling_eval <= 1, "sampling_eval must be in the range [0,1]."
 
         self.data_dispatcher = data_dispatcher
@@ -473,16 +618,28 @@ class GossipSimulator(SimulationEventSender):
         self.protocol = protocol
         self.drop_prob = drop_prob
         self.online_prob = online_prob
+        self.churn = online_prob if isinstance(online_prob, ChurnModel) else BernoulliChurn(online_prob)
         self.delay = delay
         self.sampling_eval = sampling_eval
+        self.event_driven = event_driven
+        self.profile = profile
+        self.profile_stats = {}
+        self.executor = executor
+        self.cache_report = {}
         self.initialized = False
         self.nodes = nodes
+        self._trace = None
+        self._versions = None
 
     def init_nodes(self, seed: int = 98765) -> None:
         """Initializes the nodes.
 
         The initialization of the nodes usually involves the initialization of the local model
-        (see :meth:`GossipNode.init_model`).
+        (see :meth:`GossipNode.init_model`). Before that, each node gets its own random number
+        streams (see :meth:`GossipNode.seed`), derived from ``seed`` and from the index of the
+        node, so that the actions of the nodes do not depend on the order in which they are
+        executed (e.g., by a :class:`gossipy.parallel.ReceiveExecutor`). The streams of the
+        simulation kernel are derived from ``seed`` as well.
 
         Parameters
         ----------
@@ -491,7 +648,10 @@ class GossipSimulator(SimulationEventSender):
         """
 
         self.initialized = True
-        for _, node in self.nodes.items():
+        streams = np.random.SeedSequence(seed).spawn(self.n_nodes + 1)
+        self._kernel_seq = streams[-1]
+        for i, node in self.nodes.items():
+            node.seed(streams[i])
             node.init_model()
 
     # def add_nodes(self, nodes: List[GossipNode]) -> None:
@@ -502,95 +662,598 @@ class GossipSimulator(SimulationEventSender):
     #         self.nodes[node.idx] = node
     #         self.n_nodes += 1
 
-    def start(self, n_rounds: int = 100) -> None:
-        """Starts the simulation.
-        The simulation handles the messages exchange between the nodes for ``n_rounds`` rounds.
-        If attached to a :class:`SimulationReport`, the report is updated at each time step, 
-        sent/fail message and evaluation.
+    def _timed_out(self, t: int, node: GossipNode) -> bool:
+        """Checks whether the node wakes up at timestep ``t``.
+
+        Parameters
+        ----------
+        t : int
+            The current timestamp.
+        node : GossipNode
+            The node to check.
+
+        Returns
+        -------
+        bool
+            Whether the node has timed out.
+        """
+
+        return node.timed_out(t)
+
+    def _pre_send(self, t: int, node: GossipNode) -> bool:
+        """Performs the actions of a node that has just timed out, before sending any message.
+
+        Parameters
+        ----------
+        t : int
+            The current timestamp.
+        node : GossipNode
+            The node that has timed out.
+
+        Returns
+        -------
+        bool
+            Whether the node sends messages in this timestep.
+        """
+
+        return True
+
+    def _select_peers(self, t: int, node: GossipNode) -> List[Tuple[int, AntiEntropyProtocol]]:
+        """Selects the peers to which the timed out node sends a message.
+
+        Parameters
+        ----------
+        t : int
+            The current timestamp.
+        node : GossipNode
+            The node that has timed out.
+
+        Returns
+        -------
+        list of tuple[int, AntiEntropyProtocol]
+            The pairs (peer, protocol) of the messages to send.
+        """
+
+        peer = node.get_peer()
+        return [] if peer is None else [(peer, self.protocol)]
+
+    def dry_run(self, n_rounds: int = 100, mixing: float = 1., **kwargs) -> Dict[str, Any]:
+        """Runs the simulation without training, i.e., replacing the model handlers of the nodes
+        with version counters (see :class:`gossipy.model.handler.DryRunHandler`).
+
+        A dry run simulates the same communication (messages and sizes included) at a fraction
+        of the cost, to tune the parameters of the protocol. At the end of each round, the age
+        (number of updates) of every model and its coverage (the fraction of nodes whose data
+        contributed to it) are collected with vectorized operations. The evaluation events
+        carry the same metrics. The model handlers of the nodes are restored after the run.
 
         Parameters
         ----------
         n_rounds : int, default=100
             The number of rounds of the simulation.
+        mixing : float, default=1.
+            The coverage that every model must reach for the models to be considered mixed.
+        **kwargs
+            Further arguments of :meth:`start`.
+
+        Returns
+        -------
+        dict[str, Any]
+            The statistics of the dry run:
+
+            - "sent", "received": the number of messages sent/received by each node;
+            - "t": the last timestep of each round;
+            - "age": the age of the models at the end of each round (n_rounds x n_nodes);
+            - "coverage": the coverage of the models at the end of each round
+              (n_rounds x n_nodes);
+            - "mixing_time": the first round end at which the coverage of every model is at
+              least ``mixing``, or -1 if it never happens.
         """
 
         assert self.initialized, \
             "The simulator is not inizialized. Please, call the method 'init_nodes'."
-        LOG.info("Simulation started.")
-        node_ids = np.arange(self.n_nodes)
+        handlers = {i: node.model_handler for i, node in self.nodes.items()}
+        log = SimulationReport(message_log=True)
+        self.add_receiver(log)
+        self._versions = {"t": [], "age": [], "coverage": []}
+        try:
+            for i, node in self.nodes.items():
+                node.model_handler = DryRunHandler.like(handlers[i], i, self.n_nodes)
+                node.init_model()
+            self.start(n_rounds=n_rounds, **kwargs)
+            versions = {k: np.array(v) for k, v in self._versions.items()}
+        finally:
+            for i, node in self.nodes.items():
+                node.model_handler = handlers[i]
+            self.remove_receiver(log)
+            self._versions = None
+
+        mixed = np.flatnonzero(versions["coverage"].min(axis=1) >= mixing) \
+                if len(versions["t"]) else []
+        sent, _ = log.get_message_log().traffic("sender", self.n_nodes)
+        received, _ = log.get_message_log().traffic("receiver", self.n_nodes)
+        return {"sent": sent,
+                "received": received,
+                **versions,
+                "mixing_time": int(versions["t"][mixed[0]]) if len(mixed) else -1}
+
+    def record_trace(self) -> CommunicationTrace:
+        """Makes the next simulation record its communication trace.
+
+        The trace can be replayed with a :class:`ReplaySimulator`, e.g., to compare different
+        model handlers on exactly the same message schedule.
 
-        pbar = track(range(n_rounds * self.delta), description="Simulating...")
+        Returns
+        -------
+        CommunicationTrace
+            The trace, which is filled during the next simulation.
+        """
+
+        self._trace = CommunicationTrace(self.n_nodes)
+        return self._trace
+
+    def _kernel_rng(self, *key: int) -> Optional[np.random.Generator]:
+        # The stream of the kernel identified by key, independent of the draws made by any other
+        # stream: (0, t) is the stream of timestep t, (1, r) the one of the order of round r,
+        # (2,) the one of the initial state of the churn model, (3, t) the one of the nodes
+        # evaluated at timestep t, (4, t, i) the one of the peers selected by node i at timestep
+        # t, (5, t) the one of the view shuffles at timestep t, (6, i) the one of the token
+        # account of node i and (7,) the one of the choice of the attacker
+        if self._kernel_seq is None:
+            return None
+        seq = np.random.SeedSequence(self._kernel_seq.entropy,
+                                     spawn_key=self._kernel_seq.spawn_key + key)
+        return np.random.default_rng(seq)
+
+    def _kernel_choice(self, key: Tuple[int, ...], a: Sequence[Any], size: int,
+                       replace: bool = True) -> np.ndarray:
+        # A random sample of a drawn from the stream of the kernel identified by key
+        rng = self._kernel_rng(*key)
+        return (rng if rng is not None else np.random).choice(a, size, replace=replace)
+
+    def _random(self) -> float:
+        # A random number in [0, 1) drawn from the stream of the current timestep
+        return self._rng.random() if self._rng is not None else random()
+
+    def _start_timestep(self, t: int) -> None:
+        """Starts the timestep ``t``, before any node wakes up.
+
+        Within a timestep the random decisions are drawn from the stream of the timestep, and
+        they are made in the same order by both schedulers.
 
-        msg_queues = DefaultDict(list)
-        rep_queues = DefaultDict(list)
+        Parameters
+        ----------
+        t : int
+            The current timestamp.
+        """
+
+        self._now = t
+        self._rng = self._kernel_rng(0, t)
+        self.delay.set_rng(self._rng)
+        self.churn.set_rng(self._rng)
+
+    def _round_order(self, r: int) -> Tuple[np.ndarray, np.ndarray]:
+        # The order in which the nodes that time out in the same timestep of round r wake up,
+        # and the rank of each node in it
+        if r not in self._orders:
+            order = np.arange(self.n_nodes)
+            rng = self._kernel_rng(1, r)
+            if rng is not None:
+                rng.shuffle(order)
+            else:
+                shuffle(order)
+            rank = np.empty_like(order)
+            rank[order] = np.arange(self.n_nodes)
+            self._orders[r] = (order, rank)
+        return self._orders[r]
+
+    def _is_online(self, idx: int) -> bool:
+        # The online status is queried lazily, only for the receivers of the messages, and it
+        # is kept fixed within the timestep
+        if idx not in self._online:
+            self._online[idx] = bool(self.churn.is_online(np.array([idx]), self._now)[0])
+        return self._online[idx]
+
+    def _query_online(self, msgs: List[Message]) -> None:
+        # Queries the churn model at once for all the receivers of a batch of messages
+        ids = np.unique([msg.receiver for msg in msgs if msg.receiver not in self._online])
+        if len(ids):
+            self._online.update(zip(ids.tolist(), self.churn.is_online(ids, self._now).tolist()))
+
+    def _schedule(self, t: int, msg: Message, reply: bool = False) -> None:
+        if self._events is not None:
+            self._seq += 1
+            heapq.heappush(self._events, (t, self._REPLY if reply else self._MESSAGE, self._seq, msg))
+        else:
+            (self._rep_queues if reply else self._msg_queues)[t].append(msg)
+
+    def _discard(self, msg: Message, reason: str, failed: bool = True) -> None:
+        """Discards a message that will never be received, releasing its cache references.
+
+        Parameters
+        ----------
+        msg : Message
+            The discarded message.
+        reason : str
+            Why the message is discarded: "dropped", "offline" or "undelivered".
+        failed : bool, default=True
+            Whether to notify the receivers that the message failed.
+        """
+
+        if failed:
+            self.notify_message(True, msg)
+        if msg.sender in self.nodes:
+            self.nodes[msg.sender].discarded(msg)
+        if self._trace is not None:
+            self._traced.pop(id(msg), None)
+        if msg.value:
+            for v in msg.value:
+                if isinstance(v, CacheKey):
+                    CACHE.release(v)
+        self._discarded[reason] += 1
+
+    def _send(self, t: int, node: GossipNode, peer: int, protocol: AntiEntropyProtocol) -> None:
+        """Sends a message from ``node`` to ``peer``, possibly dropping it.
+
+        Parameters
+        ----------
+        t : int
+            The current timestamp.
+        node : GossipNode
+            The sender node.
+        peer : int
+            The index of the receiver.
+        protocol : AntiEntropyProtocol
+            The protocol used to send the message.
+        """
+
+        msg = node.send(t, peer, protocol)
+        self.notify_message(False, msg)
+        if msg and self._trace is not None:
+            self._traced[id(msg)] = (self._trace.append(t, node.idx, peer, protocol), False)
+        if msg:
+            if self._random() >= self.drop_prob:
+                if self._outbox is not None:
+                    self._outbox.append(msg)
+                else:
+                    self._schedule(t + self.delay.get(msg), msg)
+            else:
+                self._discard(msg, "dropped")
+
+    def _flush_outbox(self, t: int) -> None:
+        """Schedules the messages sent by the nodes woken up at timestep ``t``.
+
+        The delays of all these messages are computed at once (see :meth:`Delay.get_batch`).
+
+        Parameters
+        ----------
+        t : int
+            The current timestamp.
+        """
+
+        outbox, self._outbox = self._outbox, None
+        if outbox:
+            for msg, delay in zip(outbox, self.delay.get_batch(outbox)):
+                self._schedule(t + int(delay), msg)
+
+    def _send_reply(self, t: int, reply: Message) -> None:
+        if self._random() > self.drop_prob:
+            self._schedule(t + self.delay.get(reply), reply, reply=True)
+        else:
+            self._discard(reply, "dropped")
+
+    def _wake_up(self, t: int, node: GossipNode) -> None:
+        if self._timed_out(t, node) and self._pre_send(t, node):
+            for peer, protocol in self._select_peers(t, node):
+                self._send(t, node, peer, protocol)
+
+    def _receive(self, t: int, msg: Message) -> Optional[Message]:
+        """Lets the receiver of the message receive it, possibly through the executor.
+
+        Parameters
+        ----------
+        t : int
+            The current timestamp.
+        msg : Message
+            The message to receive.
+
+        Returns
+        -------
+        Message or None
+            The reply to the message, if any.
+        """
+
+        if self.executor is not None:
+            reply = self.executor.receive(self, t, msg)
+        else:
+            reply = self.nodes[msg.receiver].receive(t, msg)
+        if self._trace is not None and id(msg) in self._traced:
+            idx, is_reply = self._traced.pop(id(msg))
+            self._trace.set_received(idx, t, is_reply)
+            if reply:
+                self._trace.set_replied(idx)
+                self._traced[id(reply)] = (idx, True)
+        return reply
+
+    def _deliver(self, t: int, msg: Message) -> None:
+        """Delivers a message to its receiver (if online) and handles the reply.
+
+        Parameters
+        ----------
+        t : int
+            The current timestamp.
+        msg : Message
+            The message to deliver.
+        """
+
+        if self._is_online(msg.receiver):
+            reply = self._receive(t, msg)
+            if reply:
+                self._send_reply(t, reply)
+        else:
+            self._discard(msg, "offline")
+
+    def _deliver_reply(self, t: int, reply: Message) -> None:
+        """Delivers a reply to its receiver (if online).
+
+        Parameters
+        ----------
+        t : int
+            The current timestamp.
+        reply : Message
+            The reply to deliver.
+        """
+
+        if self._is_online(reply.receiver):
+            self.notify_message(False, reply)
+            self._receive(t, reply)
+        else:
+            self._discard(reply, "offline")
+
+    def _probe_attacks(self, t: int) -> None:
+        """Performs the attacks at the end of a round. By default, no attack is performed.
+
+        Parameters
+        ----------
+        t : int
+            The current timestamp.
+        """
+
+        pass
+
+    def _evaluation_nodes(self) -> Iterable[int]:
+        """Returns the indices of the nodes to evaluate at the end of a round.
+
+        Returns
+        -------
+        Iterable[int]
+            The indices of the nodes to evaluate.
+        """
+
+        if self.sampling_eval > 0:
+            return self._kernel_choice((3, self._now), list(self.nodes.keys()),
+                                       max(int(self.n_nodes * self.sampling_eval), 1))
+        return list(self.nodes.keys())
+
+    def _evaluate(self, t: int) -> None:
+        """Evaluates the nodes at the end of a round and notifies the receivers.
+
+        Parameters
+        ----------
+        t : int
+            The current timestamp.
+        """
+
+        sample = self._evaluation_nodes()
+        ev = [self.nodes[i].evaluate() for i in sample if self.nodes[i].has_test()]
+        if ev:
+            self.notify_evaluation(t, True, ev)
+
+        if self.data_dispatcher.has_test():
+            ev = [self.nodes[i].evaluate(self.data_dispatcher.get_eval_set()) for i in sample]
+            if ev:
+                self.notify_evaluation(t, False, ev)
+
+    def _deliver_batch(self, t: int, msgs: List[Message], reply: bool = False) -> None:
+        # The list can grow while it is delivered (messages with no delay sent during the delivery)
+        deliver = self._deliver_reply if reply else self._deliver
+        self._query_online(msgs)
+        i = 0
+        while i < len(msgs):
+            if self.executor is not None and msgs[i] not in self.executor and \
+               self._is_online(msgs[i].receiver):
+                self.executor.plan(self, t, msgs[i:])
+            deliver(t, msgs[i])
+            i += 1
+
+    def _end_timestep(self, t: int) -> None:
+        if (t + 1) % self.delta == 0:
+            self._probe_attacks(t)
+            self._evaluate(t)
+            if self._versions is not None:
+                self._collect_versions(t)
+            self._orders.pop(t // self.delta, None)
+        self.notify_timestep(t)
+
+    def _collect_versions(self, t: int) -> None:
+        # Age and coverage of all the (dry run) models at once
+        handlers = [self.nodes[i].model_handler for i in range(self.n_nodes)]
+        bitsets = np.stack([mh.model for mh in handlers])
+        self._versions["t"].append(t)
+        self._versions["age"].append(np.array([mh.n_updates for mh in handlers]))
+        self._versions["coverage"].append(DryRunHandler.popcount(bitsets) / self.n_nodes)
+
+    def _schedule_wakeup(self, node: GossipNode, t: int) -> None:
+        nt = node.next_timeout(t)
+        if nt < self._horizon:
+            rank = self._round_order(nt // self.delta)[1][node.idx]
+            heapq.heappush(self._events, (nt, self._WAKEUP, int(rank), node.idx))
+
+    def _timestepped_loop(self, t: int) -> None:
+        self._start_timestep(t)
+        if t % self.delta == 0:
+            self._node_ids = self._round_order(t // self.delta)[0]
+
+        self._outbox = []
+        for i in self._node_ids:
+            self._wake_up(t, self.nodes[i])
+        self._flush_outbox(t)
+
+        self._online = {}
+        self._deliver_batch(t, self._msg_queues[t])
+        del self._msg_queues[t]
+
+        self._deliver_batch(t, self._rep_queues[t], reply=True)
+        del self._rep_queues[t]
+
+    def _event_loop(self, t: int) -> None:
+        self._start_timestep(t)
+        self._online = {}
+        self._outbox = []
+        while True:
+            waking = self._events and self._events[0][:2] == (t, self._WAKEUP)
+            if not waking and self._outbox is not None:
+                # The wake-ups of the timestep are over: schedule the messages they sent
+                self._flush_outbox(t)
+            if not self._events or self._events[0][0] != t:
+                break
+            _, kind, _, item = heapq.heappop(self._events)
+            if kind == self._WAKEUP:
+                node = self.nodes[item]
+                self._schedule_wakeup(node, t + 1)
+                self._wake_up(t, node)
+            else:
+                batch = [item]
+                while self._events and self._events[0][:2] == (t, kind):
+                    batch.append(heapq.heappop(self._events)[3])
+                self._deliver_batch(t, batch, reply=(kind == self._REPLY))
+
+    def _profiled(self, name: str, fun: Callable) -> Callable:
+        def wrapper(*args, **kwargs):
+            tic = time.perf_counter()
+            try:
+                return fun(*args, **kwargs)
+            finally:
+                self.profile_stats[name] = self.profile_stats.get(name, 0.) + time.perf_counter() - tic
+        return wrapper
+
+    def _release_in_flight(self) -> None:
+        # The messages still in flight at the end of the simulation are never received
+        if self._events is not None:
+            in_flight = [item for _, kind, _, item in self._events if kind != self._WAKEUP]
+        else:
+            in_flight = [msg for queues in (self._msg_queues, self._rep_queues)
+                         for msgs in queues.values() for msg in msgs]
+        in_flight.extend(self._outbox or [])
+        for msg in in_flight:
+            self._discard(msg, "undelivered", failed=False)
+
+    def _report_cache(self) -> None:
+        held = set()
+        for node in self.nodes.values():
+            _collect_keys(vars(node), held)
+        leaked = [k for k in CACHE.get_cache() if k not in held]
+        self.cache_report = dict(self._discarded, leaked=len(leaked))
+        LOG.info("Released cache references of %d dropped, %d offline and %d undelivered "
+                 "messages." % (self._discarded["dropped"], self._discarded["offline"],
+                                self._discarded["undelivered"]))
+        if leaked:
+            LOG.warning("%d cache entries are not referenced by any node: %s%s" %
+                        (len(leaked), leaked[:10], "..." if len(leaked) > 10 else ""))
+
+    def _run(self, n_rounds: int, wall_time_limit: Optional[float] = None) -> None:
+        """Runs the simulation kernel for ``n_rounds`` rounds.
+
+        The number of rounds is stored in the attribute ``n_rounds``, e.g., for
+        :func:`gossipy.attacks.utils.log_results`.
+
+        Parameters
+        ----------
+        n_rounds : int
+            The number of rounds of the simulation.
+        wall_time_limit : float, default=None
+            The maximum duration of the simulation in hours. If `None`, there is no limit.
+        """
+
+        assert self.initialized, \
+            "The simulator is not inizialized. Please, call the method 'init_nodes'."
+        LOG.info("Simulation started.")
+
+        self.n_rounds = n_rounds
+        self._horizon = n_rounds * self.delta
+        self._node_ids = np.arange(self.n_nodes)
+        self._msg_queues = DefaultDict(list)
+        self._rep_queues = DefaultDict(list)
+        self._events = None
+        self._outbox = None
+        self._seq = 0
+        self._online = {}
+        self._discarded = {"dropped": 0, "offline": 0, "undelivered": 0}
+        self._traced = {}
+        self._orders = {}
+        self.delay.reset()
+        self.churn.set_rng(self._kernel_rng(2))
+        self.churn.reset(self.n_nodes)
+        if self.event_driven:
+            self._events = []
+            for _, node in self.nodes.items():
+                self._schedule_wakeup(node, 0)
+        if self.profile:
+            self.profile_stats = {}
+            for name in self._PROFILED_HOOKS:
+                setattr(self, name, self._profiled(name, getattr(self, name)))
+
+        step = self._event_loop if self.event_driven else self._timestepped_loop
+        time_limit = wall_time_limit * 3600 if wall_time_limit is not None else None
+        start_time = time.time()
+        pbar = track(range(self._horizon), description="Simulating...")
 
         try:
             for t in pbar:
-                if t % self.delta == 0:
-                    shuffle(node_ids)
-
-                for i in node_ids:
-                    node = self.nodes[i]
-                    if node.timed_out(t):
-                        peer = node.get_peer()
-                        if peer is None:
-                            break
-                        msg = node.send(t, peer, self.protocol)
-                        self.notify_message(False, msg)
-                        if msg:
-                            if random() >= self.drop_prob:
-                                d = self.delay.get(msg)
-                                msg_queues[t + d].append(msg)
-                            else:
-                                self.notify_message(True)
-
-                is_online = random(self.n_nodes) <= self.online_prob
-                for msg in msg_queues[t]:
-                    if is_online[msg.receiver]:
-                        reply = self.nodes[msg.receiver].receive(t, msg)
-                        if reply:
-                            if random() > self.drop_prob:
-                                d = self.delay.get(reply)
-                                rep_queues[t + d].append(reply)
-                            else:
-                                self.notify_message(True)
-                    else:
-                        self.notify_message(True)
-                del msg_queues[t]
-
-                for reply in rep_queues[t]:
-                    if is_online[reply.receiver]:
-                        self.notify_message(False, reply)
-                        self.nodes[reply.receiver].receive(t, reply)
-                    else:
-                        self.notify_message(True)
-
-                del rep_queues[t]
-
-                if (t + 1) % self.delta == 0:
-                    if self.sampling_eval > 0:
-                        sample = choice(list(self.nodes.keys()), max(int(self.n_nodes * self.sampling_eval), 1))
-                        ev = [self.nodes[i].evaluate() for i in sample if self.nodes[i].has_test()]
-                    else:
-                        ev = [n.evaluate() for _, n in self.nodes.items() if n.has_test()]
-                    if ev:
-                        self.notify_evaluation(t, True, ev)
-
-                    if self.data_dispatcher.has_test():
-                        if self.sampling_eval > 0:
-                            ev = [self.nodes[i].evaluate(self.data_dispatcher.get_eval_set()) for i in sample]
-                        else:
-                            ev = [n.evaluate(self.data_dispatcher.get_eval_set()) for _, n in self.nodes.items()]
-                        if ev:
-                            self.notify_evaluation(t, False, ev)
-                self.notify_timestep(t)
+                if time_limit is not None and (time.time() - start_time) > time_limit:
+                    LOG.info(f"Simulation stopped after reaching the wall time limit of {time_limit} seconds.")
+                    break
+                step(t)
+                self._end_timestep(t)
 
         except KeyboardInterrupt:
             LOG.warning("Simulation interrupted by user.")
 
+        finally:
+            for name in self._PROFILED_HOOKS:
+                self.__dict__.pop(name, None)
+            if self._trace is not None:
+                for idx, is_reply in self._traced.values():
+                    self._trace.set_received(idx, CommunicationTrace.IN_FLIGHT, is_reply)
+                self._trace.horizon = max(self._trace.horizon, self._horizon)
+                self._trace, self._traced = None, {}
+            self._release_in_flight()
+            self._msg_queues, self._rep_queues, self._events = None, None, None
+            self._outbox = None
+            self._rng = None
+            self.delay.set_rng(None)
+            self.churn.set_rng(None)
+
         pbar.close()
+        if self.profile:
+            LOG.info("Time spent in the simulation hooks: %s" %
+                     {k: round(v, 4) for k, v in self.profile_stats.items()})
+        self._report_cache()
         self.notify_end()
-        return
+
+    def start(self, n_rounds: int = 100) -> None:
+        """Starts the simulation.
+        The simulation handles the messages exchange between the nodes for ``n_rounds`` rounds.
+        If attached to a :class:`SimulationReport`, the report is updated at each time step,
+        sent/fail message and evaluation.
+
+        Parameters
+        ----------
+        n_rounds : int, default=100
+            The number of rounds of the simulation.
+        """
+
+        self._run(n_rounds)
 
     def save(self, filename) -> None:
         """Saves the state of the simulator (including the models' cache).
@@ -616,7 +1279,7 @@ class GossipSimulator(SimulationEventSender):
         ----------
         filename : str
             The name of the file to load the state.
-        
+
         Returns
         -------
         GossipSimulator
@@ -633,146 +1296,129 @@ class GossipSimulator(SimulationEventSender):
 
     def __str__(self) -> str:
         skip = ["nodes", "model_handler_params", "gossip_node_params"]
-        attrs = {k: v for k, v in self.__dict__.items() if k not in skip}
+        attrs = {k: v for k, v in self.__dict__.items() if k not in skip and not k.startswith("_")}
         return f"{self.__class__.__name__} \
                  {str(json.dumps(attrs, indent=4, sort_keys=True, cls=StringEncoder))}"
 
-class FederatedSimulator(GossipSimulator):
-    def __init__(self, nodes: Dict[int, GossipNode], data_dispatcher: DataDispatcher,
-            delta: int, protocol: AntiEntropyProtocol,
-            drop_prob: float = 0., online_prob: float = 1.,
-            delay: Delay = ConstantDelay(0), sampling_eval: float = 0.):
-            super().__init__(nodes, data_dispatcher, delta, protocol, drop_prob,
-                            online_prob, delay, sampling_eval)
-
-    def init_nodes(self, seed:int=98765) -> None:
-        """Initializes the nodes.
 
-        The initialization of the nodes usually involves the initialization of the local model
-        (see :meth:`GossipNode.init_model`).
+class EventDrivenGossipSimulator(GossipSimulator):
+    def __init__(self,
+                 nodes: Dict[int, GossipNode],
+                 data_dispatcher: DataDispatcher,
+                 delta: int,
+                 protocol: AntiEntropyProtocol,
+                 drop_prob: float = 0.,
+                 online_prob: Union[float, ChurnModel] = 1.,
+                 delay: Delay = ConstantDelay(0),
+                 sampling_eval: float = 0.,
+                 profile: bool = False,
+                 executor: Optional[ReceiveExecutor] = None
+                 ):
+        """Event-driven version of the *vanilla* gossip learning simulation.
+
+        The simulated protocol is the same of :class:`GossipSimulator`, but instead of polling
+        every node at every timestep, the simulator keeps a priority queue of future events, i.e.,
+        node wake-ups (computed with :meth:`GossipNode.next_timeout`), message deliveries and reply
+        deliveries. At each timestep only the events scheduled for that timestep are processed,
+        thus the cost of the simulation depends on the number of events rather than on
+        ``n_nodes * n_timesteps``. Events happening in the same timestep are processed in the same
+        order of :class:`GossipSimulator`: first the wake-ups (in the random order of the round),
+        then the messages and finally the replies (both in arrival order). Since the random
+        decisions of the kernel are keyed on the timestep, the simulation is the same as the
+        time-stepped one with the same seed.
+
+        Differently from :class:`GossipSimulator`, the online status of a node is sampled lazily,
+        i.e., only when the node receives a message, and it is kept fixed within a timestep.
+        The simulator emits the same events of :class:`GossipSimulator`, including
+        :meth:`update_timestep` for every timestep and :meth:`update_evaluation` at the end of
+        each round.
+
+        This class is equivalent to a :class:`GossipSimulator` created with
+        ``event_driven=True``. Every other simulator can be made event-driven in the same way.
 
         Parameters
         ----------
-        seed : int, default=98765
-            The seed for the random number generator.
+        nodes : dict[int, GossipNode]
+            The nodes participating in the simulation. The keys are the node ids, and the values
+            are the corresponding nodes (instances of the class :class:`GossipNode`).
+        data_dispatcher : DataDispatcher
+            The data dispatcher. Useful if the evaluation is performed on a separate test set, i.e.,
+            not on the nodes.
+        delta : int
+            The number of timesteps of a round.
+        protocol : AntiEntropyProtocol
+            The protocol of the gossip simulation.
+        drop_prob : float, default=0.
+            The probability of a message being dropped.
+        online_prob : float or ChurnModel, default=1.
+            The probability of a node to be online at each timestep, or the churn model of the
+            nodes (see :mod:`gossipy.churn`).
+        delay : Delay, default=ConstantDelay(0)
+            The (potential) function delay of the messages.
+        sampling_eval : float, default=0.
+            The percentage of nodes to use during evaluate. If 0 or 1, all nodes are considered.
+        profile : bool, default=False
+            Whether to measure the time spent in the hooks of the kernel.
+        executor : ReceiveExecutor, default=None
+            The executor of the receives of the messages delivered in the same timestep.
         """
 
-        self.initialized = True
-        for _, node in self.nodes.items():
-            node.init_model()
-    
-    # def add_nodes(self, nodes: List[GossipNode]) -> None:
-    #     assert not self.initialized, "'init_nodes' must be called before adding new nodes."
-    #     for node in nodes:
-    #         node.idx = self.n_nodes
-    #         node.init_model()
-    #         self.nodes[node.idx] = node
-    #         self.n_nodes += 1
+        super(EventDrivenGossipSimulator, self).__init__(nodes, data_dispatcher, delta, protocol,
+                                                         drop_prob, online_prob, delay,
+                                                         sampling_eval, event_driven=True,
+                                                         profile=profile, executor=executor)
 
 
-    def start(self, n_rounds: int=100) -> None:
-        """Starts the simulation.
+class FederatedSimulator(GossipSimulator):
+    def __init__(self, nodes: Dict[int, GossipNode], data_dispatcher: DataDispatcher,
+            delta: int, protocol: AntiEntropyProtocol,
+            drop_prob: float = 0., online_prob: Union[float, ChurnModel] = 1.,
+            delay: Delay = ConstantDelay(0), sampling_eval: float = 0., **kwargs):
+            super().__init__(nodes, data_dispatcher, delta, protocol, drop_prob,
+                            online_prob, delay, sampling_eval, **kwargs)
 
-        The simulation handles the messages exchange between the nodes for ``n_rounds`` rounds.
-        If attached to a :class:`SimulationReport`, the report is updated at each time step, 
-        sent/fail message and evaluation.
+    # docstr-coverage:inherited
+    def _select_peers(self, t: int, node: GossipNode) -> List[Tuple[int, AntiEntropyProtocol]]:
+        if not node.server_state:
+            return []
+        if len(node.node_selected) == 0:
+            neighbors = node.p2p_net.get_peers(node.idx)
+            peers = self._kernel_choice((4, t, node.idx), neighbors,
+                                        max(int((len(neighbors) - 1) * 1), 1), replace=False)
+            node.node_selected.extend(peers)
+            return [(peer, AntiEntropyProtocol.PUSH_PULL) for peer in peers]
+        return [(peer, AntiEntropyProtocol.PULL) for peer in node.node_selected]
+
+    def _evaluation_nodes(self) -> Iterable[int]:
+        """Returns the indices of the nodes to evaluate at the end of a round.
+
+        When sampling (``sampling_eval > 0``), the nodes are sampled among the clients only,
+        i.e., the server is never evaluated. Otherwise, all the nodes are evaluated.
 
-        Parameters
-        ----------
-        n_rounds : int, default=100
-            The number of rounds of the simulation.
+        Returns
+        -------
+        Iterable[int]
+            The indices of the nodes to evaluate.
         """
 
-        assert self.initialized, \
-               "The simulator is not inizialized. Please, call the method 'init_nodes'."
-        LOG.info("Simulation started.")
-        node_ids = np.arange(self.n_nodes)
-        self.n_rounds = n_rounds
-        
-        pbar = track(range(n_rounds * self.delta), description="Simulating...")
-        msg_queues = DefaultDict(list)
-        rep_queues = DefaultDict(list)
+        if self.sampling_eval > 0:
+            clients = [i for i, n in self.nodes.items() if not n.server_state]
+            return self._kernel_choice((3, self._now), clients,
+                                       max(int((self.n_nodes - 1) * self.sampling_eval), 1))
+        return list(self.nodes.keys())
 
-        try:
-            for t in pbar:
-                if t % self.delta == 0: 
-                    shuffle(node_ids)
-                    
-                for i in node_ids:
-                    node = self.nodes[i]
-                    if node.timed_out(t):
-                        if node.server_state:
-                            if (len(node.node_selected)==0):
-                                neighbors = node.p2p_net.get_peers(node.idx)
-                                peers = choice(neighbors,  max(int((len(neighbors) - 1) * 1), 1), replace=False)
-                                protocol = AntiEntropyProtocol.PUSH_PULL
-                                for peer in peers:
-                                    node.node_selected.append(peer)
-                            else:
-                                peers = node.node_selected
-                                protocol = AntiEntropyProtocol.PULL
-                                  
-                            for peer in peers:
-                                msg = node.send(t, peer, protocol)
-                                self.notify_message(False, msg)
-                                if msg:
-                                    if random() >= self.drop_prob:
-                                        d = self.delay.get(msg)
-                                        msg_queues[t + d].append(msg)
-                                    else:
-                                        self.notify_message(True)
-                
-                is_online = random(self.n_nodes) <= self.online_prob
-                for msg in msg_queues[t]:
-                    if is_online[msg.receiver]:
-                        reply = self.nodes[msg.receiver].receive(t, msg)
-                        if reply:
-                            if random() > self.drop_prob:
-                                d = self.delay.get(reply)
-                                rep_queues[t + d].append(reply)
-                            else:
-                                self.notify_message(True)
-                    else:
-                        self.notify_message(True)
-                del msg_queues[t]
-
-                for reply in rep_queues[t]:
-                    if is_online[reply.receiver]:
-                        self.notify_message(False, reply)
-                        self.nodes[reply.receiver].receive(t, reply)
-                    else:
-                        self.notify_message(True)
-                    
-                del rep_queues[t]
-
-                if (t+1) % self.delta == 0:
-
-                    if self.sampling_eval > 0:
-                        node_ids = [node_id for node_id in self.nodes.keys() if node_id != "server_state"]
-                        # sample = choice(list(self.nodes.keys()), max(int(self.n_nodes * self.sampling_eval), 1))
-                        sample = choice(node_ids, max(int((self.n_nodes - 1) * self.sampling_eval), 1))
-                        ev = [self.nodes[i].evaluate() for i in sample if self.nodes[i].has_test()]
-                    else:
-                        ev = [n.evaluate() for _, n in self.nodes.items() if n.has_test()]
-                    if ev:
-                        self.notify_evaluation(t, True, ev)
-                    
-                    if self.data_dispatcher.has_test():
-                        if self.sampling_eval > 0:
-                            ev = [self.nodes[i].evaluate(self.data_dispatcher.get_eval_set()) for i in sample]
-                        else:
-                            ev = [n.evaluate(self.data_dispatcher.get_eval_set())
-                                for _, n in self.nodes.items()]
-                        if ev:
-                            self.notify_evaluation(t, False, ev)
-                self.notify_timestep(t)
 
-        except KeyboardInterrupt:
-            LOG.warning("Simulation interrupted by user.")
-        
-        pbar.close()
-        self.notify_end()
-        return
+def _update_views(sim: GossipSimulator, t: int) -> None:
+    # The views of all the nodes that time out at timestep t are shuffled at once (before any of
+    # them sends), one batch per dynamic network, following the order of the round
+    due = DefaultDict(list)
+    for i in sim._round_order(t // sim.delta)[0]:
+        node = sim.nodes[i]
+        if isinstance(node.p2p_net, DynamicP2PNetwork) and node.next_timeout(t) == t:
+            due[id(node.p2p_net)].append((node.p2p_net, node.idx))
+    for batch in due.values():
+        batch[0][0].update_views(np.array([idx for _, idx in batch]), sim._kernel_rng(5, t))
+
 
 class DynamicGossipSimulator(GossipSimulator):
     def __init__(self,
@@ -781,114 +1427,24 @@ class DynamicGossipSimulator(GossipSimulator):
                  delta: int,
                  protocol: AntiEntropyProtocol,
                  drop_prob: float = 0.,  # [0,1] - probability of a message being dropped
-                 online_prob: float = 1.,  # [0,1] - probability of a node to be online
+                 online_prob: Union[float, ChurnModel] = 1.,  # [0,1] - probability of a node to be online
                  delay: Delay = ConstantDelay(0),
                  sampling_eval: float = 0.,  # [0, 1] - percentage of nodes to evaluate
-                 peer_sampling_period: int = 0  # peer_sampling period
+                 peer_sampling_period: int = 0,  # peer_sampling period
+                 **kwargs
                  ):
 
         assert 0 < peer_sampling_period <= delta
         super().__init__(nodes, data_dispatcher, delta, protocol, drop_prob, online_prob, delay,
-                         sampling_eval)
+                         sampling_eval, **kwargs)
         self.peer_sampling_period = peer_sampling_period
 
-    def start(self, n_rounds: int = 100) -> None:
-        """Starts the simulation.
-        The simulation handles the messages exchange between the nodes for ``n_rounds`` rounds.
-        If attached to a :class:`SimulationReport`, the report is updated at each time step,
-        sent/fail message and evaluation.
-
-        Parameters
-        ----------
-        n_rounds : int, default=100
-            The number of rounds of the simulation.
-        """
-        file = open("..\..\check_sampling.txt", "a+")
-
-        assert self.initialized, \
-            "The simulator is not inizialized. Please, call the method 'init_nodes'."
-        LOG.info("Simulation started.")
-        node_ids = np.arange(self.n_nodes)
-
-        pbar = track(range(n_rounds * self.delta), description="Simulating...")
-
-        msg_queues = DefaultDict(list)
-        rep_queues = DefaultDict(list)
+    # docstr-coverage:inherited
+    def _start_timestep(self, t: int) -> None:
+        super()._start_timestep(t)
+        if t % self.peer_sampling_period == 0:
+            _update_views(self, t)
 
-        try:
-            for t in pbar:
-                if t % self.delta == 0:
-                    shuffle(node_ids)
-
-                for i in node_ids:
-                    node = self.nodes[i]
-                    if node.timed_out(t):
-                        if isinstance(node.p2p_net, DynamicP2PNetwork) and t % self.peer_sampling_period == 0:
-                            # file.write(str(n)+"\t\t" for n in node.p2p_net._topology[node])
-                            # file.write("\n")
-                            node.p2p_net.update_view(node_id=i)
-                        peer = node.get_peer()
-                        if peer is None:
-                            break
-                        msg = node.send(t, peer, self.protocol)
-                        self.notify_message(False, msg)
-                        if msg:
-                            if random() >= self.drop_prob:
-                                d = self.delay.get(msg)
-                                msg_queues[t + d].append(msg)
-                            else:
-                                self.notify_message(True)
-
-                is_online = random(self.n_nodes) <= self.online_prob
-                for msg in msg_queues[t]:
-                    if is_online[msg.receiver]:
-                        reply = self.nodes[msg.receiver].receive(t, msg)
-                        if reply:
-                            if random() > self.drop_prob:
-                                d = self.delay.get(reply)
-                                rep_queues[t + d].append(reply)
-                            else:
-                                self.notify_message(True)
-                    else:
-                        self.notify_message(True)
-                del msg_queues[t]
-
-                for reply in rep_queues[t]:
-                    if is_online[reply.receiver]:
-                        self.notify_message(False, reply)
-                        self.nodes[reply.receiver].receive(t, reply)
-                    else:
-                        self.notify_message(True)
-
-                del rep_queues[t]
-
-                if (t + 1) % self.delta == 0:
-                    if self.sampling_eval > 0:
-                        sample = choice(list(self.nodes.keys()),
-                                        max(int(self.n_nodes * self.sampling_eval), 1))
-                        ev = [self.nodes[i].evaluate() for i in sample if self.nodes[i].has_test()]
-                    else:
-                        ev = [n.evaluate() for _, n in self.nodes.items() if n.has_test()]
-                    if ev:
-                        self.notify_evaluation(t, True, ev)
-
-                    if self.data_dispatcher.has_test():
-                        if self.sampling_eval > 0:
-                            ev = [self.nodes[i].evaluate(self.data_dispatcher.get_eval_set())
-                                  for i in sample]
-                        else:
-                            ev = [n.evaluate(self.data_dispatcher.get_eval_set())
-                                  for _, n in self.nodes.items()]
-                        if ev:
-                            self.notify_evaluation(t, False, ev)
-                self.notify_timestep(t)
-
-        except KeyboardInterrupt:
-            LOG.warning("Simulation interrupted by user.")
-
-        pbar.close()
-        self.notify_end()
-        return
 
 class TokenizedGossipSimulator(GossipSimulator):
     def __init__(self,
@@ -899,15 +1455,16 @@ class TokenizedGossipSimulator(GossipSimulator):
                  delta: int,
                  protocol: AntiEntropyProtocol,
                  drop_prob: float = 0.,  # [0,1] - probability of a message being dropped
-                 online_prob: float = 1.,  # [0,1] - probability of a node to be online
+                 online_prob: Union[float, ChurnModel] = 1.,  # [0,1] - probability of a node to be online
                  delay: Delay = ConstantDelay(0),
                  sampling_eval: float = 0.,  # [0, 1] - percentage of nodes to evaluate
+                 **kwargs
                  ):
         """Class that implements a gossip learning simulation using token account :cite:p:`Danner:2018`.
 
-        The simulation happens similary to the :class:`GossipSimulator`, but the communication 
+        The simulation happens similary to the :class:`GossipSimulator`, but the communication
         pattern is handled by a token account algorithm (see :class:`TokenAccount`).
-        Token account based flow control mechanism can be useful in case of bursty communication 
+        Token account based flow control mechanism can be useful in case of bursty communication
         :cite:p:`Hegedus:2021`.
 
         The simulator implements the design pattern Observer (actually Event Receiver) extending
@@ -929,14 +1486,17 @@ class TokenizedGossipSimulator(GossipSimulator):
         token_account : TokenAccount
             The token account strategy.
         utility_fun : Callable[[ModelHandler, ModelHandler, Message], int]
-            Function defining the usefulness of a message. The usefulness expresses the notion that 
-            some messages are more important than others in most applications. For example, in the 
-            broadcast application, the received message is useful if and only if it contains new 
+            Function defining the usefulness of a message. The usefulness expresses the notion that
+            some messages are more important than others in most applications. For example, in the
+            broadcast application, the received message is useful if and only if it contains new
             information for the node.
             The signatue of the function is:
             ``utility_fun(model_handler_1, model_handler_2, msg) -> int``
             where ``model_handler_1`` and ``model_handler_2`` are the model handlers of the
-            nodes involved in the message exchange, and ``msg`` is the message.
+            nodes involved in the message exchange, and ``msg`` is the message. Note that
+            ``model_handler_2`` is the sent value, which can also be a
+            :class:`~gossipy.model.handler.ModelPayload` (see
+            :meth:`~gossipy.model.handler.TorchModelHandler.caching`).
             The function must return an integer value.
         delta : int
             The number of timesteps of a round.
@@ -944,12 +1504,15 @@ class TokenizedGossipSimulator(GossipSimulator):
             The protocol of the gossip simulation.
         drop_prob : float, default=0.
             The probability of a message being dropped.
-        online_prob : float, default=1.
-            The probability of a node to be online.
+        online_prob : float or ChurnModel, default=1.
+            The probability of a node to be online at each timestep, or the churn model of the
+            nodes (see :mod:`gossipy.churn`).
         delay : Delay, default=ConstantDelay(0)
             The (potential) function delay of the messages.
         sampling_eval : float, default=0.
             The percentage of nodes to use during evaluate. If 0 or 1, all nodes are considered.
+        **kwargs
+            Additional arguments of the simulation kernel (see :class:`GossipSimulator`).
         """
 
         super(TokenizedGossipSimulator, self).__init__(nodes,
@@ -959,7 +1522,8 @@ class TokenizedGossipSimulator(GossipSimulator):
                                                        drop_prob,
                                                        online_prob,
                                                        delay,
-                                                       sampling_eval)
+                                                       sampling_eval,
+                                                       **kwargs)
         self.utility_fun = utility_fun
         self.token_account_proto = token_account
         self.accounts = {}
@@ -968,112 +1532,164 @@ class TokenizedGossipSimulator(GossipSimulator):
     def init_nodes(self, seed: int = 98765) -> None:
         super().init_nodes(seed)
         self.accounts = {i: deepcopy(self.token_account_proto) for i in range(self.n_nodes)}
+        for i, account in self.accounts.items():
+            account.set_rng(self._kernel_rng(6, i))
 
     # docstr-coverage:inherited
-    def start(self, n_rounds: int = 100) -> Tuple[List[float], List[float]]:
-        node_ids = np.arange(self.n_nodes)
-        pbar = track(range(n_rounds * self.delta), description="Simulating...")
-        msg_queues = DefaultDict(list)
-        rep_queues = DefaultDict(list)
-        # avg_tokens = [0]
-        try:
-            for t in pbar:
-                if t % self.delta == 0:
-                    shuffle(node_ids)
-                    # if t > 0:
-                    #    avg_tokens.append(np.mean([a.n_tokens for a in self.accounts.values()]))
-
-                for i in node_ids:
-                    node = self.nodes[i]
-                    if node.timed_out(t):
-                        if random() < self.accounts[i].proactive():
-                            peer = node.get_peer()
-                            if peer is None:
-                                break
-                            msg = node.send(t, peer, self.protocol)
-                            self.notify_message(False, msg)
-                            if msg:
-                                if random() >= self.drop_prob:
-                                    d = self.delay.get(msg)
-                                    msg_queues[t + d].append(msg)
-                                else:
-                                    self.notify_message(True)
-                        else:
-                            self.accounts[i].add(1)
-
-                is_online = random(self.n_nodes) <= self.online_prob
-                for msg in msg_queues[t]:
-                    reply = None
-                    if is_online[msg.receiver]:
-                        if msg.value and isinstance(msg.value[0], CacheKey):
-                            sender_mh = CACHE[msg.value[0]]
-                        reply = self.nodes[msg.receiver].receive(t, msg)
-                        if reply:
-                            if random() > self.drop_prob:
-                                d = self.delay.get(reply)
-                                rep_queues[t + d].append(reply)
-                            else:
-                                self.notify_message(True)
-
-                        if not reply:
-                            utility = self.utility_fun(self.nodes[msg.receiver].model_handler,
-                                                       sender_mh, msg)
-                            reaction = self.accounts[msg.receiver].reactive(utility)
-                            if reaction:
-                                self.accounts[msg.receiver].sub(reaction)
-                                for _ in range(reaction):
-                                    peer = node.get_peer()
-                                    if peer is None:
-                                        break
-                                    msg = node.send(t, peer, self.protocol)
-                                    self.notify_message(False, msg)
-                                    if msg:
-                                        if random() >= self.drop_prob:
-                                            d = self.delay.get(msg)
-                                            msg_queues[t + d].append(msg)
-                                        else:
-                                            self.notify_message(True)
-                    else:
-                        self.notify_message(True)
-
-                del msg_queues[t]
-
-                for reply in rep_queues[t]:
-                    if is_online[reply.receiver]:
-                        self.notify_message(False, reply)
-                        self.nodes[reply.receiver].receive(t, reply)
-                    else:
-                        self.notify_message(True)
-                del rep_queues[t]
-
-                if (t + 1) % self.delta == 0:
-                    if self.sampling_eval > 0:
-                        sample = choice(list(self.nodes.keys()),
-                                        max(int(self.n_nodes * self.sampling_eval), 1))
-                        ev = [self.nodes[i].evaluate() for i in sample if self.nodes[i].has_test()]
-                    else:
-                        ev = [n.evaluate() for _, n in self.nodes.items() if n.has_test()]
-                    if ev:
-                        self.notify_evaluation(t, True, ev)
-
-                    if self.data_dispatcher.has_test():
-                        if self.sampling_eval > 0:
-                            ev = [self.nodes[i].evaluate(self.data_dispatcher.get_eval_set())
-                                  for i in sample]
-                        else:
-                            ev = [n.evaluate(self.data_dispatcher.get_eval_set())
-                                  for _, n in self.nodes.items()]
-                        if ev:
-                            self.notify_evaluation(t, False, ev)
-
-                self.notify_timestep(t)
+    def _pre_send(self, t: int, node: GossipNode) -> bool:
+        if self._random() < self.accounts[node.idx].proactive():
+            return True
+        self.accounts[node.idx].add(1)
+        return False
 
-        except KeyboardInterrupt:
-            LOG.warning("Simulation interrupted by user.")
+    # docstr-coverage:inherited
+    def _deliver(self, t: int, msg: Message) -> None:
+        if not self._is_online(msg.receiver):
+            self._discard(msg, "offline")
+            return
+
+        node = self.nodes[msg.receiver]
+        sender_mh = None
+        if msg.value and isinstance(msg.value[0], CacheKey):
+            sender_mh = CACHE[msg.value[0]]
+        reply = self._receive(t, msg)
+        if reply:
+            self._send_reply(t, reply)
+        else:
+            utility = self.utility_fun(node.model_handler, sender_mh, msg)
+            reaction = self.accounts[msg.receiver].reactive(utility)
+            if reaction:
+                self.accounts[msg.receiver].sub(reaction)
+                for _ in range(reaction):
+                    peer = node.get_peer()
+                    if peer is None:
+                        break
+                    self._send(t, node, peer, self.protocol)
+
+
+class ReplaySimulator(GossipSimulator):
+    def __init__(self,
+                 nodes: Dict[int, GossipNode],
+                 data_dispatcher: DataDispatcher,
+                 delta: int,
+                 trace: Union[CommunicationTrace, str],
+                 sampling_eval: float = 0.,
+                 profile: bool = False,
+                 executor: Optional[ReceiveExecutor] = None
+                 ):
+        """Simulator that replays a recorded communication trace
+        (see :meth:`GossipSimulator.record_trace`).
 
-        pbar.close()
-        self.notify_end()
-        return
+        The schedule of the messages, i.e., who sends to whom and when, which messages are lost
+        and when the others are received, is read from the trace. Thus, the simulator only runs
+        the sends, merges and updates of the nodes: there are no time-outs, peer sampling, drops,
+        delays or churn to compute. Replaying the same trace with different model handlers
+        compares them on exactly the same schedule.
+
+        The replay assumes that the nodes act only through :meth:`GossipNode.send` and
+        :meth:`GossipNode.receive`, as in :class:`GossipSimulator`. The messages sent in
+        reaction to a delivery (e.g., in :class:`TokenizedGossipSimulator`) are replayed before
+        the deliveries of their timestep.
+
+        Parameters
+        ----------
+        nodes : dict[int, GossipNode]
+            The nodes participating in the simulation. The keys are the node ids, and the values
+            are the corresponding nodes (instances of the class :class:`GossipNode`).
+        data_dispatcher : DataDispatcher
+            The data dispatcher. Useful if the evaluation is performed on a separate test set, i.e.,
+            not on the nodes.
+        delta : int
+            The number of timesteps of a round.
+        trace : CommunicationTrace or str
+            The trace or the path of the file containing it (see :meth:`CommunicationTrace.save`).
+        sampling_eval : float, default=0.
+            The percentage of nodes to use during evaluate. If 0 or 1, all nodes are considered.
+        profile : bool, default=False
+            Whether to measure the time spent in the hooks of the kernel.
+        executor : ReceiveExecutor, default=None
+            The executor of the receives of the messages delivered in the same timestep.
+        """
+
+        super(ReplaySimulator, self).__init__(nodes, data_dispatcher, delta,
+                                              AntiEntropyProtocol.PUSH,
+                                              sampling_eval=sampling_eval,
+                                              profile=profile, executor=executor)
+        self.trace = trace if isinstance(trace, CommunicationTrace) else CommunicationTrace.load(trace)
+        assert self.trace.n_nodes == self.n_nodes, \
+            "The trace has %d nodes, but the simulation has %d." %(self.trace.n_nodes, self.n_nodes)
+        self._sends = np.searchsorted(self.trace["send_t"], np.arange(self.trace.horizon + 1))
+        self._columns = {c: self.trace[c].tolist() for c in ("deliver_t", "reply_t", "sender",
+                                                              "receiver", "protocol")}
+        self._replayed = {}
+
+    # docstr-coverage:inherited
+    def _is_online(self, idx: int) -> bool:
+        # The trace contains only the messages that have been received
+        return True
+
+    # docstr-coverage:inherited
+    def _query_online(self, msgs: List[Message]) -> None:
+        pass
+
+    def _replay_send(self, t: int, i: int) -> None:
+        cols = self._columns
+        node = self.nodes[cols["sender"][i]]
+        msg = node.send(t, cols["receiver"][i], AntiEntropyProtocol(cols["protocol"][i]))
+        self.notify_message(False, msg)
+        if msg:
+            if cols["deliver_t"][i] == CommunicationTrace.NOT_RECEIVED:
+                self._discard(msg, "dropped")
+            else:
+                self._replayed[id(msg)] = i
+                self._schedule(self._replay_time(cols["deliver_t"][i]), msg)
+
+    def _replay_time(self, t: int) -> int:
+        # The messages in flight at the end of the recording are never delivered
+        return self._horizon if t == CommunicationTrace.IN_FLIGHT else t
+
+    # docstr-coverage:inherited
+    def _deliver(self, t: int, msg: Message) -> None:
+        i = self._replayed.pop(id(msg))
+        reply = self._receive(t, msg)
+        if reply:
+            reply_t = self._columns["reply_t"][i]
+            if reply_t in (CommunicationTrace.NOT_RECEIVED, CommunicationTrace.NO_REPLY):
+                self._discard(reply, "dropped")
+            else:
+                self._schedule(self._replay_time(reply_t), reply, reply=True)
+
+    # docstr-coverage:inherited
+    def _deliver_reply(self, t: int, reply: Message) -> None:
+        self.notify_message(False, reply)
+        self._receive(t, reply)
+
+    # docstr-coverage:inherited
+    def _timestepped_loop(self, t: int) -> None:
+        self._now = t
+        if t < self.trace.horizon:
+            for i in range(self._sends[t], self._sends[t + 1]):
+                self._replay_send(t, i)
+
+        self._deliver_batch(t, self._msg_queues[t])
+        del self._msg_queues[t]
+
+        self._deliver_batch(t, self._rep_queues[t], reply=True)
+        del self._rep_queues[t]
+
+    def start(self, n_rounds: Optional[int] = None) -> None:
+        """Starts the replay of the trace.
+
+        Parameters
+        ----------
+        n_rounds : int, default=None
+            The number of rounds of the simulation. If `None`, the whole trace is replayed.
+        """
+
+        if n_rounds is None:
+            n_rounds = -(-self.trace.horizon // self.delta)
+        self._replayed = {}
+        self._run(n_rounds)
 
 
 # def repeat_simulation(gossip_simulator: GossipSimulator,
@@ -1104,6 +1720,8 @@ class TokenizedGossipSimulator(GossipSimulator):
 #     return eval_list, eval_user_list
 
 
+
+
 class All2AllGossipSimulator(GossipSimulator):
     def __init__(self,
                  nodes: Dict[int, All2AllGossipNode],
@@ -1111,9 +1729,10 @@ class All2AllGossipSimulator(GossipSimulator):
                  delta: int,
                  protocol: AntiEntropyProtocol,
                  drop_prob: float = 0.,  # [0,1] - probability of a message being dropped
-                 online_prob: float = 1.,  # [0,1] - probability of a node to be online
+                 online_prob: Union[float, ChurnModel] = 1.,  # [0,1] - probability of a node to be online
                  delay: Delay = ConstantDelay(0),
                  sampling_eval: float = 0.,  # [0, 1] - percentage of nodes to evaluate
+                 **kwargs
                  ):
         """Simulator for the all-to-all gossip protocol.
 
@@ -1131,14 +1750,27 @@ class All2AllGossipSimulator(GossipSimulator):
             The protocol of the gossip simulation.
         drop_prob : float, default=0.
             The probability of a message being dropped.
-        online_prob : float, default=1.
-            The probability of a node to be online.
+        online_prob : float or ChurnModel, default=1.
+            The probability of a node to be online at each timestep, or the churn model of the
+            nodes (see :mod:`gossipy.churn`).
         delay : Delay, default=ConstantDelay(0)
             The (potential) function delay of the messages.
         sampling_eval : float, default=0.
             The percentage of nodes to use during evaluate. If 0 or 1, all nodes are considered.
+        **kwargs
+            Additional arguments of the simulation kernel (see :class:`GossipSimulator`).
         """
-        super().__init__(nodes, data_dispatcher, delta, protocol, drop_prob, online_prob, delay, sampling_eval)
+        super().__init__(nodes, data_dispatcher, delta, protocol, drop_prob, online_prob, delay, sampling_eval,
+                         **kwargs)
+        self.W_matrix = None
+
+    # docstr-coverage:inherited
+    def _timed_out(self, t: int, node: GossipNode) -> bool:
+        return node.timed_out(t, self.W_matrix)
+
+    # docstr-coverage:inherited
+    def _select_peers(self, t: int, node: GossipNode) -> List[Tuple[int, AntiEntropyProtocol]]:
+        return [(peer, self.protocol) for peer in node.get_peers()]
 
     def start(self,
               W_matrix: MixingMatrix,
@@ -1146,7 +1778,7 @@ class All2AllGossipSimulator(GossipSimulator):
         """Starts the simulation.
 
         The simulation handles the messages exchange between the nodes for ``n_rounds`` rounds.
-        If attached to a :class:`SimulationReport`, the report is updated at each time step, 
+        If attached to a :class:`SimulationReport`, the report is updated at each time step,
         sent/fail message and evaluation.
 
         Parameters
@@ -1158,557 +1790,223 @@ class All2AllGossipSimulator(GossipSimulator):
             The number of rounds of the simulation.
         """
 
-        assert self.initialized, \
-            "The simulator is not inizialized. Please, call the method 'init_nodes'."
-        LOG.info("Simulation started.")
-        node_ids = np.arange(self.n_nodes)
-
-        pbar = track(range(n_rounds * self.delta), description="Simulating...")
-        msg_queues = DefaultDict(list)
-        rep_queues = DefaultDict(list)
-
-        try:
-            for t in pbar:
-                if t % self.delta == 0:
-                    shuffle(node_ids)
-
-                for i in node_ids:
-                    node = self.nodes[i]
-                    if node.timed_out(t, W_matrix[i]):
-                        peers = node.get_peers()
-                        for peer in peers:
-                            msg = node.send(t, peer, self.protocol)
-                            self.notify_message(False, msg)
-                            if msg:
-                                if random() >= self.drop_prob:
-                                    d = self.delay.get(msg)
-                                    msg_queues[t + d].append(msg)
-                                else:
-                                    self.notify_message(True)
-
-                is_online = random(self.n_nodes) <= self.online_prob
-                for msg in msg_queues[t]:
-                    if is_online[msg.receiver]:
-                        reply = self.nodes[msg.receiver].receive(t, msg)
-                        if reply:
-                            if random() > self.drop_prob:
-                                d = self.delay.get(reply)
-                                rep_queues[t + d].append(reply)
-                            else:
-                                self.notify_message(True)
-                    else:
-                        self.notify_message(True)
-                del msg_queues[t]
-
-                for reply in rep_queues[t]:
-                    if is_online[reply.receiver]:
-                        self.notify_message(False, reply)
-                        self.nodes[reply.receiver].receive(t, reply)
-                    else:
-                        self.notify_message(True)
-
-                del rep_queues[t]
-
-                if (t + 1) % self.delta == 0:
-                    if self.sampling_eval > 0:
-                        sample = choice(list(self.nodes.keys()),
-                                        max(int(self.n_nodes * self.sampling_eval), 1))
-                        ev = [self.nodes[i].evaluate() for i in sample if self.nodes[i].has_test()]
-                    else:
-                        ev = [n.evaluate() for _, n in self.nodes.items() if n.has_test()]
-                    if ev:
-                        self.notify_evaluation(t, True, ev)
-
-                    if self.data_dispatcher.has_test():
-                        if self.sampling_eval > 0:
-                            ev = [self.nodes[i].evaluate(self.data_dispatcher.get_eval_set())
-                                  for i in sample]
-                        else:
-                            ev = [n.evaluate(self.data_dispatcher.get_eval_set())
-                                  for _, n in self.nodes.items()]
-                        if ev:
-                            self.notify_evaluation(t, False, ev)
-                self.notify_timestep(t)
-
-        except KeyboardInterrupt:
-            LOG.warning("Simulation interrupted by user.")
-
-        pbar.close()
-        self.notify_end()
-        return
+        self.W_matrix = W_matrix
+        self._run(n_rounds)
 
-import time
 
 class AttackGossipSimulator(GossipSimulator):
-    def __init__(self, 
-                 nodes: Dict[int, GossipNode], 
+    def __init__(self,
+                 nodes: Dict[int, GossipNode],
                  data_dispatcher: DataDispatcher,
-                 delta: int, 
+                 delta: int,
                  protocol: AntiEntropyProtocol,
-                 drop_prob: float = 0., 
-                 online_prob: float = 1.,
-                 delay: Delay = ConstantDelay(0), 
+                 drop_prob: float = 0.,
+                 online_prob: Union[float, ChurnModel] = 1.,
+                 delay: Delay = ConstantDelay(0),
                  sampling_eval: float = 0.,
                  mia: bool = False,
                  mar: bool = False,
-                 ra: bool = False):
+                 ra: bool = False,
+                 **kwargs):
             self.mia = mia
             self.mar = mar
             self.ra = ra
             super().__init__(nodes, data_dispatcher, delta, protocol, drop_prob,
-                            online_prob, delay, sampling_eval)
+                            online_prob, delay, sampling_eval, **kwargs)
+
+    def _marginalized_nodes(self) -> List[GossipNode]:
+        return [n for _, n in self.nodes.items()
+                if isinstance(n, AttackGossipNode) and getattr(n, 'marginalized_state', False)]
+
+    def _probe_attacks(self, t: int) -> None:
+        """Performs the enabled attacks at the end of a round and notifies the receivers.
+
+        The membership inference attacks (``mia`` and ``mar``) are performed at every round,
+        while the reconstruction attack (``ra``) on the marginalized nodes every 10 rounds and
+        its results are logged. The attacks are performed by the subclasses as well, e.g., by
+        :class:`AttackDynamicGossipSimulator`.
+
+        Parameters
+        ----------
+        t : int
+            The current timestamp.
+        """
+
+        self.n_rounds = int(round(t, -2)/100)
+        if not self._receivers:
+            return
+
+        if self.mia:
+            mia_vulnerability = [mia_for_each_nn(self, n) for _, n in self.nodes.items()]
+            for er in self._receivers:
+                er.update_mia_vulnerability(self.n_rounds, mia_vulnerability)
+        if self.mar:
+            mia_mar_vulnerability = [mia_for_each_nn(self, n) for n in self._marginalized_nodes()]
+            if any(item is not None for item in mia_mar_vulnerability):
+                for er in self._receivers:
+                    er.update_mia_vulnerability(self.n_rounds, mia_mar_vulnerability, marginalized = True)
+        if self.ra and self.n_rounds % 10 == 0:
+            ra_mar_vulnerability = [ra_for_each_nn(n, marginalized=True) for n in self._marginalized_nodes()]
+            LOG.info("Reconstruction attack on the marginalized nodes (round %d): %s" %
+                     (self.n_rounds, ra_mar_vulnerability))
+
+    # docstr-coverage:inherited
+    def _evaluate(self, t: int) -> None:
+        sample = self._evaluation_nodes()
+        ev = [self.nodes[i].evaluate() for i in sample if self.nodes[i].has_test()]
+        ev_train = [self.nodes[i].evaluate(self.nodes[i].data[0]) for i in sample]
+        if ev:
+            self.notify_evaluation(self.n_rounds, True, ev)
+            accuracy = []
+            for node_ev, node_ev_train in zip(ev, ev_train):
+                accuracy.append({
+                    "test" : node_ev['accuracy'],
+                    "train" : node_ev_train['accuracy']
+                })
+
+            for er in self._receivers:
+                er.update_accuracy(self.n_rounds, True, accuracy)
+
+        if self.data_dispatcher.has_test():
+            ev = [self.nodes[i].evaluate(self.data_dispatcher.get_eval_set()) for i in sample]
+            if ev:
+                self.notify_evaluation(self.n_rounds, False, ev)
+                accuracy = []
+                for node_ev in ev:
+                    accuracy.append({
+                        "test" : node_ev['accuracy'],
+                    })
+                for er in self._receivers:
+                    er.update_accuracy(self.n_rounds, False, accuracy)
 
     def start(self, n_rounds: int = 100, attackerNode: int = 0, wall_time_limit: int = None) -> None:
-        assert self.initialized, \
-            "The simulator is not inizialized. Please, call the method 'init_nodes'."
-        LOG.info("Simulation started.")
-        node_ids = np.arange(self.n_nodes)
-        pbar = track(range(n_rounds * self.delta), description="Simulating...")
+        """Starts the simulation.
 
-        msg_queues = DefaultDict(list)
-        rep_queues = DefaultDict(list)
-        start_time = time.time()
-        wall_time_limit = wall_time_limit * 3600
+        The simulation handles the messages exchange between the nodes for ``n_rounds`` rounds.
+        At the end of each round, the enabled attacks are performed and the accuracy of the nodes
+        is reported to the attached :class:`AttackSimulationReport`.
 
-        try:
-            for t in pbar:
-                if wall_time_limit is not None and (time.time() - start_time) > wall_time_limit:
-                    LOG.info(f"Simulation stopped after reaching the wall time limit of {wall_time_limit} seconds.")
-                    break
-                self.n_rounds = int(round(t, -2)/100)
-                if t % self.delta == 0:
-                    shuffle(node_ids)
-
-                for i in node_ids:
-                    node = self.nodes[i]
-                    if node.timed_out(t):
-                        peer = node.get_peer()
-                        if peer is None:
-                            break
-                        msg = node.send(t, peer, self.protocol)
-                        self.notify_message(False, msg)
-                        if msg:
-                            if random() >= self.drop_prob:
-                                d = self.delay.get(msg)
-                                msg_queues[t + d].append(msg)
-                            else:
-                                self.notify_message(True)
-
-                is_online = random(self.n_nodes) <= self.online_prob
-                for msg in msg_queues[t]:
-                    if is_online[msg.receiver]:
-                        reply = self.nodes[msg.receiver].receive(t, msg)
-                        if reply:
-                            if random() > self.drop_prob:
-                                d = self.delay.get(reply)
-                                rep_queues[t + d].append(reply)
-                            else:
-                                self.notify_message(True)
-                    else:
-                        self.notify_message(True)
-                del msg_queues[t]
-
-                for reply in rep_queues[t]:
-                    if is_online[reply.receiver]:
-                        self.notify_message(False, reply)
-                        self.nodes[reply.receiver].receive(t, reply)
-                    else:
-                        self.notify_message(True)
-
-                del rep_queues[t]
-
-                if (t + 1) % self.delta == 0:
-
-                    for er in self._receivers:
-                            if self.mia : 
-                                mia_vulnerability = [mia_for_each_nn(self, n) for _, n in self.nodes.items()]       
-                                er.update_mia_vulnerability(self.n_rounds, mia_vulnerability)
-                            if self.mar :
-                                mia_mar_vulnerability = [mia_for_each_nn(self, n) for _, n in self.nodes.items() if isinstance(n, AttackGossipNode) and getattr(n, 'marginalized_state', False)]
-                                if any(item is not None for item in mia_mar_vulnerability):
-                                    er.update_mia_vulnerability(self.n_rounds, mia_mar_vulnerability, marginalized = True)
-                            if self.ra and self.n_rounds % 10 == 0: 
-                                print("-------------------------------------------------------")
-                                ra_mar_vulnerability = [ra_for_each_nn(n, marginalized=True) for _, n in self.nodes.items() if isinstance(n, AttackGossipNode) and getattr(n, 'marginalized_state', False)]
-                                print(ra_mar_vulnerability)
-                                print("-------------------------------------------------------")
-                    if self.sampling_eval > 0:
-                        sample = choice(list(self.nodes.keys()), max(int(self.n_nodes * self.sampling_eval), 1))
-                        ev = [self.nodes[i].evaluate() for i in sample if self.nodes[i].has_test()]
-                        ev_train = [self.nodes[i].evaluate(self.nodes[i].data[0]) for i in sample]
-                    else:
-                        ev = [n.evaluate() for _, n in self.nodes.items() if n.has_test()]
-                        ev_train = [n.evaluate(n.data[0]) for _, n in self.nodes.items()]
-                    if ev:
-                        self.notify_evaluation(self.n_rounds, True, ev)
-                        accuracy = []
-                        for i, (node_ev, node_ev_train) in enumerate(zip(ev, ev_train)):
-                            accuracy.append({
-                                "test" : node_ev['accuracy'],
-                                "train" : node_ev_train['accuracy']
-                            })
-                        
-                        for er in self._receivers:
-                            er.update_accuracy(self.n_rounds, True, accuracy)
-
-                    if self.data_dispatcher.has_test():
-                        if self.sampling_eval > 0:
-                            ev = [self.nodes[i].evaluate(self.data_dispatcher.get_eval_set()) for i in sample]
-                        else:
-                            ev = [n.evaluate(self.data_dispatcher.get_eval_set()) for _, n in self.nodes.items()]
-
-                        if ev:
-                            self.notify_evaluation(self.n_rounds, False, ev)
-                            accuracy = []
-                            for i, node_ev in enumerate(ev):
-                                accuracy.append({
-                                    "test" : node_ev['accuracy'],
-                                })
-                            for er in self._receivers:
-                                er.update_accuracy(self.n_rounds, False, accuracy)
-
-                self.notify_timestep(t)
+        Parameters
+        ----------
+        n_rounds : int, default=100
+            The number of rounds of the simulation.
+        attackerNode : int, default=0
+            Unused, kept for backward compatibility.
+        wall_time_limit : int, default=None
+            The maximum duration of the simulation in hours. If `None`, there is no limit.
+        """
 
-        except KeyboardInterrupt:
-            #log_results(self, self._receivers[0], "")
-            LOG.warning("Simulation interrupted by user.")
+        self._run(n_rounds, wall_time_limit)
 
-        pbar.close()
-        self.notify_end()
-        return
-    
-class AttackDynamicGossipSimulator(GossipSimulator):
+
+class AttackDynamicGossipSimulator(AttackGossipSimulator):
     def __init__(self,
                  nodes: Dict[int, GossipNode],
                  data_dispatcher: DataDispatcher,
                  delta: int,
                  protocol: AntiEntropyProtocol,
                  drop_prob: float = 0.,  # [0,1] - probability of a message being dropped
-                 online_prob: float = 1.,  # [0,1] - probability of a node to be online
+                 online_prob: Union[float, ChurnModel] = 1.,  # [0,1] - probability of a node to be online
                  delay: Delay = ConstantDelay(0),
                  sampling_eval: float = 0.,  # [0, 1] - percentage of nodes to evaluate
                  peer_sampling_period: int = 0,  # peer_sampling period
                  mia: bool = False,
                  mar: bool = False,
-                 ra: bool = False):
+                 ra: bool = False,
+                 **kwargs):
         assert 0 < peer_sampling_period <= delta
         super().__init__(nodes, data_dispatcher, delta, protocol, drop_prob, online_prob, delay,
-                         sampling_eval)
+                         sampling_eval, mia, mar, ra, **kwargs)
         self.peer_sampling_period = peer_sampling_period
-        self.mia = mia
-        self.mar = mar
-        self.ra = ra
-        self.attackerNode = self.nodes[int(random() * len(self.nodes))]
+        self.attackerNode = None
 
-    def start(self, n_rounds: int = 100, wall_time_limit: int = None) -> None:
-        """Starts the simulation.
-        The simulation handles the messages exchange between the nodes for ``n_rounds`` rounds.
-        If attached to a :class:`SimulationReport`, the report is updated at each time step,
-        sent/fail message and evaluation.
-
-        Parameters
-        ----------
-        n_rounds : int, default=100
-            The number of rounds of the simulation.
-        """
-        file = open("..\..\check_sampling.txt", "a+")
-
-        assert self.initialized, \
-            "The simulator is not inizialized. Please, call the method 'init_nodes'."
-        LOG.info("Simulation started.")
-        node_ids = np.arange(self.n_nodes)
-
-        pbar = track(range(n_rounds * self.delta), description="Simulating...")
-
-        msg_queues = DefaultDict(list)
-        rep_queues = DefaultDict(list)
-        start_time = time.time()
-        wall_time_limit = wall_time_limit * 3600
+    # docstr-coverage:inherited
+    def init_nodes(self, seed: int = 98765) -> None:
+        super().init_nodes(seed)
+        self.attackerNode = self.nodes[int(self._kernel_rng(7).integers(len(self.nodes)))]
 
-        try:
-            for t in pbar:
-                if wall_time_limit is not None and (time.time() - start_time) > wall_time_limit:
-                    LOG.info(f"Simulation stopped after reaching the wall time limit of {wall_time_limit} seconds.")
-                    break
-                self.n_rounds = int(round(t, -2)/100)
-                if t % self.delta == 0:
-                    shuffle(node_ids)
-
-                for i in node_ids:
-                    node = self.nodes[i]
-                    if node.timed_out(t):
-                        if isinstance(node.p2p_net, UniformDynamicP2PNetwork) and t % self.peer_sampling_period == 0:
-                            node.p2p_net.update_view(node_id=i)
-                        peer = node.get_peer()
-                        if peer is None:
-                            break
-                        msg = node.send(t, peer, self.protocol)
-                        self.notify_message(False, msg)
-                        if msg:
-                            if random() >= self.drop_prob:
-                                d = self.delay.get(msg)
-                                msg_queues[t + d].append(msg)
-                            else:
-                                self.notify_message(True)
-
-                is_online = random(self.n_nodes) <= self.online_prob
-                for msg in msg_queues[t]:
-                    if is_online[msg.receiver]:
-                        reply = self.nodes[msg.receiver].receive(t, msg)
-                        if reply:
-                            if random() > self.drop_prob:
-                                d = self.delay.get(reply)
-                                rep_queues[t + d].append(reply)
-                            else:
-                                self.notify_message(True)
-                    else:
-                        self.notify_message(True)
-                del msg_queues[t]
-
-                for reply in rep_queues[t]:
-                    if is_online[reply.receiver]:
-                        self.notify_message(False, reply)
-                        self.nodes[reply.receiver].receive(t, reply)
-                    else:
-                        self.notify_message(True)
-
-                del rep_queues[t]
-
-                if (t + 1) % self.delta == 0:
-                    for er in self._receivers:
-                            if self.mia : 
-                                mia_vulnerability = [mia_for_each_nn(self, n) for _, n in self.nodes.items()]
-                                er.update_mia_vulnerability(self.n_rounds, mia_vulnerability)
-                            if self.mar : 
-                                mia_mar_vulnerability = [mia_for_each_nn(self, n) for _, n in self.nodes.items() if isinstance(n, AttackGossipNode) and getattr(n, 'marginalized_state', False)]
-                                if any(item is not None for item in mia_mar_vulnerability):
-                                    er.update_mia_vulnerability(self.n_rounds, mia_mar_vulnerability, marginalized = True)
-
-                    if self.sampling_eval > 0:
-                        sample = choice(list(self.nodes.keys()), max(int(self.n_nodes * self.sampling_eval), 1))
-                        ev = [self.nodes[i].evaluate() for i in sample if self.nodes[i].has_test()]
-                        ev_train = [self.nodes[i].evaluate(self.nodes[i].data[0]) for i in sample]
-                    else:
-                        ev = [n.evaluate() for _, n in self.nodes.items() if n.has_test()]
-                        ev_train = [n.evaluate(n.data[0]) for _, n in self.nodes.items()]
-                    if ev:
-                        self.notify_evaluation(self.n_rounds, True, ev)
-                        accuracy = []
-                        for i, (node_ev, node_ev_train) in enumerate(zip(ev, ev_train)):
-                            accuracy.append({
-                                "test" : node_ev['accuracy'],
-                                "train" : node_ev_train['accuracy']
-                            })
-                        
-                        for er in self._receivers:
-                            er.update_accuracy(self.n_rounds, True, accuracy)
-
-                    if self.data_dispatcher.has_test():
-                        if self.sampling_eval > 0:
-                            ev = [self.nodes[i].evaluate(self.data_dispatcher.get_eval_set()) for i in sample]
-                        else:
-                            ev = [n.evaluate(self.data_dispatcher.get_eval_set()) for _, n in self.nodes.items()]
-                            
-                        if ev:
-                            self.notify_evaluation(self.n_rounds, False, ev)
-                            accuracy = []
-                            for i, node_ev in enumerate(ev):
-                                accuracy.append({
-                                    "test" : node_ev['accuracy'],
-                                })
-                            for er in self._receivers:
-                                er.update_accuracy(self.n_rounds, False, accuracy)
-                self.notify_timestep(t)
+    # docstr-coverage:inherited
+    def _start_timestep(self, t: int) -> None:
+        super()._start_timestep(t)
+        if t % self.peer_sampling_period == 0:
+            _update_views(self, t)
 
-        except KeyboardInterrupt:
-            #log_results(self, self._receivers[0], "")
-            LOG.warning("Simulation interrupted by user.")
+    # docstr-coverage:inherited
+    def start(self, n_rounds: int = 100, wall_time_limit: int = None) -> None:
+        self._run(n_rounds, wall_time_limit)
 
-        pbar.close()
-        self.notify_end()
-        return
 
-class AttackFederatedSimulator(GossipSimulator):
+class AttackFederatedSimulator(AttackGossipSimulator):
     def __init__(self, nodes: Dict[int, GossipNode], data_dispatcher: DataDispatcher,
             delta: int, protocol: AntiEntropyProtocol,
-            drop_prob: float = 0., online_prob: float = 1.,
+            drop_prob: float = 0., online_prob: Union[float, ChurnModel] = 1.,
             delay: Delay = ConstantDelay(0), sampling_eval: float = 0.,
             mia: bool = False,
             mar: bool = False,
-            ra: bool = False):
+            ra: bool = False,
+            **kwargs):
             super().__init__(nodes, data_dispatcher, delta, protocol, drop_prob,
-                            online_prob, delay, sampling_eval)
+                            online_prob, delay, sampling_eval, mia, mar, ra, **kwargs)
             self.attackerNode = self.nodes[0]
-            self.mia = mia
-            self.mar = mar
-            self.ra = ra
-
-    def init_nodes(self, seed:int=98765) -> None:
-        """Initializes the nodes.
-
-        The initialization of the nodes usually involves the initialization of the local model
-        (see :meth:`GossipNode.init_model`).
-
-        Parameters
-        ----------
-        seed : int, default=98765
-            The seed for the random number generator.
-        """
-
-        self.initialized = True
-        for _, node in self.nodes.items():
-            node.init_model()
-    
-    # def add_nodes(self, nodes: List[GossipNode]) -> None:
-    #     assert not self.initialized, "'init_nodes' must be called before adding new nodes."
-    #     for node in nodes:
-    #         node.idx = self.n_nodes
-    #         node.init_model()
-    #         self.nodes[node.idx] = node
-    #         self.n_nodes += 1
-
 
-    def start(self, n_rounds: int=100, wall_time_limit: int = None) -> None:
-        """Starts the simulation.
-
-        The simulation handles the messages exchange between the nodes for ``n_rounds`` rounds.
-        If attached to a :class:`SimulationReport`, the report is updated at each time step, 
-        sent/fail message and evaluation.
+    # docstr-coverage:inherited
+    def _select_peers(self, t: int, node: GossipNode) -> List[Tuple[int, AntiEntropyProtocol]]:
+        if not node.server_state:
+            return []
+        if len(node.node_selected) == 0:
+            neighbors = node.p2p_net.get_peers(node.idx)
+            peers = self._kernel_choice((4, t, node.idx), neighbors,
+                                        max(int((len(neighbors) - 1) * 1), 1), replace=False)
+            node.node_selected.extend(peers)
+        return [(peer, AntiEntropyProtocol.PUSH_PULL) for peer in node.node_selected]
+
+    def _probe_attacks(self, t: int) -> None:
+        """Performs the membership inference attacks of the server (node 0) at the end of a
+        round.
+
+        When ``mar`` is set, the marginalized attack is performed by the server itself if it is a
+        :class:`gossipy.node.FederatedAttackGossipNode` in the marginalized state, otherwise zero
+        vulnerabilities are reported. Note that this differs from the simulator before the
+        refactoring on the simulation kernel, whose check was made on the index of the server
+        rather than on the server node: it never held, thus zero marginalized vulnerabilities
+        were always reported, also for marginalized attacking servers.
 
         Parameters
         ----------
-        n_rounds : int, default=100
-            The number of rounds of the simulation.
+        t : int
+            The current timestamp.
         """
 
-        assert self.initialized, \
-               "The simulator is not inizialized. Please, call the method 'init_nodes'."
-        LOG.info("Simulation started.")
-        node_ids = np.arange(self.n_nodes)
-        self.n_rounds = n_rounds
-        
-        pbar = track(range(n_rounds * self.delta), description="Simulating...")
-        msg_queues = DefaultDict(list)
-        rep_queues = DefaultDict(list)
-        start_time = time.time()
-        wall_time_limit = wall_time_limit * 3600
-
-        try:
-            for t in pbar:
-                if wall_time_limit is not None and (time.time() - start_time) > wall_time_limit:
-                    LOG.info(f"Simulation stopped after reaching the wall time limit of {wall_time_limit} seconds.")
-                    break
-                self.n_rounds = int(round(t, -2)/100)
-                if t % self.delta == 0: 
-                    shuffle(node_ids)
-                    
-                for i in node_ids:
-                    node = self.nodes[i]
-                    if node.timed_out(t):
-                        if node.server_state:
-                            if (len(node.node_selected)==0):
-                                neighbors = node.p2p_net.get_peers(node.idx)
-                                peers = choice(neighbors,  max(int((len(neighbors) - 1) * 1), 1), replace=False)
-                                protocol = AntiEntropyProtocol.PUSH_PULL
-                                for peer in peers:
-                                    node.node_selected.append(peer)
-                            else:
-                                peers = node.node_selected
-                                  
-                            for peer in peers:
-                                msg = node.send(t, peer, protocol)
-                                self.notify_message(False, msg)
-                                if msg:
-                                    if random() >= self.drop_prob:
-                                        d = self.delay.get(msg)
-                                        msg_queues[t + d].append(msg)
-                                    else:
-                                        self.notify_message(True)
-                
-                is_online = random(self.n_nodes) <= self.online_prob
-                for msg in msg_queues[t]:
-                    if is_online[msg.receiver]:
-                        reply = self.nodes[msg.receiver].receive(t, msg)
-                        if reply:
-                            if random() > self.drop_prob:
-                                d = self.delay.get(reply)
-                                rep_queues[t + d].append(reply)
-                            else:
-                                self.notify_message(True)
-                    else:
-                        self.notify_message(True)
-                del msg_queues[t]
-
-                for reply in rep_queues[t]:
-                    if is_online[reply.receiver]:
-                        self.notify_message(False, reply)
-                        self.nodes[reply.receiver].receive(t, reply)
-                    else:
-                        self.notify_message(True)
-                    
-                del rep_queues[t]
-
-                if (t + 1) % self.delta == 0:
-                    for er in self._receivers:
-                            if self.mia:
-                                mia_vulnerability = [mia_for_each_nn(self, self.nodes[0])]
-                                er.update_mia_vulnerability(self.n_rounds, mia_vulnerability)
-                            if self.mar : 
-                                if isinstance(0, FederatedAttackGossipNode) and getattr(0, 'marginalized_state', False):
-                                    mia_mar_vulnerability = [mia_for_each_nn(self, self.nodes[0])]
-                                else:
-                                    mia_results = {
-                                        "loss_mia": 0,
-                                        "entropy_mia": 0
-                                    }
-                                    mia_mar_vulnerability = [mia_results]
-                                if any(item is not None for item in mia_mar_vulnerability):
-                                    er.update_mia_vulnerability(self.n_rounds, mia_mar_vulnerability, marginalized = True)
-
-                    if self.sampling_eval > 0:
-                        node_ids = [node_id for node_id in self.nodes.keys() if node_id != 0]
-                        sample = choice(node_ids, max(int((self.n_nodes - 1) * self.sampling_eval), 1))
-                        print(sample)
-                        ev = [self.nodes[i].evaluate() for i in sample if self.nodes[i].has_test()]
-                        ev_train = [self.nodes[i].evaluate(self.nodes[i].data[0]) for i in sample]
-                    else:
-                        ev = [n.evaluate() for _, n in self.nodes.items() if n.has_test() and n.idx != 0]
-                        ev_train = [n.evaluate(n.data[0]) for _, n in self.nodes.items() if n.idx != 0]
-                    if ev:
-                        self.notify_evaluation(self.n_rounds, True, ev)
-                        accuracy = []
-                        for i, (node_ev, node_ev_train) in enumerate(zip(ev, ev_train)):
-                            accuracy.append({
-                                "test" : node_ev['accuracy'],
-                                "train" : node_ev_train['accuracy']
-                            })
-                        
-                        for er in self._receivers:
-                            er.update_accuracy(self.n_rounds, True, accuracy)
-
-                    if self.data_dispatcher.has_test():
-                        if self.sampling_eval > 0:
-                            ev = [self.nodes[i].evaluate(self.data_dispatcher.get_eval_set()) for i in sample]
-                        else:
-                            ev = [n.evaluate(self.data_dispatcher.get_eval_set()) for _, n in self.nodes.items()if n.idx != 0]
-                            
-                        if ev:
-                            self.notify_evaluation(self.n_rounds, False, ev)
-                            accuracy = []
-                            for i, node_ev in enumerate(ev):
-                                accuracy.append({
-                                    "test" : node_ev['accuracy'],
-                                })
-                            for er in self._receivers:
-                                er.update_accuracy(self.n_rounds, False, accuracy)
-                self.notify_timestep(t)
-
-        except KeyboardInterrupt:
-            #log_results(self, self._receivers[0], "")
-            LOG.warning("Simulation interrupted by user.")
+        self.n_rounds = int(round(t, -2)/100)
+        if not self._receivers:
+            return
+
+        if self.mia:
+            mia_vulnerability = [mia_for_each_nn(self, self.nodes[0])]
+            for er in self._receivers:
+                er.update_mia_vulnerability(self.n_rounds, mia_vulnerability)
+        if self.mar:
+            server = self.nodes[0]
+            if isinstance(server, FederatedAttackGossipNode) and getattr(server, 'marginalized_state', False):
+                mia_mar_vulnerability = [mia_for_each_nn(self, server)]
+            else:
+                mia_results = {
+                    "loss_mia": 0,
+                    "entropy_mia": 0
+                }
+                mia_mar_vulnerability = [mia_results]
+            if any(item is not None for item in mia_mar_vulnerability):
+                for er in self._receivers:
+                    er.update_mia_vulnerability(self.n_rounds, mia_mar_vulnerability, marginalized = True)
 
-        pbar.close()
-        self.notify_end()
+    # docstr-coverage:inherited
+    def _evaluation_nodes(self) -> Iterable[int]:
+        clients = [node_id for node_id in self.nodes.keys() if node_id != 0]
+        if self.sampling_eval > 0:
+            return self._kernel_choice((3, self._now), clients,
+                                       max(int((self.n_nodes - 1) * self.sampling_eval), 1))
+        return clients
 
-        return
-    
\ No newline at end of file
+    # docstr-coverage:inherited
+    def start(self, n_rounds: int = 100, wall_time_limit: int = None) -> None:
+        self._run(n_rounds, wall_time_limit)
@@ -1,5 +1,220 @@
 import random
 import math
+from typing import Optional
+import numpy as np
+from scipy.sparse import csr_matrix
+
+__all__ = ["torus_graph",
+           "ring_graph",
+           "random_regular_graph",
+           "erdos_renyi_graph",
+           "barabasi_albert_graph",
+           "star_graph",
+           "create_torus_topology",
+           "create_social_topology",
+           "create_simple_topology",
+           "create_circular_topology",
+           "create_federated_topology",
+           "CustomP2PNetwork",
+           "display_topology"]
+
+
+def _from_edges(n: int, u: np.ndarray, v: np.ndarray) -> csr_matrix:
+    # Symmetric (unweighted) adjacency matrix of the undirected edges (u, v), without self-loops
+    # and multi-edges
+    keep = u != v
+    u, v = u[keep], v[keep]
+    adj = csr_matrix((np.ones(2 * len(u)), (np.concatenate([u, v]), np.concatenate([v, u]))),
+                     shape=(n, n))
+    adj.sum_duplicates()
+    adj.data[:] = 1.
+    return adj
+
+
+def torus_graph(n: int) -> csr_matrix:
+    """Builds a 2D torus, i.e., a square grid where each node is connected to its 4 neighbors.
+
+    Parameters
+    ----------
+    n : int
+        The number of nodes. It must be a perfect square.
+
+    Returns
+    -------
+    csr_matrix
+        The adjacency matrix of the topology.
+    """
+
+    dim = math.isqrt(n)
+    assert dim * dim == n, "Size must be a perfect square for a torus"
+    x, y = np.divmod(np.arange(n), dim)
+    return _from_edges(n, np.tile(np.arange(n), 2),
+                       np.concatenate([((x + 1) % dim) * dim + y, x * dim + (y + 1) % dim]))
+
+
+def ring_graph(n: int, k: int = 1) -> csr_matrix:
+    """Builds a ring where each node is connected to the ``k`` nodes on each side.
+
+    Parameters
+    ----------
+    n : int
+        The number of nodes.
+    k : int, default=1
+        The number of neighbors on each side.
+
+    Returns
+    -------
+    csr_matrix
+        The adjacency matrix of the topology.
+    """
+
+    assert 0 < k < n, "k must be in the range [1, n-1]."
+    u = np.tile(np.arange(n), k)
+    return _from_edges(n, u, (u + np.repeat(np.arange(1, k + 1), n)) % n)
+
+
+def random_regular_graph(n: int,
+                         d: int,
+                         seed: Optional[int] = None,
+                         max_iter: int = 1000) -> csr_matrix:
+    """Builds a random ``d``-regular graph.
+
+    The graph is generated with the configuration model: the ``n * d`` stubs are randomly paired,
+    then the self-loops and the multi-edges are randomly paired again (together with as many
+    random edges) until the graph is simple.
+
+    Parameters
+    ----------
+    n : int
+        The number of nodes.
+    d : int
+        The degree of the nodes. ``n * d`` must be even.
+    seed : int, default=None
+        The seed of the random number generator.
+    max_iter : int, default=1000
+        The maximum number of repairing iterations.
+
+    Returns
+    -------
+    csr_matrix
+        The adjacency matrix of the topology.
+
+    Raises
+    ------
+    RuntimeError
+        If the graph is not simple after ``max_iter`` iterations.
+    """
+
+    assert 0 <= d < n and (n * d) % 2 == 0, "n * d must be even and d < n."
+    rng = np.random.default_rng(seed)
+    edges = rng.permutation(np.repeat(np.arange(n, dtype=np.int64), d)).reshape(-1, 2)
+    for _ in range(max_iter):
+        lo, hi = np.minimum(edges[:, 0], edges[:, 1]), np.maximum(edges[:, 0], edges[:, 1])
+        key = lo * n + hi
+        order = np.argsort(key)
+        bad = lo == hi
+        bad[order[1:]] |= key[order[1:]] == key[order[:-1]]
+        if not bad.any():
+            return _from_edges(n, edges[:, 0], edges[:, 1])
+        good = np.flatnonzero(~bad)
+        redo = np.concatenate([np.flatnonzero(bad),
+                               rng.choice(good, min(len(good), 2 * bad.sum()), replace=False)])
+        edges[redo] = rng.permutation(edges[redo].ravel()).reshape(-1, 2)
+    raise RuntimeError("Unable to generate a simple %d-regular graph." %d)
+
+
+def erdos_renyi_graph(n: int, p: float, seed: Optional[int] = None) -> csr_matrix:
+    """Builds an Erdős–Rényi G(n, p) random graph.
+
+    The number of edges is drawn from the binomial distribution, then the edges are sampled
+    uniformly (without replacement) among all the possible pairs of nodes.
+
+    Parameters
+    ----------
+    n : int
+        The number of nodes.
+    p : float
+        The probability of each edge.
+    seed : int, default=None
+        The seed of the random number generator.
+
+    Returns
+    -------
+    csr_matrix
+        The adjacency matrix of the topology.
+    """
+
+    assert 0 <= p <= 1, "p must be in the range [0,1]."
+    rng = np.random.default_rng(seed)
+    n_pairs = n * (n - 1) // 2
+    m = rng.binomial(n_pairs, p)
+    keys = np.empty(0, dtype=np.int64)
+    while len(keys) < m:
+        u = rng.integers(0, n, 2 * (m - len(keys)) + 16)
+        v = rng.integers(0, n, len(u))
+        u, v = np.minimum(u, v)[u != v], np.maximum(u, v)[u != v]
+        keys = np.sort(np.concatenate([keys, u * n + v]))
+        keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])]
+    keys = rng.permutation(keys)[:m]
+    return _from_edges(n, keys // n, keys % n)
+
+
+def barabasi_albert_graph(n: int, m: int, seed: Optional[int] = None) -> csr_matrix:
+    """Builds a Barabási–Albert preferential attachment graph.
+
+    The graph is generated with the algorithm by Batagelj and Brandes, where each new node
+    attaches ``m`` edges to existing nodes picked with probability proportional to their degree.
+    The endpoints are resolved all at once by pointer jumping. Self-loops and multi-edges are
+    discarded, thus a few nodes may have less than ``m`` new edges.
+
+    Parameters
+    ----------
+    n : int
+        The number of nodes.
+    m : int
+        The number of edges attached by each new node.
+    seed : int, default=None
+        The seed of the random number generator.
+
+    Returns
+    -------
+    csr_matrix
+        The adjacency matrix of the topology.
+    """
+
+    assert 0 < m < n, "m must be in the range [1, n-1]."
+    rng = np.random.default_rng(seed)
+    k = np.arange(n * m, dtype=np.int64)
+    # The edge k connects the node k // m to the endpoint of a uniformly chosen position in
+    # [0, 2k]: even positions are the sources of the edges, odd positions their targets.
+    pos = (rng.random(n * m) * (2 * k + 1)).astype(np.int64)
+    target = pos.copy()
+    odd = target % 2 == 1
+    while odd.any():
+        target[odd] = pos[target[odd] // 2]
+        odd = target % 2 == 1
+    return _from_edges(n, k // m, target // 2 // m)
+
+
+def star_graph(n: int, hub: int = 0) -> csr_matrix:
+    """Builds a star (i.e., federated) topology where all the nodes are connected to the hub.
+
+    Parameters
+    ----------
+    n : int
+        The number of nodes.
+    hub : int, default=0
+        The index of the hub node (e.g., the server).
+
+    Returns
+    -------
+    csr_matrix
+        The adjacency matrix of the topology.
+    """
+
+    nodes = np.arange(n)
+    return _from_edges(n, np.full(n, hub), nodes)
+
 
 def create_torus_topology(size):
     assert math.sqrt(size) == int(math.sqrt(size)), "Size must be a perfect square for a torus"
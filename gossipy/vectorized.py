@@ -0,0 +1,600 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+import copy
+import numpy as np
+import torch
+from torch.func import functional_call, grad, vmap
+from typing import Dict, List, Optional, Tuple, Union
+from scipy.sparse import csr_matrix
+from rich.progress import track
+
+from . import LOG
+from .churn import BernoulliChurn, ChurnModel
+from .core import AntiEntropyProtocol, CreateModelMode
+from .data import DataDispatcher
+from .model.handler import ModelHandler, AdaLineHandler, PegasosHandler, TorchModelHandler
+from .model.nn import LogisticRegression
+from .simul import SimulationEventSender
+
+# AUTHORSHIP
+__version__ = "0.0.1"
+__author__ = "Mirko Polato"
+__copyright__ = "Copyright 2022, gossipy"
+__license__ = "Apache License, Version 2.0"
+__maintainer__ = "Mirko Polato, PhD"
+__email__ = "mak1788@gmail.com"
+__status__ = "Development"
+#
+
+
+__all__ = ["VectorizedGossipSimulator"]
+
+
+def _segment_auc(seg: np.ndarray, positive: np.ndarray, scores: np.ndarray, n_seg: int) -> np.ndarray:
+    # Mann-Whitney formulation of the AUC computed independently on each segment (ties get the
+    # average rank). Segments with a single class get an AUC of 0.5.
+    order = np.lexsort((scores, seg))
+    s_seg, s_scores = seg[order], scores[order]
+    new_run = np.ones(len(order), dtype=bool)
+    new_run[1:] = (s_seg[1:] != s_seg[:-1]) | (s_scores[1:] != s_scores[:-1])
+    run = np.cumsum(new_run) - 1
+    rank = np.arange(len(order)) - np.searchsorted(s_seg, s_seg) + 1.
+    rank = (np.bincount(run, rank) / np.bincount(run))[run]
+    pos = positive[order].astype(float)
+    n_pos = np.bincount(s_seg, pos, n_seg)
+    n_neg = np.bincount(s_seg, minlength=n_seg) - n_pos
+    sum_rank = np.bincount(s_seg, rank * pos, n_seg)
+    valid = (n_pos > 0) & (n_neg > 0)
+    auc = np.full(n_seg, .5)
+    auc[valid] = (sum_rank[valid] - n_pos[valid] * (n_pos[valid] + 1) / 2) / \
+                 (n_pos[valid] * n_neg[valid])
+    return auc
+
+
+def _segment_metrics(seg: np.ndarray,
+                     y_true: np.ndarray,
+                     y_pred: np.ndarray,
+                     n_seg: int,
+                     n_classes: int) -> Dict[str, np.ndarray]:
+    # Accuracy and macro precision/recall/f1 (with zero_division=0, over the labels that appear
+    # either in y_true or y_pred as in sklearn) computed from the per-segment confusion matrices.
+    cm = np.bincount((seg * n_classes + y_true) * n_classes + y_pred,
+                     minlength=n_seg * n_classes * n_classes).reshape(n_seg, n_classes, n_classes)
+    tp = np.diagonal(cm, axis1=1, axis2=2).astype(float)
+    n_true, n_pred = cm.sum(axis=2), cm.sum(axis=1)
+    present = (n_true + n_pred) > 0
+    n_labels = np.maximum(present.sum(axis=1), 1)
+
+    def _macro(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+        ratio = np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+        return (ratio * present).sum(axis=1) / n_labels
+
+    return {
+        "accuracy": tp.sum(axis=1) / np.maximum(cm.sum(axis=(1, 2)), 1),
+        "precision": _macro(tp, n_pred),
+        "recall": _macro(tp, n_true),
+        "f1_score": _macro(2 * tp, n_true + n_pred)
+    }
+
+
+class _Kernel(ABC):
+    def __init__(self, handler: ModelHandler):
+        # Vectorized counterpart of a model handler: the parameters of all the nodes are the rows
+        # of a single matrix and the local updates are applied to (subsets of) its rows at once.
+        self.handler = handler
+        self.generator = None
+        self.shapes = [(n, p.shape) for n, p in handler.model.named_parameters()]
+
+    def flatten(self, handler: ModelHandler) -> torch.Tensor:
+        return torch.cat([p.detach().reshape(-1) for p in handler.model.parameters()]).float()
+
+    def unflatten(self, W: torch.Tensor) -> Dict[str, torch.Tensor]:
+        params, i = {}, 0
+        for name, shape in self.shapes:
+            size = int(np.prod(shape))
+            params[name] = W[:, i : i + size].reshape(W.size(0), *shape)
+            i += size
+        return params
+
+    def load(self, handler: ModelHandler, w: torch.Tensor) -> None:
+        with torch.no_grad():
+            for p, v in zip(handler.model.parameters(), self.unflatten(w.unsqueeze(0)).values()):
+                p.copy_(v[0])
+
+    @abstractmethod
+    def update(self,
+               W: torch.Tensor,
+               n_updates: np.ndarray,
+               x: torch.Tensor,
+               y: torch.Tensor,
+               counts: np.ndarray) -> None:
+        """Updates in-place the models ``W`` on the local data of the corresponding nodes.
+
+        Parameters
+        ----------
+        W : torch.Tensor
+            The (K x P) matrix of the models to update.
+        n_updates : np.ndarray
+            The number of updates of the models (updated in-place).
+        x : torch.Tensor
+            The (K x C x D) padded local training examples.
+        y : torch.Tensor
+            The (K x C) padded local training labels.
+        counts : np.ndarray
+            The number of actual (i.e., non padding) examples of each node.
+        """
+
+        pass
+
+    @abstractmethod
+    def predict(self,
+                W: torch.Tensor,
+                x: torch.Tensor,
+                y: torch.Tensor) -> Tuple[np.ndarray, np.ndarray, int, Optional[np.ndarray]]:
+        """Predicts the labels of the examples ``x[k]`` using the model ``W[k]``.
+
+        Parameters
+        ----------
+        W : torch.Tensor
+            The (K x P) matrix of the models.
+        x : torch.Tensor
+            The (K x M x D) examples.
+        y : torch.Tensor
+            The (K x M) or (K x M x O) labels.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray, int, np.ndarray or None]
+            The true and the predicted class indices (K x M), the number of classes and, if
+            defined, the scores used for computing the AUC.
+        """
+
+        pass
+
+
+class _AdaLineKernel(_Kernel):
+    # docstr-coverage:inherited
+    def update(self, W, n_updates, x, y, counts):
+        n_updates += counts
+        lr = self.handler.learning_rate
+        for i in range(int(counts.max(initial=0))):
+            act = torch.from_numpy(np.flatnonzero(counts > i))
+            w, xi, yi = W[act], x[act, i], y[act, i]
+            W[act] = w + (lr * (yi - (w * xi).sum(dim=1))).unsqueeze(1) * xi
+
+    # docstr-coverage:inherited
+    def predict(self, W, x, y):
+        scores = torch.einsum("kd,kmd->km", W, x)
+        return (y > 0).long().numpy(), (scores >= 0).long().numpy(), 2, scores.numpy()
+
+
+class _PegasosKernel(_AdaLineKernel):
+    # docstr-coverage:inherited
+    def update(self, W, n_updates, x, y, counts):
+        lam = self.handler.learning_rate
+        for i in range(int(counts.max(initial=0))):
+            act_np = np.flatnonzero(counts > i)
+            act = torch.from_numpy(act_np)
+            n_updates[act_np] += 1
+            lr = torch.from_numpy(1. / (n_updates[act_np] * lam)).float()
+            w, xi, yi = W[act], x[act, i], y[act, i]
+            y_pred = (w * xi).sum(dim=1)
+            w = w * (1. - lr * lam).unsqueeze(1)
+            W[act] = w + ((y_pred * yi - 1) < 0).float().mul(lr * yi).unsqueeze(1) * xi
+
+
+class _TorchKernel(_Kernel):
+    def __init__(self, handler: TorchModelHandler):
+        super().__init__(handler)
+        group = handler.optimizer.param_groups[0]
+        self.lr, self.weight_decay = group["lr"], group["weight_decay"]
+        model = copy.deepcopy(handler.model)
+
+        def loss(p, x, y):
+            return handler.criterion(functional_call(model, p, (x,)), y)
+
+        self.grad_fn = vmap(grad(loss), randomness="different")
+        self.forward = vmap(lambda p, x: functional_call(model, p, (x,)))
+
+    def _step(self, params: Dict[str, torch.Tensor], x: torch.Tensor, y: torch.Tensor) -> None:
+        grads = self.grad_fn(params, x, y)
+        for n, g in grads.items():
+            d_p = g + self.weight_decay * params[n] if self.weight_decay else g
+            params[n] = params[n] - self.lr * d_p
+
+    # docstr-coverage:inherited
+    def update(self, W, n_updates, x, y, counts):
+        # Same as TorchModelHandler._update, nodes with the same amount of data are stacked
+        handler = self.handler
+        for c in np.unique(counts):
+            if c == 0:
+                continue
+            sel_np = np.flatnonzero(counts == c)
+            sel = torch.from_numpy(sel_np)
+            params = self.unflatten(W[sel])
+            xs, ys = x[sel, :c], y[sel, :c]
+            rows = torch.arange(len(sel)).unsqueeze(1)
+            batch_size = c if not handler.batch_size else handler.batch_size
+            n_steps = 0
+            if handler.local_epochs > 0:
+                for _ in range(handler.local_epochs):
+                    perm = torch.argsort(torch.rand(len(sel), c, generator=self.generator), dim=1)
+                    xs, ys = xs[rows, perm], ys[rows, perm]
+                    for i in range(0, c, batch_size):
+                        self._step(params, xs[:, i : i + batch_size], ys[:, i : i + batch_size])
+                        n_steps += 1
+            else:
+                perm = torch.argsort(torch.rand(len(sel), c, generator=self.generator), dim=1)
+                self._step(params, xs[rows, perm][:, :batch_size], ys[rows, perm][:, :batch_size])
+                n_steps = 1
+            W[sel] = torch.cat([p.reshape(len(sel), -1) for p in params.values()], dim=1)
+            n_updates[sel_np] += n_steps
+
+    # docstr-coverage:inherited
+    def predict(self, W, x, y):
+        scores = self.forward(self.unflatten(W), x)
+        y_true = y if y.dim() == 2 else torch.argmax(y, dim=-1)
+        y_pred = torch.argmax(scores, dim=-1)
+        auc_scores = scores[..., 1].numpy() if scores.size(-1) == 2 else None
+        return y_true.long().numpy(), y_pred.numpy(), scores.size(-1), auc_scores
+
+
+class VectorizedGossipSimulator(SimulationEventSender):
+    _EVAL_CHUNK: int = 2**22
+
+    def __init__(self,
+                 model_proto: ModelHandler,
+                 data_dispatcher: DataDispatcher,
+                 delta: int,
+                 protocol: AntiEntropyProtocol = AntiEntropyProtocol.PUSH,
+                 topology: Optional[Union[np.ndarray, csr_matrix]] = None,
+                 drop_prob: float = 0.,  # [0,1] - probability of a message being dropped
+                 online_prob: Union[float, ChurnModel] = 1.,  # [0,1] - probability of a node to be online
+                 sampling_eval: float = 0.,  # [0, 1] - percentage of nodes to evaluate
+                 ):
+        """Vectorized ("array-of-nodes") gossip learning simulator for linear models.
+
+        Instead of a :class:`gossipy.node.GossipNode`, a model handler and a cached copy of the
+        model for each node, the simulator stores the models of all the nodes as the rows of a
+        single (N x P) matrix, the local data as contiguous ranges (CSR-like) of a single data
+        matrix, and the topology (if any) as a CSR adjacency. The merges and the local updates of a
+        round are then performed as vectorized gather/scatter operations, which allows simulating
+        networks with millions of nodes on a single machine :cite:p:`Ormandi:2013`.
+
+        The simulation is equivalent to a :class:`gossipy.simul.GossipSimulator` with synchronized
+        nodes using the PUSH protocol with no delay: in each round every node times out once, at
+        its own offset in the round (drawn by :meth:`init_nodes` and stored in the attribute
+        ``offsets``), and sends its current
+        model to a random peer. The messages of a timestep are then received by the online
+        receivers, and a receiver that gets more than one message in the same timestep receives
+        them one after the other. Messages can drop according to ``drop_prob`` and nodes are online
+        with probability ``online_prob`` (or according to a churn model).
+
+        Supported model handlers are :class:`gossipy.model.handler.AdaLineHandler`,
+        :class:`gossipy.model.handler.PegasosHandler` and
+        :class:`gossipy.model.handler.TorchModelHandler` with a
+        :class:`gossipy.model.nn.LogisticRegression` network trained by plain SGD.
+
+        Parameters
+        ----------
+        model_proto : ModelHandler
+            The prototype of the model handler of the nodes.
+        data_dispatcher : DataDispatcher
+            The data dispatcher that assigns the data to the nodes.
+        delta : int
+            The number of timesteps of a round.
+        protocol : AntiEntropyProtocol, default=AntiEntropyProtocol.PUSH
+            The protocol of the gossip simulation. Only PUSH is supported.
+        topology : np.ndarray or csr_matrix, default=None
+            The adjacency matrix of the network topology. If None, the network is considered
+            fully connected and the peers are sampled without materializing the topology.
+        drop_prob : float, default=0.
+            The probability of a message being dropped.
+        online_prob : float or ChurnModel, default=1.
+            The probability of a node to be online at each timestep, or the churn model of the
+            nodes (see :mod:`gossipy.churn`).
+        sampling_eval : float, default=0.
+            The percentage of nodes to use during evaluate. If 0 or 1, all nodes are considered.
+        """
+
+        assert protocol == AntiEntropyProtocol.PUSH, "Only the PUSH protocol is supported."
+        assert 0 <= drop_prob <= 1, "drop_prob must be in the range [0,1]."
+        assert isinstance(online_prob, ChurnModel) or 0 <= online_prob <= 1, \
+            "online_prob must be in the range [0,1]."
+        assert 0 <= sampling_eval <= 1, "sampling_eval must be in the range [0,1]."
+        assert model_proto.mode in {CreateModelMode.MERGE_UPDATE, CreateModelMode.UPDATE,
+                                    CreateModelMode.UPDATE_MERGE, CreateModelMode.PASS}, \
+            "Unsupported create model mode %s." %str(model_proto.mode)
+
+        self.model_proto = model_proto
+        self.data_dispatcher = data_dispatcher
+        self.n_nodes = data_dispatcher.size()
+        self.delta = delta
+        self.protocol = protocol
+        self.drop_prob = drop_prob
+        self.online_prob = online_prob
+        self.churn = online_prob if isinstance(online_prob, ChurnModel) else BernoulliChurn(online_prob)
+        self.sampling_eval = sampling_eval
+        self.offsets = None
+        self.rng = None
+        self.initialized = False
+        self.kernel = self._make_kernel(model_proto)
+        self.msg_size = model_proto.get_size()
+
+        self.adj_indptr, self.adj_indices = None, None
+        if topology is not None:
+            topology = csr_matrix(topology)
+            assert topology.shape == (self.n_nodes, self.n_nodes), \
+                "The topology must be a (n_nodes x n_nodes) matrix."
+            self.adj_indptr, self.adj_indices = topology.indptr, topology.indices
+
+        self.X, self.y, self.indptr = self._gather(data_dispatcher.tr_assignments, False)
+        self.X_test, self.y_test, self.test_indptr = self._gather(data_dispatcher.te_assignments, True)
+        self.W = None
+        self.n_updates = None
+
+    def _make_kernel(self, handler: ModelHandler) -> _Kernel:
+        if isinstance(handler, PegasosHandler):
+            return _PegasosKernel(handler)
+        if isinstance(handler, AdaLineHandler):
+            return _AdaLineKernel(handler)
+        if isinstance(handler, TorchModelHandler) and isinstance(handler.model, LogisticRegression):
+            group = handler.optimizer.param_groups
+            assert isinstance(handler.optimizer, torch.optim.SGD) and len(group) == 1 and \
+                not group[0]["momentum"] and not group[0]["nesterov"] and \
+                not group[0].get("maximize", False), \
+                "Only plain SGD (single parameters group, no momentum) is supported."
+            return _TorchKernel(handler)
+        raise TypeError("Unsupported model handler %s." %handler.__class__.__name__)
+
+    def _gather(self,
+                assignments: Optional[List[List[int]]],
+                eval_set: bool) -> Tuple[Optional[torch.Tensor], Optional[torch.Tensor], np.ndarray]:
+        counts = np.array([len(a) for a in assignments]) if assignments else np.zeros(self.n_nodes)
+        indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        if not indptr[-1]:
+            return None, None, indptr
+        order = np.concatenate([np.asarray(a, dtype=np.int64) for a in assignments]).tolist()
+        X, y = self.data_dispatcher.data_handler.at(order, eval_set)
+        X, y = torch.as_tensor(X).float(), torch.as_tensor(y)
+        if not isinstance(self.kernel, _TorchKernel):
+            y = y.float()
+        return X, y, indptr
+
+    def _local_data(self,
+                    nodes: np.ndarray,
+                    X: torch.Tensor,
+                    y: torch.Tensor,
+                    indptr: np.ndarray) -> Tuple[torch.Tensor, torch.Tensor, np.ndarray]:
+        # Padded (K x C x D) view of the local data of the nodes, gathered from the CSR ranges
+        start = indptr[nodes]
+        counts = indptr[nodes + 1] - start
+        width = max(int(counts.max(initial=0)), 1)
+        idx = np.minimum(start[:, None] + np.arange(width), max(len(X) - 1, 0))
+        idx = torch.from_numpy(idx)
+        return X[idx], y[idx], counts
+
+    def _update(self, W: torch.Tensor, n_updates: np.ndarray, nodes: np.ndarray) -> None:
+        if self.X is None:
+            return
+        x, y, counts = self._local_data(nodes, self.X, self.y, self.indptr)
+        self.kernel.update(W, n_updates, x, y, counts)
+
+    def init_nodes(self, seed: int = 98765) -> None:
+        """Initializes the models of the nodes.
+
+        As in :meth:`gossipy.node.GossipNode.init_model`, the models are initialized and then
+        trained on the local data. The random number generator of the simulation (attribute
+        ``rng``) is created from ``seed`` as well, and every random choice of the simulation
+        (the offsets of the nodes, the sampled peers, the dropped messages, the churn and the
+        evaluated nodes) is drawn from it, so that a run only depends on ``seed``.
+
+        Parameters
+        ----------
+        seed : int, default=98765
+            The seed for the random number generator.
+        """
+
+        self.rng = np.random.default_rng(seed)
+        self.offsets = self.rng.integers(0, self.delta, size=self.n_nodes)
+        self.kernel.generator = torch.Generator().manual_seed(int(self.rng.integers(2**63)))
+        handler = self.model_proto.copy()
+        handler.init()
+        self.W = self.kernel.flatten(handler).repeat(self.n_nodes, 1)
+        self.n_updates = np.zeros(self.n_nodes, dtype=np.int64)
+        self._update(self.W, self.n_updates, np.arange(self.n_nodes))
+        self.initialized = True
+
+    def get_model_handler(self, idx: int) -> ModelHandler:
+        """Returns a model handler holding the current model of a node.
+
+        Parameters
+        ----------
+        idx : int
+            The index of the node.
+
+        Returns
+        -------
+        ModelHandler
+            A copy of the model handler prototype with the model of the node.
+        """
+
+        assert self.initialized, "The simulator is not inizialized. Please, call 'init_nodes'."
+        handler = self.model_proto.copy()
+        self.kernel.load(handler, self.W[idx])
+        handler.n_updates = int(self.n_updates[idx])
+        return handler
+
+    def _sample_peers(self, senders: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.adj_indptr is None:
+            if self.n_nodes < 2:
+                # A single node has no peers
+                return senders[:0], senders[:0]
+            peers = self.rng.integers(0, self.n_nodes - 1, size=len(senders))
+            return senders, peers + (peers >= senders)
+        degree = self.adj_indptr[senders + 1] - self.adj_indptr[senders]
+        senders, degree = senders[degree > 0], degree[degree > 0]
+        offset = (self.rng.random(len(senders)) * degree).astype(np.int64)
+        return senders, self.adj_indices[self.adj_indptr[senders] + offset]
+
+    def _receive(self,
+                 receivers: np.ndarray,
+                 W_recv: torch.Tensor,
+                 n_recv: np.ndarray) -> None:
+        # Vectorized version of ModelHandler.__call__ for distinct receivers
+        mode = self.model_proto.mode
+        recv = torch.from_numpy(receivers)
+        W, n = self.W[recv], self.n_updates[receivers]
+        if mode == CreateModelMode.MERGE_UPDATE:
+            W, n = .5 * (W + W_recv), np.maximum(n, n_recv)
+            self._update(W, n, receivers)
+        elif mode == CreateModelMode.UPDATE:
+            W, n = W_recv, n_recv
+            self._update(W, n, receivers)
+        elif mode == CreateModelMode.UPDATE_MERGE:
+            self._update(W, n, receivers)
+            self._update(W_recv, n_recv, receivers)
+            W, n = .5 * (W + W_recv), np.maximum(n, n_recv)
+        else: # PASS
+            W = W_recv
+        self.W[recv] = W
+        self.n_updates[receivers] = n
+
+    def _timestep(self, t: int) -> None:
+        if t % self.delta == 0:
+            # Nodes timing out in the same timestep send in a random order (see GossipSimulator)
+            perm = self.rng.permutation(self.n_nodes)
+            self._send_order = perm[np.argsort(self.offsets[perm], kind="stable")]
+            self._send_bounds = np.searchsorted(self.offsets[self._send_order],
+                                                np.arange(self.delta + 1))
+        offset = t % self.delta
+        senders = self._send_order[self._send_bounds[offset] : self._send_bounds[offset + 1]]
+        if not len(senders):
+            return
+
+        senders, receivers = self._sample_peers(senders)
+        n_msgs = len(senders)
+        ok = self.rng.random(n_msgs) >= self.drop_prob
+        if not isinstance(self.churn, BernoulliChurn) or self.churn.online_prob < 1:
+            uniq, inv = np.unique(receivers, return_inverse=True)
+            ok &= self.churn.is_online(uniq, t)[inv]
+        self.notify_message_batch(n_msgs, n_msgs - int(ok.sum()), n_msgs * self.msg_size)
+        senders, receivers = senders[ok], receivers[ok]
+
+        # The models are sent before any message of the timestep is received
+        W_sent = self.W[torch.from_numpy(senders)]
+        n_sent = self.n_updates[senders]
+
+        # Messages to the same receiver are received in order, one per wave
+        order = np.argsort(receivers, kind="stable")
+        sorted_recv = receivers[order]
+        wave = np.empty(len(order), dtype=np.int64)
+        wave[order] = np.arange(len(order)) - np.searchsorted(sorted_recv, sorted_recv)
+        for k in range(int(wave.max(initial=-1)) + 1):
+            sel = np.flatnonzero(wave == k)
+            self._receive(receivers[sel], W_sent[torch.from_numpy(sel)], n_sent[sel].copy())
+
+    def _evaluate_nodes(self,
+                        nodes: np.ndarray,
+                        X: torch.Tensor,
+                        y: torch.Tensor,
+                        indptr: Optional[np.ndarray]) -> List[Dict[str, float]]:
+        # Global evaluation (indptr is None): every node is evaluated on the whole (X, y).
+        # Local evaluation: every node is evaluated on its own range of (X, y).
+        if indptr is None:
+            n_rows = np.full(len(nodes), len(X))
+        else:
+            n_rows = indptr[nodes + 1] - indptr[nodes]
+            nodes, n_rows = nodes[n_rows > 0], n_rows[n_rows > 0]
+
+        res = {}
+        chunk = max(self._EVAL_CHUNK // max(len(X), 1), 1)
+        with torch.no_grad():
+            for s in range(0, len(nodes), chunk):
+                c_nodes = nodes[s : s + chunk]
+                W = self.W[torch.from_numpy(c_nodes)]
+                if indptr is None:
+                    xs = X.unsqueeze(0).expand(len(c_nodes), *X.shape)
+                    ys = y.unsqueeze(0).expand(len(c_nodes), *y.shape)
+                    seg = np.repeat(np.arange(len(c_nodes)), len(X))
+                else:
+                    counts = n_rows[s : s + chunk]
+                    seg = np.repeat(np.arange(len(c_nodes)), counts)
+                    rows = torch.from_numpy(np.concatenate([np.arange(indptr[i], indptr[i + 1])
+                                                            for i in c_nodes]))
+                    W = W[torch.from_numpy(seg)]
+                    xs, ys = X[rows].unsqueeze(1), y[rows].unsqueeze(1)
+                y_true, y_pred, n_classes, scores = self.kernel.predict(W, xs, ys)
+                metrics = _segment_metrics(seg, y_true.reshape(-1), y_pred.reshape(-1),
+                                           len(c_nodes), n_classes)
+                if scores is not None:
+                    metrics["auc"] = _segment_auc(seg, y_true.reshape(-1) == 1,
+                                                  scores.reshape(-1), len(c_nodes))
+                for k, v in metrics.items():
+                    res.setdefault(k, []).append(v)
+
+        if not res:
+            return []
+        res = {k: np.concatenate(v) for k, v in res.items()}
+        return [{k: float(v[i]) for k, v in res.items()} for i in range(len(nodes))]
+
+    def _evaluate(self, t: int) -> None:
+        if self.sampling_eval > 0:
+            sample = self.rng.choice(self.n_nodes, max(int(self.n_nodes * self.sampling_eval), 1))
+        else:
+            sample = np.arange(self.n_nodes)
+
+        if self.X_test is not None:
+            ev = self._evaluate_nodes(sample, self.X_test, self.y_test, self.test_indptr)
+            if ev:
+                self.notify_evaluation(t, True, ev)
+
+        if self.data_dispatcher.has_test():
+            X, y = self.data_dispatcher.get_eval_set()
+            X, y = torch.as_tensor(X).float(), torch.as_tensor(y)
+            ev = self._evaluate_nodes(sample, X, y if isinstance(self.kernel, _TorchKernel) else y.float(),
+                                      None)
+            if ev:
+                self.notify_evaluation(t, False, ev)
+
+    def start(self, n_rounds: int = 100) -> None:
+        """Starts the simulation.
+
+        The simulation handles the messages exchange between the nodes for ``n_rounds`` rounds.
+        If attached to a :class:`gossipy.simul.SimulationReport`, the report is updated at each
+        time step, sent/fail message and evaluation. The message events are notified in bulk
+        once per timestep (see :meth:`gossipy.simul.SimulationEventSender.notify_message_batch`).
+
+        Parameters
+        ----------
+        n_rounds : int, default=100
+            The number of rounds of the simulation.
+        """
+
+        assert self.initialized, \
+            "The simulator is not inizialized. Please, call the method 'init_nodes'."
+        LOG.info("Simulation started.")
+
+        self.churn.set_rng(self.rng)
+        self.churn.reset(self.n_nodes)
+        try:
+            for t in track(range(n_rounds * self.delta), description="Simulating..."):
+                self._timestep(t)
+                if (t + 1) % self.delta == 0:
+                    self._evaluate(t)
+                self.notify_timestep(t)
+        except KeyboardInterrupt:
+            LOG.warning("Simulation interrupted by user.")
+
+        self.churn.set_rng(None)
+        self.notify_end()
+
+    def __repr__(self) -> str:
+        return str(self)
+
+    def __str__(self) -> str:
+        return "VectorizedGossipSimulator(n_nodes=%d, model=%s, delta=%d, drop_prob=%.2f, " \
+               "online_prob=%s, sampling_eval=%.2f)" \
+               %(self.n_nodes, self.model_proto.__class__.__name__, self.delta, self.drop_prob,
+                 self.online_prob, self.sampling_eval)
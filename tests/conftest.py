@@ -0,0 +1,42 @@
+import pytest
+import torch
+import torch.nn.functional as F
+
+from gossipy import CACHE, set_seed
+from gossipy.core import CreateModelMode, StaticP2PNetwork
+from gossipy.data import DataDispatcher
+from gossipy.data.handler import ClassificationDataHandler
+from gossipy.model.handler import TorchModelHandler
+from gossipy.model.nn import TorchMLP
+from gossipy.node import GossipNode
+
+
+@pytest.fixture
+def torch_nodes():
+    """Factory of small gossip learning setups: it returns the data dispatcher and the nodes."""
+
+    def make(n_nodes=10, node_cls=GossipNode, p2p_net=None, sync=True, **kwargs):
+        set_seed(42)
+        CACHE.clear()
+        g = torch.Generator().manual_seed(0)
+        X = torch.randn(20 * n_nodes, 5, generator=g)
+        y = (X[:, 0] + X[:, 1] > 0).long()
+        dd = DataDispatcher(ClassificationDataHandler(X, y, test_size=.2),
+                            n=n_nodes,
+                            auto_assign=True)
+        handler = TorchModelHandler(net=TorchMLP(5, 2, (4,)),
+                                    optimizer=torch.optim.SGD,
+                                    optimizer_params={"lr": .1},
+                                    criterion=F.cross_entropy,
+                                    create_model_mode=CreateModelMode.MERGE_UPDATE,
+                                    batch_size=8)
+        nodes = node_cls.generate(data_dispatcher=dd,
+                                  p2p_net=p2p_net or StaticP2PNetwork(n_nodes, None),
+                                  model_proto=handler,
+                                  round_len=10,
+                                  sync=sync,
+                                  **kwargs)
+        return dd, nodes
+
+    yield make
+    CACHE.clear()
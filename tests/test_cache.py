@@ -0,0 +1,104 @@
+import pytest
+import torch
+
+import gossipy
+from gossipy import CACHE, CacheKey
+from gossipy.core import AntiEntropyProtocol, UniformDelay
+from gossipy.simul import GossipSimulator, SimulationReport
+
+
+@pytest.fixture
+def budget(tmp_path):
+    """Sets a budget of two 256-float tensors on the (empty) cache, spilling to ``tmp_path``."""
+
+    CACHE.clear()
+    CACHE.reset_stats()
+    CACHE.set_budget(2 * 256 * 4, spill_dir=str(tmp_path))
+    yield tmp_path
+    CACHE.set_budget(None)
+    CACHE.clear()
+    CACHE.reset_stats()
+
+
+def _values(n=4):
+    return {CacheKey(i, 0): torch.full((256,), float(i)) for i in range(n)}
+
+
+def test_cache_spill_reload(budget):
+    values = _values()
+    for key, value in values.items():
+        CACHE.push(key, value.clone())
+    CACHE.push(CacheKey(3, 0), None)
+    stats = CACHE.get_stats()
+    assert stats["spills"] == 2 and stats["spilled"] == 2
+    assert stats["bytes"] <= 2 * 256 * 4 and stats["peak"] <= 3 * 256 * 4
+    assert len(list(budget.iterdir())) == 2
+
+    # The spilled items are transparently reloaded (and their files removed)
+    for key, value in values.items():
+        assert torch.equal(CACHE.pop(key), value)
+    stats = CACHE.get_stats()
+    assert stats["reloads"] == 3 and stats["hits"] == 4
+    assert len(CACHE) == 1 and torch.equal(CACHE[CacheKey(3, 0)], values[CacheKey(3, 0)])
+    CACHE.release(CacheKey(3, 0))
+    assert len(CACHE) == 0 and CACHE.get_stats()["bytes"] == 0
+    assert CACHE.pop(CacheKey(0, 0)) is None and CACHE.get_stats()["misses"] == 1
+
+    # Releasing a spilled item deletes its file without reloading it
+    for key, value in values.items():
+        CACHE.push(key, value.clone())
+    for key in values:
+        CACHE.release(key)
+    assert CACHE.get_stats()["reloads"] == 3
+    assert len(CACHE) == 0 and not list(budget.iterdir())
+
+
+def test_inspecting_spilled_items_keeps_the_budget(budget):
+    values = _values()
+    for key, value in values.items():
+        CACHE.push(key, value.clone())
+    stats = CACHE.get_stats()
+    assert stats["spilled"] == 2
+
+    str(CACHE), repr(CACHE)
+    items = CACHE.get_cache()
+    for key, value in values.items():
+        str(items[key]), repr(items[key])
+        items[key].get_size()
+        assert torch.equal(items[key].get(), value)
+    # Only the cache moves the items in memory
+    assert CACHE.get_stats() == stats
+    assert sum(item.is_spilled() for item in items.values()) == 2
+    assert len(list(budget.iterdir())) == 2
+
+
+def test_spill_without_mmap(budget, monkeypatch):
+    # torch < 2.1 does not support memory-mapped loading
+    monkeypatch.setattr(gossipy, "_MMAP_LOAD", False)
+    values = _values(3)
+    for key, value in values.items():
+        CACHE.push(key, value.clone())
+    assert CACHE.get_stats()["spilled"] == 1
+    for key, value in values.items():
+        assert torch.equal(CACHE.pop(key), value)
+    assert CACHE.get_stats()["reloads"] == 2 and len(CACHE) == 0
+
+
+@pytest.mark.parametrize("event_driven", [False, True])
+def test_undelivered_messages_release_the_cache(torch_nodes, event_driven):
+    dd, nodes = torch_nodes()
+    sim = GossipSimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                          protocol=AntiEntropyProtocol.PUSH_PULL, drop_prob=.2, online_prob=.7,
+                          delay=UniformDelay(0, 15), event_driven=event_driven)
+    report = SimulationReport()
+    sim.add_receiver(report)
+    sim.init_nodes(seed=42)
+    sim.start(n_rounds=5)
+    sim.remove_receiver(report)
+
+    discarded = sim.cache_report
+    assert discarded["dropped"] > 0 and discarded["offline"] > 0 and discarded["undelivered"] > 0
+    assert discarded["dropped"] + discarded["offline"] == report._failed_messages
+    # The nodes do not hold any model, hence every cached model has been either received or released
+    assert discarded["leaked"] == 0
+    assert not CACHE.get_cache()
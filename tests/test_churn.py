@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from gossipy.churn import AvailabilityTrace, BernoulliChurn, ExponentialChurn, TraceChurn
+from gossipy.core import AntiEntropyProtocol
+from gossipy.simul import GossipSimulator, SimulationReport
+
+
+def _statuses(churn, n_nodes, horizon, seed=0):
+    churn.set_rng(np.random.default_rng(seed))
+    churn.reset(n_nodes)
+    nodes = np.arange(n_nodes)
+    return np.stack([churn.is_online(nodes, t) for t in range(horizon)])
+
+
+def test_bernoulli_churn():
+    online = _statuses(BernoulliChurn(.3), 200, 50)
+    assert abs(online.mean() - .3) < .02
+    assert (online == _statuses(BernoulliChurn(.3), 200, 50)).all()
+    assert _statuses(BernoulliChurn(1.), 10, 5).all()
+
+
+def test_exponential_churn():
+    online = _statuses(ExponentialChurn(30, 10), 500, 200)
+    # The process is stationary and the sessions are long
+    assert abs(online[0].mean() - .75) < .06
+    assert abs(online.mean() - .75) < .03
+    flips = (online[1:] != online[:-1]).sum()
+    assert abs(flips / online[:-1].size - 2 / 40) < .01
+    assert (online == _statuses(ExponentialChurn(30, 10), 500, 200)).all()
+
+    # Nodes are updated lazily, only when they are queried
+    churn = ExponentialChurn(30, 10)
+    churn.set_rng(np.random.default_rng(0))
+    churn.reset(500)
+    later = churn.is_online(np.arange(250, 500), 150)
+    assert (churn._next[:250] <= 150).any() and (churn._next[250:] > 150).all()
+    assert later.dtype == bool
+
+
+def _replayed(trace, n_nodes, t):
+    flips = np.array([(trace.times[trace.indptr[i] : trace.indptr[i + 1]] <= t).sum()
+                      for i in range(n_nodes)])
+    return trace.initial[:n_nodes] ^ (flips % 2 == 1)
+
+
+def test_trace_churn(tmp_path):
+    churn = ExponentialChurn(5, 5)
+    churn.set_rng(np.random.default_rng(1))
+    trace = AvailabilityTrace.record(churn, 20, 100)
+    assert trace.n_nodes == 20 and len(trace.times) > 0
+    assert (trace.times < 100).all()
+    for i in range(20):
+        assert (np.diff(trace.times[trace.indptr[i] : trace.indptr[i + 1]]) >= 0).all()
+
+    trace.save(str(tmp_path / "trace.npz"))
+    loaded = AvailabilityTrace.load(str(tmp_path / "trace.npz"))
+    assert (loaded.initial == trace.initial).all() and (loaded.indptr == trace.indptr).all()
+    assert (loaded.times == trace.times).all()
+
+    for replay in (TraceChurn(trace), TraceChurn(str(tmp_path / "trace.npz"))):
+        online = _statuses(replay, 15, 120)
+        for t in range(0, 120, 7):
+            assert (online[t] == _replayed(trace, 15, t)).all()
+    with pytest.raises(AssertionError):
+        TraceChurn(trace).reset(21)
+
+
+def test_churn_in_a_simulation(torch_nodes):
+    # Nodes are offline in the first half of the run and online in the second half
+    trace = AvailabilityTrace(np.zeros(10, dtype=bool), np.arange(11), np.full(10, 20.))
+    dd, nodes = torch_nodes()
+    sim = GossipSimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                          protocol=AntiEntropyProtocol.PUSH, online_prob=TraceChurn(trace))
+    report = SimulationReport(message_log=True)
+    sim.add_receiver(report)
+    sim.init_nodes(seed=42)
+    sim.start(n_rounds=4)
+    sim.remove_receiver(report)
+    log = report.get_message_log()
+    # Every message sent in the first half fails
+    assert (log["timestamp"][log["failed"]] < 20).all()
+    assert report._failed_messages == (log["timestamp"][~log["failed"]] < 20).sum() == 20
+    assert report._sent_messages == 40
@@ -0,0 +1,98 @@
+import pytest
+import torch
+
+from gossipy.compression import (CastCompressor, CompressedPayload, Compression, Int8Compressor,
+                                 RandomKCompressor, TopKCompressor)
+from gossipy.core import AntiEntropyProtocol, UniformDelay
+from gossipy.model.handler import ModelPayload
+from gossipy.node import PENSNode
+from gossipy.simul import GossipSimulator
+
+
+def _payload(values):
+    return ModelPayload(values, [], 0, "arch", values.numel(), [values.numel()])
+
+
+def _models(n=5, numel=100, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    return [torch.randn(numel, generator=g) for _ in range(n)]
+
+
+def test_dense_roundtrip():
+    x = _models(1)[0]
+    for compressor, atol in ((CastCompressor(torch.float32), 0),
+                             (CastCompressor(torch.float16), 1e-2),
+                             (Int8Compressor(), 3e-2)):
+        stage = Compression(compressor)
+        cp = stage.compress(_payload(x), 0, 1)
+        assert not cp.delta
+        assert torch.allclose(cp.decompress({}).flat, x, atol=atol)
+    cp = Compression(CastCompressor(torch.float16)).compress(_payload(x), 0, 1)
+    assert cp.get_size() == 2 * x.numel()
+
+
+def test_delta_stream_tracks_sender():
+    for compressor in (TopKCompressor(.1), RandomKCompressor(.1)):
+        stage, refs = Compression(compressor), {}
+        for x in _models():
+            cp = stage.compress(_payload(x), 0, 1)
+            flat = cp.decompress(refs).flat
+            # With error feedback the reference of the sender is the model decoded by the peer
+            assert torch.equal(flat, stage._state[1])
+
+
+def test_delta_out_of_order():
+    stage, refs = Compression(TopKCompressor(.2)), {}
+    sent = [stage.compress(_payload(x), 0, 1) for x in _models(4)]
+    assert sent[0].decompress(refs) is not None
+    assert sent[2].decompress(refs) is None
+    assert sent[1].decompress(refs) is not None
+    # The difference received out of order has been applied to the reference
+    assert torch.equal(sent[3].decompress(refs).flat, stage._state[1])
+
+
+def test_delta_resync_after_miss():
+    stage, refs = Compression(TopKCompressor(.2)), {}
+    xs = _models(4)
+    stage.compress(_payload(xs[0]), 0, 1).decompress(refs)
+    stage.compress(_payload(xs[1]), 0, 1)  # never received
+    stage.resync(1)
+    cp = stage.compress(_payload(xs[2]), 0, 1)
+    assert not cp.delta
+    assert torch.equal(cp.decompress(refs).flat, xs[2])
+    assert stage.compress(_payload(xs[3]), 0, 1).decompress(refs) is not None
+
+
+def test_compression_with_drops(torch_nodes, monkeypatch):
+    dd, nodes = torch_nodes()
+    for node in nodes.values():
+        node.set_compression(Compression(TopKCompressor(.1)))
+    sim = GossipSimulator(nodes=nodes,
+                          data_dispatcher=dd,
+                          delta=10,
+                          protocol=AntiEntropyProtocol.PUSH,
+                          delay=UniformDelay(0, 3),
+                          drop_prob=.3,
+                          online_prob=.8)
+
+    decoded = {"delta": 0, "missed": 0}
+    decompress = CompressedPayload.decompress
+
+    def counting(self, references):
+        res = decompress(self, references)
+        if self.delta:
+            decoded["delta"] += 1
+            decoded["missed"] += res is None
+        return res
+
+    monkeypatch.setattr(CompressedPayload, "decompress", counting)
+    sim.init_nodes(seed=42)
+    sim.start(n_rounds=30)
+    assert decoded["delta"] > 0
+    assert decoded["missed"] == 0
+
+
+def test_compression_rejected_without_decompression(torch_nodes):
+    _, nodes = torch_nodes(n_nodes=4, node_cls=PENSNode, n_sampled=2, m_top=1, step1_rounds=2)
+    with pytest.raises(AssertionError):
+        nodes[0].set_compression(Compression(Int8Compressor()))
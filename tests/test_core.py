@@ -0,0 +1,70 @@
+import numpy as np
+
+from gossipy import set_seed
+from gossipy.core import StaticP2PNetwork, UniformDynamicP2PNetwork
+
+
+def _ring(n=12, hops=(1, 2)):
+    adj = np.zeros((n, n))
+    for i in range(n):
+        for k in hops:
+            adj[i, (i + k) % n] = adj[(i + k) % n, i] = 1
+    return adj
+
+
+def _star(n=6):
+    adj = np.zeros((n, n))
+    adj[0, 1:] = adj[1:, 0] = 1
+    return adj
+
+
+def test_static_network_csr():
+    adj = _ring()
+    net = StaticP2PNetwork(len(adj), adj)
+    assert (net.adjacency().toarray() == adj).all()
+    assert (net.degrees() == adj.sum(axis=1)).all()
+    for i in range(len(adj)):
+        assert list(net.get_peers(i)) == list(np.flatnonzero(adj[i]))
+        assert net.size(i) == 4
+
+    full = StaticP2PNetwork(5, None)
+    assert (full.degrees() == 4).all()
+    assert (full.adjacency().toarray() == 1 - np.eye(5)).all()
+    assert list(full.get_peers(2)) == [0, 1, 3, 4]
+
+
+def test_sample_peers():
+    set_seed(0)
+    nodes = np.repeat(np.arange(6), 50)
+    for net in (StaticP2PNetwork(6, None), StaticP2PNetwork(6, _star())):
+        adj = net.adjacency().toarray()
+        peers = net.sample_peers(nodes)
+        assert (peers != nodes).all()
+        assert adj[nodes, peers].all()
+
+    # The isolated nodes (and the single node networks) have no peers
+    adj = _star()
+    adj[0, 5] = adj[5, 0] = 0
+    peers = StaticP2PNetwork(6, adj).sample_peers(np.arange(6))
+    assert peers[5] == -1 and (peers[:5] >= 0).all()
+    assert (StaticP2PNetwork(1, None).sample_peers(np.zeros(3)) == -1).all()
+    assert (StaticP2PNetwork(3, np.zeros((3, 3))).sample_peers(np.arange(3)) == -1).all()
+
+
+def test_network_draws_from_the_given_stream():
+    nodes = np.repeat(np.arange(12), 5)
+    for net in (StaticP2PNetwork(12, None), StaticP2PNetwork(12, _ring()),
+                UniformDynamicP2PNetwork(12, _ring())):
+        np.random.seed(0)
+        peers = net.sample_peers(nodes, np.random.default_rng(1))
+        np.random.seed(1)
+        assert (net.sample_peers(nodes, np.random.default_rng(1)) == peers).all()
+
+    views = []
+    for seed in (0, 1):
+        np.random.seed(seed)
+        net = UniformDynamicP2PNetwork(12, _ring())
+        for t in range(5):
+            net.update_views(np.arange(12), np.random.default_rng(t))
+        views.append(net.adjacency().toarray())
+    assert (views[0] == views[1]).all()
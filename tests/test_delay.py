@@ -0,0 +1,108 @@
+import numpy as np
+
+from gossipy.core import (AntiEntropyProtocol, ConstantDelay, ContentionDelay, LinkDelay, Message,
+                          MessageType, StaticP2PNetwork)
+from gossipy.node import FederatedGossipNode
+from gossipy.simul import FederatedSimulator, GossipSimulator, SimulationReport
+
+
+def _ring(n, hops=(1,)):
+    adj = np.zeros((n, n))
+    for i in range(n):
+        for k in hops:
+            adj[i, (i + k) % n] = adj[(i + k) % n, i] = 1
+    return adj
+
+
+def _msg(sender, receiver, size, t=0):
+    return Message(t, sender, receiver, MessageType.PUSH, None, size=size)
+
+
+def test_link_delay():
+    net = StaticP2PNetwork(5, _ring(5))
+    senders, receivers = LinkDelay(net).links()
+    assert list(zip(senders, receivers)) == [(i, j) for i in range(5)
+                                             for j in sorted({(i - 1) % 5, (i + 1) % 5})]
+    latency = np.arange(len(senders), dtype=float)
+    bandwidth = np.full(len(senders), 8.)
+    bandwidth[-1] = 2.
+    delay = LinkDelay(net, latency, bandwidth)
+    # delay = floor(latency + 4 * size / bandwidth)
+    msgs = [_msg(0, 1, 3), _msg(4, 0, 1), _msg(4, 3, 5), _msg(2, 1, 2)]
+    expected = [0 + 12 / 8, 8 + 4 / 8, 9 + 20 / 2, 4 + 8 / 8]
+    assert list(delay.get_batch(msgs)) == [int(d) for d in expected]
+    assert [delay.get(m) for m in msgs] == [int(d) for d in expected]
+    # The messages between nodes that are not linked get the mean latency and bandwidth
+    assert delay.get(_msg(0, 2, 4)) == int(latency.mean() + 16 / bandwidth.mean())
+
+
+def test_link_delay_in_a_simulation(torch_nodes):
+    net = StaticP2PNetwork(10, _ring(10))
+    dd, nodes = torch_nodes(p2p_net=net)
+    delay = LinkDelay(net, latency=3, bandwidth=np.inf)
+    sim = GossipSimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                          protocol=AntiEntropyProtocol.PUSH, delay=delay)
+    report = SimulationReport(message_log=True)
+    sim.add_receiver(report)
+    sim.init_nodes(seed=42)
+    sim.start(n_rounds=3)
+    sim.remove_receiver(report)
+    # The messages sent in the last 3 timesteps are still in flight at the end of the run
+    assert report._sent_messages == 30
+    assert sim.cache_report["undelivered"] == (report.get_message_log()["timestamp"] >= 27).sum()
+
+
+def test_contention_delay_fifo():
+    # 4 bytes per value and 4 bytes per time unit: a message of size s takes s time units
+    delay = ContentionDelay(4, uplink=4., latency=ConstantDelay(1))
+    assert list(delay.get_batch([_msg(0, 1, 2), _msg(0, 2, 2), _msg(0, 3, 2), _msg(1, 0, 1)])) \
+        == [3, 5, 7, 2]
+    # The messages sent later wait for the uplink to be idle
+    assert delay.get(_msg(0, 1, 1, t=1)) == 7 + 1 - 1
+    assert delay.get(_msg(0, 1, 1, t=20)) == 2
+    assert list(delay.get_stats()["uplink"]) == [8, 1, 0, 0]
+
+    delay.reset()
+    assert delay.get(_msg(0, 1, 2, t=1)) == 3
+    assert not delay.get_stats()["downlink"].any()
+
+
+def test_contention_delay_fair():
+    delay = ContentionDelay(3, uplink=4., discipline="fair")
+    # Processor sharing: the small message completes while sharing the link with the large one
+    assert list(delay.get_batch([_msg(0, 1, 3), _msg(0, 2, 1)])) == [4, 2]
+    fifo = ContentionDelay(3, uplink=4.)
+    assert list(fifo.get_batch([_msg(0, 1, 3), _msg(0, 2, 1)])) == [3, 4]
+
+
+def test_contention_delay_downlink():
+    delay = ContentionDelay(3, uplink=np.array([4., 2., 4.]), downlink=4.)
+    # The messages arrive at 2 and 4, then they are received one after the other
+    assert list(delay.get_batch([_msg(0, 2, 2), _msg(1, 2, 2)])) == [4, 6]
+    assert list(delay.get_stats()["downlink"]) == [0, 0, 4]
+
+    # The messages are received in order of arrival
+    delay.reset()
+    assert list(delay.get_batch([_msg(1, 2, 2), _msg(0, 2, 2)])) == [6, 4]
+
+
+def test_contention_in_a_federated_topology(torch_nodes):
+    adj = np.zeros((6, 6))
+    adj[0, 1:] = adj[1:, 0] = 1
+    dd, nodes = torch_nodes(n_nodes=6, node_cls=FederatedGossipNode,
+                            p2p_net=StaticP2PNetwork(6, adj))
+    size = nodes[0].model_handler.get_size()
+    # A model takes a time unit on the uplinks
+    delay = ContentionDelay(6, uplink=4. * size)
+    sim = FederatedSimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                             protocol=AntiEntropyProtocol.PUSH, delay=delay)
+    report = SimulationReport(message_log=True)
+    sim.add_receiver(report)
+    sim.init_nodes(seed=42)
+    sim.start(n_rounds=3)
+    sim.remove_receiver(report)
+    sent, _ = report.get_message_log().traffic("sender", 6)
+    # The server pays for all the models it sends
+    busy = delay.get_stats()["uplink"]
+    assert busy[0] > busy[1:].max()
+    assert np.allclose(busy, sent)
@@ -0,0 +1,68 @@
+import numpy as np
+import torch
+
+from gossipy.core import AntiEntropyProtocol, CreateModelMode
+from gossipy.model.handler import DryRunHandler
+from gossipy.simul import GossipSimulator, SimulationReport
+
+
+def test_dry_run_handler():
+    handlers = [DryRunHandler(i, 130, size=7) for i in (0, 64, 129)]
+    for h in handlers:
+        h.init()
+        h._update()
+    a, b, c = handlers
+    b._update()
+    a(b, None)
+    assert (a.coverage(), a.n_updates) == (2, 3)
+    a(c, None)
+    assert (a.coverage(), a.n_updates) == (3, 4)
+    assert (DryRunHandler.popcount(np.stack([h.model for h in handlers])) == [3, 1, 1]).all()
+    assert a.evaluate() == {"age": 4., "coverage": 3 / 130}
+    assert a.get_size() == 7
+
+    # The received model replaces the local one in the PASS mode
+    d = DryRunHandler(1, 130, create_model_mode=CreateModelMode.PASS)
+    d.init()
+    d(c, None)
+    assert d.coverage() == 1 and (d.model == c.model).all()
+
+
+def _simulator(torch_nodes):
+    dd, nodes = torch_nodes()
+    sim = GossipSimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                          protocol=AntiEntropyProtocol.PUSH, drop_prob=.1)
+    sim.init_nodes(seed=42)
+    return sim
+
+
+def test_dry_run(torch_nodes):
+    sim = _simulator(torch_nodes)
+    handlers = [node.model_handler for node in sim.nodes.values()]
+    params = torch.cat([p.detach().flatten() for h in handlers for p in h.model.parameters()])
+    stats = sim.dry_run(n_rounds=8)
+
+    # The models of the nodes are neither trained nor replaced
+    assert [node.model_handler for node in sim.nodes.values()] == handlers
+    assert torch.equal(params, torch.cat([p.detach().flatten() for h in handlers
+                                          for p in h.model.parameters()]))
+
+    assert (stats["t"] == np.arange(8) * 10 + 9).all()
+    assert stats["age"].shape == stats["coverage"].shape == (8, 10)
+    assert (np.diff(stats["age"], axis=0) >= 0).all()
+    assert (np.diff(stats["coverage"], axis=0) >= 0).all()
+    assert ((stats["coverage"] >= .1) & (stats["coverage"] <= 1)).all()
+    mixed = stats["coverage"].min(axis=1) >= 1
+    assert stats["mixing_time"] == (stats["t"][mixed][0] if mixed.any() else -1)
+    assert sim.dry_run(n_rounds=1, mixing=0.)["mixing_time"] == 9
+
+    # The dry run simulates the same communication of the actual run
+    sim = _simulator(torch_nodes)
+    report = SimulationReport(message_log=True)
+    sim.add_receiver(report)
+    sim.start(n_rounds=8)
+    sim.remove_receiver(report)
+    sent, _ = report.get_message_log().traffic("sender", 10)
+    received, _ = report.get_message_log().traffic("receiver", 10)
+    assert (stats["sent"] == sent).all() and (stats["received"] == received).all()
+    assert stats["sent"].sum() == report._sent_messages
@@ -0,0 +1,59 @@
+import pytest
+import torch
+import torch.nn.functional as F
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+
+from gossipy import set_seed
+from gossipy.model.handler import TorchModelHandler, _evaluate_classifier, _roc_auc
+from gossipy.model.nn import TorchMLP
+
+
+@pytest.mark.parametrize("n_classes, batch_size", [(2, 7), (3, 7), (3, 0)])
+def test_evaluate_classifier(n_classes, batch_size):
+    set_seed(0)
+    X = torch.randn(50, 4)
+    y = torch.randint(0, n_classes, (50,))
+    model = TorchMLP(4, n_classes, (6,))
+    res = _evaluate_classifier(model, (X, y), torch.device("cpu"), batch_size)
+
+    with torch.no_grad():
+        scores = model(X)
+    y_pred = scores.argmax(dim=1).numpy()
+    kw = {"average": "macro", "zero_division": 0}
+    assert res["accuracy"] == pytest.approx(accuracy_score(y, y_pred))
+    assert res["precision"] == pytest.approx(precision_score(y, y_pred, **kw))
+    assert res["recall"] == pytest.approx(recall_score(y, y_pred, **kw))
+    assert res["f1_score"] == pytest.approx(f1_score(y, y_pred, **kw))
+    if n_classes == 2:
+        assert res["auc"] == pytest.approx(roc_auc_score(y, scores[:, 1]))
+    else:
+        assert "auc" not in res
+
+    # One-hot labels are supported as well
+    res_onehot = _evaluate_classifier(model, (X, F.one_hot(y, n_classes)), torch.device("cpu"),
+                                      batch_size)
+    assert res_onehot == pytest.approx(res)
+
+
+def test_roc_auc_ties():
+    y = torch.tensor([0, 1, 1, 0, 1, 0, 1])
+    scores = torch.tensor([.1, .4, .4, .4, .9, .2, .2])
+    assert _roc_auc(y, scores) == pytest.approx(roc_auc_score(y, scores))
+
+
+def test_handler_evaluation_is_batched():
+    set_seed(1)
+    handler = TorchModelHandler(net=TorchMLP(4, 2, (6,)),
+                                optimizer=torch.optim.SGD,
+                                optimizer_params={"lr": .1},
+                                criterion=F.cross_entropy,
+                                batch_size=8)
+    handler.init()
+    X = torch.randn(40, 4)
+    y = (X[:, 0] > 0).long()
+    handler._update((X, y))
+    full = handler.evaluate((X, y))
+    handler.eval_batch_size = 3
+    assert handler.evaluate((X, y)) == pytest.approx(full)
+    # The evaluation does not track the gradients
+    assert all(p.grad is None for p in handler.model.parameters())
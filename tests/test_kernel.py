@@ -0,0 +1,57 @@
+import pytest
+
+from gossipy.core import AntiEntropyProtocol
+from gossipy.simul import GossipSimulator, SimulationReport
+
+
+class _RelaySimulator(GossipSimulator):
+    # Only the even nodes send, and always to the next node
+    def _pre_send(self, t, node):
+        return node.idx % 2 == 0
+
+    def _select_peers(self, t, node):
+        return [((node.idx + 1) % self.n_nodes, self.protocol)]
+
+
+def _run(sim, n_rounds=4, **kwargs):
+    report = SimulationReport(message_log=True)
+    sim.add_receiver(report)
+    sim.init_nodes(seed=42)
+    sim._run(n_rounds, **kwargs)
+    sim.remove_receiver(report)
+    return report
+
+
+@pytest.mark.parametrize("event_driven", [False, True])
+def test_kernel_hooks(torch_nodes, event_driven):
+    dd, nodes = torch_nodes()
+    sim = _RelaySimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                          protocol=AntiEntropyProtocol.PUSH, event_driven=event_driven)
+    report = _run(sim)
+    log = report.get_message_log()
+    sent, _ = log.traffic("sender", 10)
+    received, _ = log.traffic("receiver", 10)
+    assert list(sent) == [4, 0] * 5
+    assert list(received) == [0, 4] * 5
+    assert sim.n_rounds == 4
+    assert [t for t, _ in report.get_evaluation(False)] == [9, 19, 29, 39]
+
+
+def test_profiled_hooks(torch_nodes):
+    dd, nodes = torch_nodes()
+    sim = GossipSimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                          protocol=AntiEntropyProtocol.PUSH_PULL, profile=True)
+    report = _run(sim)
+    assert report._sent_messages == 80
+    assert set(sim.profile_stats) == set(GossipSimulator._PROFILED_HOOKS)
+    assert all(v >= 0 for v in sim.profile_stats.values())
+    # The hooks are unwrapped at the end of the run
+    assert not set(GossipSimulator._PROFILED_HOOKS) & set(vars(sim))
+
+
+def test_wall_time_limit(torch_nodes):
+    dd, nodes = torch_nodes()
+    sim = GossipSimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                          protocol=AntiEntropyProtocol.PUSH)
+    report = _run(sim, wall_time_limit=0.)
+    assert report._sent_messages == 0 and not report.get_evaluation(False)
@@ -0,0 +1,105 @@
+import copy
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from gossipy import set_seed
+from gossipy.core import CreateModelMode
+from gossipy.model import TorchModel
+from gossipy.model.handler import TorchModelHandler, WeightedTMH, _flat_state
+
+
+class _BatchNormNet(TorchModel):
+    def __init__(self, dim: int, n_classes: int):
+        super().__init__()
+        self.bn = torch.nn.BatchNorm1d(dim)
+        self.fc = torch.nn.Linear(dim, n_classes)
+
+    def forward(self, x):
+        return self.fc(self.bn(x))
+
+    def init_weights(self) -> None:
+        self.fc.reset_parameters()
+
+
+def _handlers(n=3, handler_cls=TorchModelHandler):
+    set_seed(42)
+    proto = handler_cls(net=_BatchNormNet(5, 2),
+                        optimizer=torch.optim.SGD,
+                        optimizer_params={"lr": .1},
+                        criterion=F.cross_entropy,
+                        create_model_mode=CreateModelMode.MERGE_UPDATE,
+                        batch_size=8)
+    handlers = []
+    for i in range(n):
+        handler = copy.deepcopy(proto)
+        handler.init()
+        g = torch.Generator().manual_seed(i)
+        X = torch.randn(16 * (i + 1), 5, generator=g)
+        handler._update((X, (X[:, 0] > 0).long()))
+        handlers.append(handler)
+    return handlers
+
+
+def _state(handler):
+    return {k: v.clone() for k, v in handler.model.state_dict().items()}
+
+
+def test_flat_state():
+    handler, = _handlers(1)
+    flat, rest = _flat_state(handler.model)
+    assert [name for name, _ in rest] == ["bn.num_batches_tracked"]
+    assert flat.numel() == sum(t.numel() for k, t in handler.model.state_dict().items()
+                               if k != "bn.num_batches_tracked")
+    # The tensors of the model are views of the flat tensor
+    storage = flat.untyped_storage().data_ptr()
+    assert all(p.untyped_storage().data_ptr() == storage for p in handler.model.parameters())
+    assert _flat_state(handler.model)[0].data_ptr() == flat.data_ptr()
+    with torch.no_grad():
+        flat.zero_()
+    assert not any(p.any() for p in handler.model.parameters())
+
+    # A copy of the model gets its own flat tensor
+    model = copy.deepcopy(handler.model)
+    other, _ = _flat_state(model)
+    assert other.data_ptr() != flat.data_ptr()
+    assert next(model.parameters()).untyped_storage().data_ptr() == \
+        other.untyped_storage().data_ptr()
+
+    # The model can still be trained through its optimizer
+    handler._update((torch.randn(8, 5), torch.randint(0, 2, (8,))))
+    assert flat.any()
+
+
+@pytest.mark.parametrize("received", [False, True])
+def test_flat_merge(received):
+    h0, h1, h2 = _handlers(3)
+    states = ([] if received else [_state(h0)]) + [_state(h1), _state(h2)]
+    getattr(h0, "_merge_received" if received else "_merge")([h1, h2])
+    merged = _state(h0)
+    for k, v in merged.items():
+        if k.endswith("num_batches_tracked"):
+            # The counters are summed
+            assert v == sum(s[k] for s in states)
+        else:
+            # Same order of the operations, hence the same result, of averaging the state dicts
+            expected = states[0][k].clone()
+            for s in states[1:]:
+                expected += s[k]
+            assert torch.equal(v, expected / len(states)), k
+
+
+def test_weighted_merge():
+    h0, h1, h2 = _handlers(3, WeightedTMH)
+    states = [_state(h) for h in (h0, h1, h2)]
+    weights = [.5, .3, .2]
+    h0._merge([h1, h2], weights)
+    merged = _state(h0)
+    for k, v in merged.items():
+        if k.endswith("num_batches_tracked"):
+            assert v == sum(s[k] for s in states)
+        else:
+            expected = sum(w * s[k] for w, s in zip(weights, states))
+            assert torch.allclose(v, expected, atol=1e-6), k
+    assert h0.n_updates == max(h.n_updates for h in (h1, h2))
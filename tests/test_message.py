@@ -0,0 +1,102 @@
+import pytest
+
+from gossipy import CACHE, CacheKey
+from gossipy.core import AntiEntropyProtocol, Message, MessageLog, MessageType
+from gossipy.simul import GossipSimulator, SimulationReport
+
+
+class _Counted(CacheKey):
+    # A cached value that counts how many times its size is computed
+    calls = 0
+
+    def get_size(self):
+        _Counted.calls += 1
+        return 7
+
+
+def test_message_size_is_memoized():
+    _Counted.calls = 0
+    msg = Message(0, 1, 2, MessageType.PUSH, (_Counted(1, 0), 3))
+    assert msg.get_size() == msg.get_size() == 8
+    assert _Counted.calls == 1
+    assert Message(0, 1, 2, MessageType.PUSH, (_Counted(1, 0),), size=5).get_size() == 5
+    assert _Counted.calls == 1
+    assert Message(0, 1, 2, MessageType.REPLY, None).get_size() == 1
+
+
+def test_cache_keys_carry_the_size(torch_nodes):
+    dd, nodes = torch_nodes()
+    handler = nodes[0].model_handler
+    handler.init()
+    n_params = sum(p.numel() for p in handler.model.parameters())
+    assert handler.get_size() == handler.model.get_size() == n_params
+
+    key = handler.caching(0)
+    assert key.size == n_params
+    # The size of the key does not depend on the cache
+    CACHE.clear()
+    assert key.get_size() == n_params
+    assert Message(0, 0, 1, MessageType.PUSH, (key,)).get_size() == n_params
+
+
+def test_report_counts_the_message_sizes(torch_nodes):
+    dd, nodes = torch_nodes()
+    sim = GossipSimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                          protocol=AntiEntropyProtocol.PUSH, drop_prob=.2)
+    report = SimulationReport()
+    sim.add_receiver(report)
+    sim.init_nodes(seed=42)
+    sim.start(n_rounds=4)
+    sim.remove_receiver(report)
+    size = nodes[0].model_handler.get_size()
+    assert report._total_size == report._sent_messages * size
+
+
+def test_message_slots():
+    msg = Message(0, 1, 2, MessageType.PUSH, (3,))
+    assert not hasattr(msg, "__dict__")
+    with pytest.raises(AttributeError):
+        msg.foo = 1
+
+
+def test_message_log():
+    log = MessageLog(capacity=2)
+    msgs = [Message(t, t % 3, (t + 1) % 3, MessageType.PUSH, (1, 2)) for t in range(5)]
+    for i, msg in enumerate(msgs):
+        log.append(msg, failed=i == 3)
+    log.append(None, failed=True)
+    assert len(log) == 6
+    cols = log.to_dict()
+    assert list(cols["timestamp"]) == [0, 1, 2, 3, 4, -1]
+    assert list(cols["sender"]) == [0, 1, 2, 0, 1, -1]
+    assert list(cols["size"]) == [2, 2, 2, 0, 2, 0]
+    assert list(cols["failed"]) == [False, False, False, True, False, True]
+    assert (cols["type"][:5] == MessageType.PUSH.value).all()
+
+    sent, size = log.traffic("sender", 4)
+    assert list(sent) == [1, 2, 1, 0] and list(size) == [2, 4, 2, 0]
+    received, _ = log.traffic("receiver")
+    assert list(received) == [1, 1, 2]
+    ok, failed = log.per_timestep(6)
+    assert list(ok) == [1, 1, 1, 0, 1, 0] and list(failed) == [0, 0, 0, 1, 0, 0]
+
+    log.clear()
+    assert len(log) == 0 and log.traffic()[0].size == 0
+
+
+def test_report_message_log(torch_nodes):
+    dd, nodes = torch_nodes()
+    sim = GossipSimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                          protocol=AntiEntropyProtocol.PUSH_PULL, drop_prob=.2, online_prob=.8)
+    report = SimulationReport(message_log=True)
+    sim.add_receiver(report)
+    sim.init_nodes(seed=42)
+    sim.start(n_rounds=4)
+    sim.remove_receiver(report)
+    log = report.get_message_log()
+    assert len(log) == report._sent_messages + report._failed_messages
+    assert log["failed"].sum() == report._failed_messages > 0
+    assert log.traffic()[1].sum() == report._total_size
+    ok, failed = log.per_timestep(40)
+    assert (ok.sum(), failed.sum()) == (report._sent_messages, report._failed_messages)
+    assert SimulationReport().get_message_log() is None
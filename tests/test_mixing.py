@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from gossipy import set_seed
+from gossipy.core import (MetropolisHastingsMixing, StaticP2PNetwork, UniformDynamicP2PNetwork,
+                          UniformMixing)
+from gossipy.node import All2AllGossipNode
+
+
+def _ring(n=12, hops=(1, 2)):
+    adj = np.zeros((n, n))
+    for i in range(n):
+        for k in hops:
+            adj[i, (i + k) % n] = adj[(i + k) % n, i] = 1
+    return adj
+
+
+@pytest.mark.parametrize("mixing_cls", [UniformMixing, MetropolisHastingsMixing])
+def test_mixing_matrix(mixing_cls):
+    adj = _ring(10, hops=(1,))
+    adj[0, 5] = adj[5, 0] = 1
+    net = StaticP2PNetwork(len(adj), adj)
+    mixing = mixing_cls(net)
+    W = mixing.matrix().toarray()
+    deg = adj.sum(axis=1).astype(int)
+    assert (W[(adj + np.eye(len(adj))) == 0] == 0).all()
+    if mixing_cls is UniformMixing:
+        assert np.allclose(W.sum(axis=1), 1)
+        assert np.allclose(W[adj + np.eye(len(adj)) > 0], np.repeat(1. / (deg + 1), deg + 1))
+    else:
+        # The weights of the peers are symmetric, while the node itself weighs 1 / degree
+        assert np.allclose(W, W.T)
+        assert np.allclose(np.diag(W), 1. / deg)
+        rows, cols = np.nonzero(adj)
+        assert np.allclose(W[rows, cols], 1. / (np.minimum(deg[rows], deg[cols]) + 1))
+    for i in range(len(adj)):
+        indices, weights = mixing.row(i)
+        assert list(indices) == list(np.flatnonzero(W[i]))
+        assert np.allclose(weights, W[i, indices])
+        peers = net.get_peers(i)
+        assert np.allclose(mixing[i], np.concatenate([[W[i, i]], W[i, peers]]))
+    assert mixing.matrix() is mixing.matrix()
+
+
+def test_mixing_matrix_follows_topology():
+    set_seed(0)
+    net = UniformDynamicP2PNetwork(12, _ring())
+    mixing = UniformMixing(net)
+    W = mixing.matrix()
+    net.update_views(np.arange(12))
+    assert mixing.matrix() is not W
+    A = mixing.matrix().toarray() > 0
+    assert (A == (net.adjacency().toarray() + np.eye(12) > 0)).all()
+
+
+def test_merge_weights():
+    adj = _ring(10, hops=(1,))
+    adj[0, 5] = adj[5, 0] = 1
+    mixing = UniformMixing(StaticP2PNetwork(len(adj), adj))
+    node = All2AllGossipNode.__new__(All2AllGossipNode)
+    node.idx = 0
+    # The weights of the row of the node, aligned with the senders and normalized
+    assert np.allclose(node._merge_weights(mixing, [0, 9, 1, 5]), [.25] * 4)
+    assert np.allclose(node._merge_weights(mixing, [0, 5]), [.5, .5])
+    # Senders that are not in the row get no weight
+    assert np.allclose(node._merge_weights(mixing, [0, 3, 1]), [.5, 0, .5])
+    node.idx = 3
+    assert np.allclose(node._merge_weights(mixing, [3, 0]), [1, 0])
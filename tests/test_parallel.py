@@ -0,0 +1,50 @@
+import pytest
+import torch
+
+from gossipy.core import AntiEntropyProtocol
+from gossipy.parallel import BatchedTorchExecutor, ProcessPoolExecutor
+from gossipy.simul import GossipSimulator, SimulationReport
+
+
+def _simulate(torch_nodes, executor, protocol=AntiEntropyProtocol.PUSH_PULL):
+    dd, nodes = torch_nodes()
+    sim = GossipSimulator(nodes=nodes, data_dispatcher=dd, delta=10, protocol=protocol,
+                          drop_prob=.1, online_prob=.9, executor=executor)
+    report = SimulationReport()
+    sim.add_receiver(report)
+    sim.init_nodes(seed=42)
+    sim.start(n_rounds=4)
+    sim.remove_receiver(report)
+    params = torch.cat([p.detach().flatten() for i in range(len(nodes))
+                        for p in nodes[i].model_handler.model.parameters()])
+    n_updates = [nodes[i].model_handler.n_updates for i in range(len(nodes))]
+    return report._sent_messages, report._failed_messages, n_updates, params
+
+
+@pytest.mark.parametrize("protocol", [AntiEntropyProtocol.PUSH, AntiEntropyProtocol.PUSH_PULL])
+def test_process_pool_matches_the_sequential_run(torch_nodes, monkeypatch, protocol):
+    waves = []
+    execute = ProcessPoolExecutor._execute
+    monkeypatch.setattr(ProcessPoolExecutor, "_execute",
+                        lambda self, sim, t, wave: (waves.append(len(wave)),
+                                                    execute(self, sim, t, wave)))
+    *expected, params = _simulate(torch_nodes, None, protocol)
+    *res, pool_params = _simulate(torch_nodes, ProcessPoolExecutor(n_workers=3), protocol)
+    assert max(waves) > 1
+    assert res == expected
+    assert torch.equal(pool_params, params)
+
+
+@pytest.mark.parametrize("protocol", [AntiEntropyProtocol.PUSH, AntiEntropyProtocol.PUSH_PULL])
+def test_batched_training_matches_the_sequential_run(torch_nodes, monkeypatch, protocol):
+    batches = []
+    batched_update = BatchedTorchExecutor._batched_update
+    monkeypatch.setattr(BatchedTorchExecutor, "_batched_update",
+                        lambda self, handlers, data, gens: (batches.append(len(handlers)),
+                                                            batched_update(self, handlers, data,
+                                                                           gens)))
+    *expected, params = _simulate(torch_nodes, None, protocol)
+    *res, batched_params = _simulate(torch_nodes, BatchedTorchExecutor(), protocol)
+    assert max(batches) > 1
+    assert res == expected
+    assert torch.allclose(batched_params, params, atol=1e-5)
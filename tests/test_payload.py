@@ -0,0 +1,109 @@
+import copy
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from gossipy import CACHE, set_seed
+from gossipy.core import CreateModelMode
+from gossipy.model import TorchModel
+from gossipy.model.handler import ModelPayload, TorchModelHandler, _flat_state
+
+
+class _BatchNormNet(TorchModel):
+    def __init__(self, dim: int, n_classes: int):
+        super().__init__()
+        self.bn = torch.nn.BatchNorm1d(dim)
+        self.fc = torch.nn.Linear(dim, n_classes)
+
+    def forward(self, x):
+        return self.fc(self.bn(x))
+
+    def init_weights(self) -> None:
+        self.fc.reset_parameters()
+
+
+def _data(n=64, dim=5, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    X = torch.randn(n, dim, generator=g)
+    return X, (X[:, 0] + X[:, 1] > 0).long()
+
+
+def _handlers(n=3, net=None):
+    set_seed(42)
+    proto = TorchModelHandler(net=net or _BatchNormNet(5, 2),
+                              optimizer=torch.optim.SGD,
+                              optimizer_params={"lr": .1},
+                              criterion=F.cross_entropy,
+                              create_model_mode=CreateModelMode.MERGE_UPDATE,
+                              batch_size=8)
+    handlers = []
+    for i in range(n):
+        handler = copy.deepcopy(proto)
+        handler.init()
+        handler._update(_data(seed=i))
+        handlers.append(handler)
+    return handlers
+
+
+def _state(handler):
+    return {k: v.clone() for k, v in handler.model.state_dict().items()}
+
+
+def _assert_same_state(a, b):
+    assert a.keys() == b.keys()
+    for k in a:
+        assert torch.allclose(a[k].float(), b[k].float()), k
+
+
+def test_payload_roundtrip():
+    h1, h2 = _handlers(2)
+    payload = h1.payload()
+    assert isinstance(payload, ModelPayload)
+    assert payload.n_updates == h1.n_updates
+    assert payload.get_size() == h1.get_size()
+
+    unpacked = h2.unpack(payload)
+    assert unpacked is not h2 and unpacked.model is not h2.model
+    _assert_same_state(_state(unpacked), _state(h1))
+    assert unpacked.n_updates == h1.n_updates
+    # The unpacked handler has its own optimizer over its own parameters
+    params = set(map(id, unpacked.model.parameters()))
+    assert all(id(p) in params for g in unpacked.optimizer.param_groups for p in g["params"])
+
+    # The payload is a copy, i.e., it does not change when the handler is trained
+    before = payload.flat.clone()
+    h1._update(_data(seed=5))
+    assert torch.equal(payload.flat, before)
+
+
+@pytest.mark.parametrize("received", [False, True])
+def test_merge_from_payload(received):
+    h0, h1, h2 = _handlers(3)
+    by_handler, by_payload = copy.deepcopy(h0), copy.deepcopy(h0)
+    merge = "_merge_received" if received else "_merge"
+    getattr(by_handler, merge)([h1, h2])
+    getattr(by_payload, merge)([h1.payload(), h2.payload()])
+    _assert_same_state(_state(by_handler), _state(by_payload))
+    assert by_handler.n_updates == by_payload.n_updates == max(h.n_updates for h in (h0, h1, h2))
+
+    # The (floating point) parameters are averaged
+    models = ([] if received else [h0]) + [h1, h2]
+    expected = torch.stack([h.model.fc.weight for h in models]).mean(0)
+    assert torch.allclose(by_payload.model.fc.weight, expected)
+
+
+@pytest.mark.parametrize("mode", list(CreateModelMode))
+def test_caching_pushes_a_payload(mode):
+    CACHE.clear()
+    handler, = _handlers(1)
+    handler.mode = mode
+    value = CACHE[handler.caching(0)]
+    # Only the merging modes can use the payload instead of the handler
+    if mode in (CreateModelMode.MERGE_UPDATE, CreateModelMode.MERGE):
+        assert isinstance(value, ModelPayload)
+        assert torch.equal(value.flat, _flat_state(handler.model)[0])
+        assert value.flat.data_ptr() != _flat_state(handler.model)[0].data_ptr()
+    else:
+        assert isinstance(value, TorchModelHandler)
+    CACHE.clear()
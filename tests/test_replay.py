@@ -0,0 +1,75 @@
+import pytest
+import torch
+
+from gossipy.churn import ExponentialChurn
+from gossipy.core import AntiEntropyProtocol, CommunicationTrace, UniformDelay
+from gossipy.simul import GossipSimulator, ReplaySimulator, SimulationReport
+
+
+def _run(sim, n_rounds=6):
+    report = SimulationReport(message_log=True)
+    sim.add_receiver(report)
+    sim.init_nodes(seed=42)
+    sim.start(n_rounds=n_rounds)
+    sim.remove_receiver(report)
+    params = torch.cat([p.detach().flatten() for i in range(sim.n_nodes)
+                        for p in sim.nodes[i].model_handler.model.parameters()])
+    return report, params
+
+
+@pytest.mark.parametrize("protocol", [AntiEntropyProtocol.PUSH, AntiEntropyProtocol.PUSH_PULL])
+def test_replay_reproduces_the_recorded_run(torch_nodes, tmp_path, protocol):
+    dd, nodes = torch_nodes(sync=False)
+    sim = GossipSimulator(nodes=nodes, data_dispatcher=dd, delta=10, protocol=protocol,
+                          drop_prob=.2, online_prob=ExponentialChurn(20, 10),
+                          delay=UniformDelay(0, 12))
+    trace = sim.record_trace()
+    report, params = _run(sim)
+    # One row per message (the replies are stored in the rows of their requests)
+    if protocol == AntiEntropyProtocol.PUSH:
+        assert len(trace) == report._sent_messages
+        assert (trace["reply_t"] == CommunicationTrace.NO_REPLY).all()
+    else:
+        assert len(trace) < report._sent_messages
+    assert (trace["deliver_t"] == CommunicationTrace.NOT_RECEIVED).any()
+    assert (trace["deliver_t"] == CommunicationTrace.IN_FLIGHT).any()
+    trace.save(str(tmp_path / "trace.npz"))
+
+    for recorded in (trace, str(tmp_path / "trace.npz")):
+        dd, nodes = torch_nodes(sync=False)
+        replay = ReplaySimulator(nodes=nodes, data_dispatcher=dd, delta=10, trace=recorded)
+        replayed, replayed_params = _run(replay)
+        assert (replayed._sent_messages, replayed._failed_messages) == \
+            (report._sent_messages, report._failed_messages)
+        for by in ("sender", "receiver"):
+            assert (replayed.get_message_log().traffic(by, 10)[0] ==
+                    report.get_message_log().traffic(by, 10)[0]).all()
+        assert torch.equal(replayed_params, params)
+        # The messages lost to churn are replayed as dropped
+        assert replay.cache_report["dropped"] == \
+            sim.cache_report["dropped"] + sim.cache_report["offline"]
+        assert replay.cache_report["undelivered"] == sim.cache_report["undelivered"]
+
+
+def test_replay_with_another_model(torch_nodes):
+    dd, nodes = torch_nodes()
+    sim = GossipSimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                          protocol=AntiEntropyProtocol.PUSH, drop_prob=.3)
+    trace = sim.record_trace()
+    report, params = _run(sim)
+
+    # Same schedule, different learning rate
+    dd, nodes = torch_nodes()
+    for node in nodes.values():
+        for group in node.model_handler.optimizer.param_groups:
+            group["lr"] = .01
+    replayed, replayed_params = _run(ReplaySimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                                                     trace=trace))
+    log, replayed_log = report.get_message_log(), replayed.get_message_log()
+    for c in ("timestamp", "sender", "receiver", "failed"):
+        assert (log[c] == replayed_log[c]).all()
+    assert not torch.equal(replayed_params, params)
+
+    dd, nodes = torch_nodes(n_nodes=5)
+    with pytest.raises(AssertionError):
+        ReplaySimulator(nodes=nodes, data_dispatcher=dd, delta=10, trace=trace)
@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from gossipy import RESIDENCY, DeviceResidency
+from gossipy.core import CreateModelMode
+from gossipy.model.handler import TorchModelHandler
+from gossipy.model.nn import TorchMLP
+
+
+class _FakeModel(torch.nn.Module):
+    # A model that only pretends to move between devices
+    def __init__(self):
+        super().__init__()
+        self.device = torch.device("cpu")
+        self.moves = []
+
+    def parameters(self, recurse=True):
+        yield SimpleNamespace(device=self.device)
+
+    def to(self, device):
+        self.device = torch.device(device)
+        self.moves.append(self.device.type)
+        return self
+
+
+def test_residency_lru():
+    residency = DeviceResidency(capacity=2)
+    a, b, c = _FakeModel(), _FakeModel(), _FakeModel()
+    for model in (a, b, a):
+        assert residency.acquire(model, "cuda") is model
+    assert residency.get_stats() == {"hits": 1, "moves": 2, "evictions": 0, "resident": 2}
+
+    # b is the least recently used model
+    residency.acquire(c, "cuda")
+    assert b.device.type == "cpu" and b.moves == ["cuda", "cpu"]
+    assert a.device.type == c.device.type == "cuda"
+    assert residency.get_stats() == {"hits": 1, "moves": 3, "evictions": 1, "resident": 2}
+
+    # Requesting the cpu evicts the model, and releasing a non resident model is a no-op
+    residency.acquire(a, "cpu")
+    assert a.device.type == "cpu" and len(residency) == 1
+    residency.release(b)
+    residency.release(c)
+    assert c.device.type == "cpu" and len(residency) == 0
+
+    residency.acquire(a, "cuda")
+    residency.acquire(b, "cuda")
+    residency.set_capacity(1)
+    assert a.device.type == "cpu" and b.device.type == "cuda"
+    residency.clear()
+    assert b.device.type == "cpu" and residency.get_stats()["evictions"] == 5
+
+
+def test_garbage_collected_models_are_untracked():
+    residency = DeviceResidency(capacity=None)
+    residency.acquire(_FakeModel(), "cuda")
+    model = _FakeModel()
+    residency.acquire(model, "cuda")
+    assert len(residency) == 1
+    assert residency.get_stats()["evictions"] == 0
+
+
+def _handler():
+    return TorchModelHandler(net=TorchMLP(5, 2, (4,)),
+                             optimizer=torch.optim.SGD,
+                             optimizer_params={"lr": .1, "momentum": .9},
+                             criterion=F.cross_entropy,
+                             create_model_mode=CreateModelMode.MERGE_UPDATE,
+                             batch_size=8)
+
+
+def _data():
+    X = torch.randn(32, 5)
+    return X, (X[:, 0] > 0).long()
+
+
+def test_cpu_models_are_not_tracked():
+    RESIDENCY.clear()
+    RESIDENCY.reset_stats()
+    handler = _handler()
+    handler.init()
+    handler._update(_data())
+    handler.evaluate(_data())
+    assert RESIDENCY.get_stats() == {"hits": 0, "moves": 0, "evictions": 0, "resident": 0}
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="CUDA is not available")
+def test_models_stay_on_the_device():
+    RESIDENCY.clear()
+    RESIDENCY.reset_stats()
+    handler = _handler()
+    handler.device = torch.device("cuda")
+    handler.init()
+    for _ in range(3):
+        handler._update(_data())
+    assert next(handler.model.parameters()).is_cuda
+    assert all(v.is_cuda for s in handler.optimizer.state.values() for v in s.values()
+               if v.dim() > 0)
+    assert RESIDENCY.get_stats()["moves"] == 1
+    RESIDENCY.release(handler.model)
+    assert not next(handler.model.parameters()).is_cuda
+    assert all(not v.is_cuda for s in handler.optimizer.state.values() for v in s.values())
@@ -0,0 +1,134 @@
+import random
+
+import numpy as np
+import pytest
+import torch
+
+from gossipy.churn import ExponentialChurn
+from gossipy.core import (AntiEntropyProtocol, StaticP2PNetwork, UniformDelay,
+                          UniformDynamicP2PNetwork)
+from gossipy.flow_control import RandomizedTokenAccount
+from gossipy.node import CacheNeighNode, FederatedGossipNode, PassThroughNode
+from gossipy.simul import (DynamicGossipSimulator, EventDrivenGossipSimulator, FederatedSimulator,
+                           GossipSimulator, SimulationReport, TokenizedGossipSimulator)
+
+
+def _simulate(torch_nodes, event_driven, protocol, online_prob, sync):
+    dd, nodes = torch_nodes(sync=sync)
+    sim = GossipSimulator(nodes=nodes,
+                          data_dispatcher=dd,
+                          delta=10,
+                          protocol=protocol,
+                          drop_prob=.1,
+                          online_prob=online_prob,
+                          delay=UniformDelay(0, 5),
+                          event_driven=event_driven)
+    report = SimulationReport()
+    sim.add_receiver(report)
+    sim.init_nodes(seed=42)
+    sim.start(n_rounds=8)
+    sim.remove_receiver(report)
+    params = torch.cat([p.detach().flatten() for i in range(len(nodes))
+                        for p in nodes[i].model_handler.model.parameters()])
+    return report._sent_messages, report._failed_messages, params
+
+
+@pytest.mark.parametrize("protocol", [AntiEntropyProtocol.PUSH, AntiEntropyProtocol.PUSH_PULL])
+@pytest.mark.parametrize("online_prob", [.8, ExponentialChurn(20, 10)])
+@pytest.mark.parametrize("sync", [True, False])
+def test_schedulers_are_equivalent(torch_nodes, protocol, online_prob, sync):
+    sent, failed, params = _simulate(torch_nodes, False, protocol, online_prob, sync)
+    ev_sent, ev_failed, ev_params = _simulate(torch_nodes, True, protocol, online_prob, sync)
+    assert failed > 0
+    assert (sent, failed) == (ev_sent, ev_failed)
+    assert torch.equal(params, ev_params)
+
+
+def test_event_driven_simulator(torch_nodes):
+    # Same as GossipSimulator(event_driven=True), thus the same run of the time-stepped scheduler
+    dd, nodes = torch_nodes(sync=False)
+    sim = EventDrivenGossipSimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                                     protocol=AntiEntropyProtocol.PUSH, drop_prob=.1,
+                                     online_prob=ExponentialChurn(20, 10), delay=UniformDelay(0, 5))
+    assert sim.event_driven
+    report = SimulationReport()
+    sim.add_receiver(report)
+    sim.init_nodes(seed=42)
+    sim.start(n_rounds=8)
+    sim.remove_receiver(report)
+    params = torch.cat([p.detach().flatten() for i in range(len(nodes))
+                        for p in nodes[i].model_handler.model.parameters()])
+    sent, failed, expected = _simulate(torch_nodes, False, AntiEntropyProtocol.PUSH,
+                                       ExponentialChurn(20, 10), False)
+    assert (report._sent_messages, report._failed_messages) == (sent, failed)
+    assert torch.equal(params, expected)
+
+
+def _ring(n, hops=(1, 2)):
+    adj = np.zeros((n, n))
+    for i in range(n):
+        for k in hops:
+            adj[i, (i + k) % n] = adj[(i + k) % n, i] = 1
+    return adj
+
+
+def _star(n):
+    adj = np.zeros((n, n))
+    adj[0, 1:] = adj[1:, 0] = 1
+    return adj
+
+
+_SETUPS = {
+    "dynamic": (DynamicGossipSimulator,
+                lambda: {"p2p_net": UniformDynamicP2PNetwork(10, _ring(10))},
+                {"peer_sampling_period": 5}),
+    "federated": (FederatedSimulator,
+                  lambda: {"node_cls": FederatedGossipNode,
+                           "p2p_net": StaticP2PNetwork(6, _star(6)),
+                           "n_nodes": 6},
+                  {}),
+    "tokenized": (TokenizedGossipSimulator,
+                  lambda: {},
+                  {"token_account": RandomizedTokenAccount(C=4, A=2),
+                   "utility_fun": lambda mh1, mh2, msg: 1}),
+    "cacheneigh": (GossipSimulator, lambda: {"node_cls": CacheNeighNode}, {}),
+    "passthrough": (GossipSimulator, lambda: {"node_cls": PassThroughNode}, {}),
+}
+
+
+@pytest.mark.parametrize("setup", list(_SETUPS))
+def test_runs_do_not_depend_on_the_global_random_state(torch_nodes, setup):
+    sim_cls, node_kwargs, sim_kwargs = _SETUPS[setup]
+
+    def run(global_seed):
+        dd, nodes = torch_nodes(**node_kwargs())
+        sim = sim_cls(nodes=nodes, data_dispatcher=dd, delta=10,
+                      protocol=AntiEntropyProtocol.PUSH, sampling_eval=.5, **sim_kwargs)
+        report = SimulationReport()
+        sim.add_receiver(report)
+        sim.init_nodes(seed=42)
+        # The global random state does not affect the simulation
+        np.random.seed(global_seed)
+        random.seed(global_seed)
+        sim.start(n_rounds=6)
+        sim.remove_receiver(report)
+        params = torch.cat([p.detach().flatten() for i in range(len(nodes))
+                            for p in nodes[i].model_handler.model.parameters()])
+        return report._sent_messages, report.get_evaluation(False), params
+
+    sent, evaluation, params = run(0)
+    other_sent, other_evaluation, other_params = run(1)
+    assert sent > 0
+    assert (sent, evaluation) == (other_sent, other_evaluation)
+    assert torch.equal(params, other_params)
+
+
+def test_federated_simulator_records_the_rounds(torch_nodes):
+    # The number of rounds is read by gossipy.attacks.utils.log_results
+    dd, nodes = torch_nodes(n_nodes=6, node_cls=FederatedGossipNode,
+                            p2p_net=StaticP2PNetwork(6, _star(6)))
+    sim = FederatedSimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                             protocol=AntiEntropyProtocol.PUSH)
+    sim.init_nodes(seed=42)
+    sim.start(n_rounds=3)
+    assert sim.n_rounds == 3
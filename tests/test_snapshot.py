@@ -0,0 +1,73 @@
+import copy
+
+import torch
+import torch.nn.functional as F
+
+from gossipy import CACHE, set_seed
+from gossipy.core import CreateModelMode
+from gossipy.model.handler import TorchModelHandler
+from gossipy.model.nn import TorchMLP
+
+
+def _handler(mode=CreateModelMode.MERGE_UPDATE):
+    set_seed(0)
+    handler = TorchModelHandler(net=TorchMLP(5, 2, (4,)),
+                                optimizer=torch.optim.SGD,
+                                optimizer_params={"lr": .1},
+                                criterion=F.cross_entropy,
+                                create_model_mode=mode,
+                                batch_size=8)
+    handler.init()
+    return handler
+
+
+def _data(seed):
+    g = torch.Generator().manual_seed(seed)
+    X = torch.randn(16, 5, generator=g)
+    return X, (X[:, 0] > 0).long()
+
+
+def _weights(handler):
+    return torch.cat([p.detach().flatten() for p in handler.model.parameters()])
+
+
+def test_snapshots_are_copy_on_write():
+    handler = _handler()
+    snap = handler.snapshot()
+    assert snap.model is handler.model
+    assert handler.snapshot() is snap
+    before = _weights(handler).clone()
+
+    # Modifying the handler materializes the snapshot first
+    handler._update(_data(0))
+    assert snap.model is not handler.model
+    assert torch.equal(_weights(snap), before)
+    assert not torch.equal(_weights(handler), before)
+    assert handler.snapshot() is not snap
+
+    # Modifying a snapshot does not change the handler, and it trains its own parameters
+    snap2 = handler.snapshot()
+    after = _weights(handler).clone()
+    snap2._update(_data(1))
+    assert torch.equal(_weights(handler), after)
+    assert not torch.equal(_weights(snap2), after)
+    params = set(map(id, snap2.model.parameters()))
+    assert all(id(p) in params for g in snap2.optimizer.param_groups for p in g["params"])
+    assert snap2.optimizer is not handler.optimizer
+
+
+def test_caching_pushes_a_snapshot():
+    CACHE.clear()
+    # The merging modes cache a payload instead (see ModelPayload)
+    handler = _handler(CreateModelMode.UPDATE)
+    key = handler.caching(3)
+    assert CACHE[key].model is handler.model
+    handler._update(_data(0))
+    assert CACHE[key].model is not handler.model
+    assert CACHE[key].n_updates == 0 and handler.n_updates > 0
+
+    # Copies are independent from the snapshots of the original handler
+    snap = handler.snapshot()
+    clone = copy.deepcopy(handler)
+    assert clone._snapshots == [] and snap.model is handler.model
+    CACHE.clear()
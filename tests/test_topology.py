@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from gossipy.core import StaticP2PNetwork
+from gossipy.topology import (barabasi_albert_graph, create_circular_topology,
+                              create_torus_topology, erdos_renyi_graph, random_regular_graph,
+                              ring_graph, star_graph, torus_graph)
+
+
+def _check_simple(adj, n):
+    assert adj.shape == (n, n)
+    assert (adj != adj.T).nnz == 0
+    assert not adj.diagonal().any()
+    assert (adj.data == 1).all()
+
+
+def _as_dict(adj):
+    return {i: sorted(adj.indices[adj.indptr[i] : adj.indptr[i + 1]].tolist())
+            for i in range(adj.shape[0])}
+
+
+@pytest.mark.parametrize("n", [9, 16, 25])
+def test_torus_and_ring(n):
+    adj = torus_graph(n)
+    _check_simple(adj, n)
+    assert _as_dict(adj) == {i: sorted(p) for i, p in create_torus_topology(n).items()}
+
+    adj = ring_graph(n)
+    _check_simple(adj, n)
+    assert _as_dict(adj) == {i: sorted(p) for i, p in create_circular_topology(n).items()}
+    adj = ring_graph(n, 3)
+    _check_simple(adj, n)
+    assert (adj.sum(axis=1) == 6).all()
+    assert _as_dict(adj)[0] == sorted([1, 2, 3, n - 1, n - 2, n - 3])
+
+
+def test_star():
+    adj = star_graph(6, hub=2)
+    _check_simple(adj, 6)
+    assert _as_dict(adj) == {i: [j for j in range(6) if j != 2] if i == 2 else [2]
+                             for i in range(6)}
+
+
+@pytest.mark.parametrize("n, d", [(10, 3), (50, 4), (200, 7)])
+def test_random_regular_graph(n, d):
+    adj = random_regular_graph(n, d, seed=1)
+    _check_simple(adj, n)
+    assert (np.asarray(adj.sum(axis=1)).ravel() == d).all()
+    assert (random_regular_graph(n, d, seed=1) != adj).nnz == 0
+
+
+def test_erdos_renyi_graph():
+    n = 400
+    adj = erdos_renyi_graph(n, .05, seed=3)
+    _check_simple(adj, n)
+    n_pairs = n * (n - 1) / 2
+    assert abs(adj.nnz / 2 - .05 * n_pairs) < 4 * np.sqrt(.05 * .95 * n_pairs)
+    assert (erdos_renyi_graph(n, .05, seed=3) != adj).nnz == 0
+    assert erdos_renyi_graph(20, 0.).nnz == 0
+    assert erdos_renyi_graph(20, 1.).nnz == 20 * 19
+
+
+def test_barabasi_albert_graph():
+    n, m = 500, 3
+    adj = barabasi_albert_graph(n, m, seed=5)
+    _check_simple(adj, n)
+    degrees = np.asarray(adj.sum(axis=1)).ravel()
+    assert adj.nnz / 2 <= n * m
+    assert (degrees > 0).all()
+    # Preferential attachment: the oldest nodes are the hubs
+    assert degrees[:10].mean() > 3 * degrees[-100:].mean()
+    assert (barabasi_albert_graph(n, m, seed=5) != adj).nnz == 0
+
+
+def test_builders_plug_into_the_network():
+    adj = random_regular_graph(30, 4, seed=0)
+    net = StaticP2PNetwork(30, adj)
+    assert (net.degrees() == 4).all()
+    peers = net.sample_peers(np.repeat(np.arange(30), 5), np.random.default_rng(0))
+    assert adj[np.repeat(np.arange(30), 5), peers].all()
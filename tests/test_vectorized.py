@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+from gossipy.core import CreateModelMode
+from gossipy.data import DataDispatcher
+from gossipy.data.handler import ClassificationDataHandler
+from gossipy.model.handler import AdaLineHandler, TorchModelHandler
+from gossipy.model.nn import AdaLine, LogisticRegression
+from gossipy.simul import SimulationReport
+from gossipy.vectorized import VectorizedGossipSimulator
+
+
+def _dispatcher(n_nodes=8, signed=False):
+    g = torch.Generator().manual_seed(0)
+    X = torch.randn(10 * n_nodes, 4, generator=g)
+    y = (X[:, 0] - X[:, 2] > 0).long()
+    if signed:
+        y = 2 * y - 1
+    return DataDispatcher(ClassificationDataHandler(X, y, test_size=.2), n=n_nodes, auto_assign=True)
+
+
+def _adaline():
+    return AdaLineHandler(net=AdaLine(4), learning_rate=.01,
+                          create_model_mode=CreateModelMode.MERGE_UPDATE)
+
+
+def _logreg(batch_size=4):
+    torch.manual_seed(0)
+    return TorchModelHandler(net=LogisticRegression(4, 2),
+                             optimizer=torch.optim.SGD,
+                             optimizer_params={"lr": .1},
+                             criterion=F.cross_entropy,
+                             create_model_mode=CreateModelMode.MERGE_UPDATE,
+                             batch_size=batch_size)
+
+
+def _run(sim, n_rounds=5):
+    report = SimulationReport()
+    sim.add_receiver(report)
+    sim.start(n_rounds=n_rounds)
+    sim.remove_receiver(report)
+    return report
+
+
+@pytest.mark.parametrize("proto", [_adaline, _logreg])
+@pytest.mark.parametrize("topology", [None, "ring"])
+def test_runs_only_depend_on_the_seed(proto, topology):
+    adj = None
+    if topology == "ring":
+        adj = np.roll(np.eye(8), 1, axis=1) + np.roll(np.eye(8), -1, axis=1)
+
+    def run(seed, global_seed):
+        sim = VectorizedGossipSimulator(proto(), _dispatcher(signed=proto is _adaline), delta=5,
+                                        topology=adj, drop_prob=.2, online_prob=.8,
+                                        sampling_eval=.5)
+        sim.init_nodes(seed=seed)
+        np.random.seed(global_seed)
+        torch.manual_seed(global_seed)
+        report = _run(sim)
+        return report._sent_messages, report._failed_messages, report.get_evaluation(False), \
+            sim.offsets, sim.W
+
+    sent, failed, evaluation, offsets, W = run(7, 0)
+    other_sent, other_failed, other_evaluation, other_offsets, other_W = run(7, 1)
+    assert sent == 8 * 5 and 0 < failed < sent
+    assert (sent, failed, evaluation) == (other_sent, other_failed, other_evaluation)
+    assert (offsets == other_offsets).all()
+    assert torch.equal(W, other_W)
+
+    *_, new_offsets, new_W = run(8, 0)
+    assert not torch.equal(W, new_W) or (offsets != new_offsets).any()
+
+
+def test_local_updates_match_the_handler():
+    # The kernels train every node as the model handler would do on the local data
+    for proto, dd in ((_adaline(), _dispatcher(signed=True)), (_logreg(0), _dispatcher())):
+        sim = VectorizedGossipSimulator(proto, dd, delta=5)
+        sim.init_nodes(seed=1)
+        for i in range(dd.size()):
+            handler = proto.copy()
+            handler.init()
+            handler._update(dd[i][0])
+            expected = torch.cat([p.detach().reshape(-1) for p in handler.model.parameters()])
+            assert torch.allclose(sim.W[i], expected.float(), atol=1e-6)
+            assert sim.n_updates[i] == handler.n_updates
+
+
+def test_every_node_sends_once_per_round():
+    sim = VectorizedGossipSimulator(_adaline(), _dispatcher(signed=True), delta=5)
+    sim.init_nodes(seed=3)
+    report = _run(sim, n_rounds=4)
+    assert (report._sent_messages, report._failed_messages) == (8 * 4, 0)
+    assert report._total_size == 8 * 4 * sim.msg_size
+
+    # Dropped messages leave the models untouched
+    sim = VectorizedGossipSimulator(_adaline(), _dispatcher(signed=True), delta=5, drop_prob=1.)
+    sim.init_nodes(seed=3)
+    W = sim.W.clone()
+    report = _run(sim, n_rounds=2)
+    assert report._failed_messages == report._sent_messages == 16
+    assert torch.equal(sim.W, W)
+
+    # Isolated nodes have no one to talk to
+    sim = VectorizedGossipSimulator(_adaline(), _dispatcher(signed=True), delta=5,
+                                    topology=np.zeros((8, 8)))
+    sim.init_nodes(seed=3)
+    assert _run(sim, n_rounds=2)._sent_messages == 0
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from gossipy import set_seed
+from gossipy.core import AntiEntropyProtocol, UniformDynamicP2PNetwork
+from gossipy.simul import DynamicGossipSimulator
+
+
+def _ring(n=12, hops=(1, 2)):
+    adj = np.zeros((n, n))
+    for i in range(n):
+        for k in hops:
+            adj[i, (i + k) % n] = adj[(i + k) % n, i] = 1
+    return adj
+
+
+def _star(n=6):
+    adj = np.zeros((n, n))
+    adj[0, 1:] = adj[1:, 0] = 1
+    return adj
+
+
+@pytest.mark.parametrize("adj", [_ring(), _star(), None])
+def test_dynamic_network_update_views(adj):
+    set_seed(0)
+    n = 12 if adj is None else len(adj)
+    net = UniformDynamicP2PNetwork(n, adj)
+    degrees = net.degrees()
+    version = net.version()
+    for _ in range(20):
+        net.update_views(np.random.permutation(n))
+        assert (net.degrees() == degrees).all()
+        for i in range(n):
+            peers = net.get_peers(i)
+            assert i not in peers
+            assert len(set(peers.tolist())) == len(peers)
+            assert ((peers >= 0) & (peers < n)).all()
+    assert net.version() > version
+    peers = net.sample_peers(np.repeat(np.arange(n), 10))
+    assert net.adjacency().toarray()[np.repeat(np.arange(n), 10), peers].all()
+
+    # The exchange of a single node keeps the same invariants
+    for i in range(n):
+        net.update_view(i)
+    assert (net.degrees() == degrees).all()
+    assert all(i not in net.get_peers(i) for i in range(n))
+
+
+def test_dynamic_simulator_shuffles_due_views_at_once(torch_nodes, monkeypatch):
+    net = UniformDynamicP2PNetwork(10, _ring(10))
+    dd, nodes = torch_nodes(p2p_net=net)
+    calls = []
+    monkeypatch.setattr(net, "update_view", lambda *args: pytest.fail("update_view called"))
+    update_views = net.update_views
+    monkeypatch.setattr(net, "update_views", lambda ids, rng: (calls.append(sorted(ids)),
+                                                               update_views(ids, rng)))
+    sim = DynamicGossipSimulator(nodes=nodes, data_dispatcher=dd, delta=10,
+                                 protocol=AntiEntropyProtocol.PUSH, peer_sampling_period=2)
+    sim.init_nodes(seed=42)
+    sim.start(n_rounds=3)
+    # One batch per sampling timestep with all the nodes that time out in it
+    due = [[i for i in range(10) if nodes[i].timed_out(t)] for t in range(0, 30, 2)]
+    assert calls == [ids for ids in due if ids]
+    assert net.version() > 0